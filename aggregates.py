@@ -0,0 +1,244 @@
+# aggregates.py
+# Agregados precalculados sobre el Ledger para las pestañas de análisis (Mensual, Anual, Previsión).
+import numpy as np
+import pandas as pd
+
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+def day_to_year_month(day):
+    """Convierte días desde 1970 (int32) en arrays de año y mes"""
+    months = (EPOCH + np.asarray(day)).astype('datetime64[M]').astype(np.int64)
+    return months // 12 + 1970, months % 12 + 1
+
+
+def _bump(level, key, amount, count):
+    """Acumula en una celda [suma, recuento]; la borra al quedarse sin movimientos.
+    Devuelve (nace, muere) para llevar la cuenta de meses con datos."""
+    cell = level.get(key)
+    born = cell is None
+    if born:
+        cell = level[key] = [0.0, 0]
+    cell[0] += amount
+    cell[1] += count
+    died = cell[1] <= 0
+    if died:
+        del level[key]
+    return born and not died, died and not born
+
+
+class MonthlyCube:
+    """Cubo año × mes × categoría × tipo con sumas y recuentos.
+    Se mantienen también los niveles agregados (mes, año, total y por categoría) para que cada
+    consulta de las pestañas sea una búsqueda en diccionario, y se actualiza celda a celda cuando
+    entra, cambia o sale un movimiento."""
+
+    def __init__(self):
+        self.cells = {} # (año, mes, category_id, tipo) -> [suma, recuento]
+        self._month = {} # (año, mes, tipo) -> [suma, recuento]
+        self._year = {} # (año, tipo) -> [suma, recuento]
+        self._all = {} # tipo -> [suma, recuento]
+        self._months_with = {} # tipo -> nº de meses distintos con algún movimiento de ese tipo
+        self._cat_month = {} # (año, mes, tipo) -> {category_id: [suma, recuento]}
+        self._cat_year = {} # (año, tipo) -> {category_id: [suma, recuento]}
+        self._cat_all = {} # tipo -> {category_id: [suma, recuento]}
+
+    @classmethod
+    def from_ledger(cls, led):
+        """Construcción completa agrupando con numpy (una pasada por el ledger)"""
+        cube = cls()
+        if led.empty:
+            return cube
+        months = (EPOCH + led.day).astype('datetime64[M]').astype(np.int64)
+        n_cat, n_type = len(led.cat_ids), len(led.types)
+        keys = (months * n_cat + led.cat_code) * n_type + led.type_code
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=led.quantity)
+        counts = np.bincount(inverse)
+        for key, total, count in zip(uniq.tolist(), sums.tolist(), counts.tolist()):
+            rest, t_code = divmod(key, n_type)
+            month, c_code = divmod(rest, n_cat)
+            cube._add(month // 12 + 1970, month % 12 + 1, led.cat_ids[c_code], led.types[t_code], total, count)
+        return cube
+
+    @classmethod
+    def from_frame(cls, df):
+        """Para quien solo tiene el DataFrame de get_transactions (p. ej. pantallas antiguas)"""
+        from ledger import Ledger
+        return cls.from_ledger(Ledger.from_frame(df))
+
+    def copy(self):
+        cube = MonthlyCube()
+        for name in ('cells', '_month', '_year', '_all'):
+            setattr(cube, name, {k: list(v) for k, v in getattr(self, name).items()})
+        for name in ('_cat_month', '_cat_year', '_cat_all'):
+            setattr(cube, name, {k: {c: list(v) for c, v in d.items()} for k, d in getattr(self, name).items()})
+        cube._months_with = dict(self._months_with)
+        return cube
+
+    # --- ACTUALIZACIÓN INCREMENTAL ---
+
+    def _add(self, year, month, cat_id, tipo, amount, count):
+        _bump(self.cells, (year, month, cat_id, tipo), amount, count)
+        born, died = _bump(self._month, (year, month, tipo), amount, count)
+        if born or died:
+            self._months_with[tipo] = self._months_with.get(tipo, 0) + (1 if born else -1)
+        _bump(self._year, (year, tipo), amount, count)
+        _bump(self._all, tipo, amount, count)
+        _bump(self._cat_month.setdefault((year, month, tipo), {}), cat_id, amount, count)
+        _bump(self._cat_year.setdefault((year, tipo), {}), cat_id, amount, count)
+        _bump(self._cat_all.setdefault(tipo, {}), cat_id, amount, count)
+
+    def add_movement(self, date, cat_id, tipo, quantity):
+        self._add(date.year, date.month, cat_id, tipo, float(quantity), 1)
+
+    def remove_movement(self, date, cat_id, tipo, quantity):
+        self._add(date.year, date.month, cat_id, tipo, -float(quantity), -1)
+
+    def apply_rows(self, led, idx, sign):
+        """Suma (sign=1) o resta (sign=-1) las filas idx de un ledger: para deltas pequeños"""
+        if len(idx) == 0:
+            return
+        years, months = day_to_year_month(led.day[idx])
+        for y, m, c, t, q in zip(years.tolist(), months.tolist(), led.cat_code[idx].tolist(),
+                                 led.type_code[idx].tolist(), led.quantity[idx].tolist()):
+            self._add(y, m, led.cat_ids[c], led.types[t], sign * q, sign)
+
+    # --- CONSULTAS O(1) ---
+
+    def total(self, tipo, year=None, month=None):
+        if year is None:
+            return self._all.get(tipo, (0.0, 0))[0]
+        if month is None:
+            return self._year.get((year, tipo), (0.0, 0))[0]
+        return self._month.get((year, month, tipo), (0.0, 0))[0]
+
+    def count(self, tipo, year=None, month=None):
+        if year is None:
+            return self._all.get(tipo, (0.0, 0))[1]
+        if month is None:
+            return self._year.get((year, tipo), (0.0, 0))[1]
+        return self._month.get((year, month, tipo), (0.0, 0))[1]
+
+    def by_category(self, tipo, year=None, month=None):
+        """{category_id: suma} del periodo"""
+        if year is None:
+            cells = self._cat_all.get(tipo, {})
+        elif month is None:
+            cells = self._cat_year.get((year, tipo), {})
+        else:
+            cells = self._cat_month.get((year, month, tipo), {})
+        return {c: v[0] for c, v in cells.items()}
+
+    def category_frame(self, tipo, year=None, month=None):
+        """Misma forma que groupby('category_id')['quantity'].sum().reset_index() para hacer merge con las categorías"""
+        by_cat = {c: q for c, q in self.by_category(tipo, year, month).items() if c is not None}
+        return pd.DataFrame({'category_id': list(by_cat.keys()), 'quantity': list(by_cat.values())})
+
+    def months_with_data(self, tipo):
+        return self._months_with.get(tipo, 0)
+
+    def monthly_totals(self, tipo, year):
+        return [self.total(tipo, year, m) for m in range(1, 13)]
+
+
+# --- SERIE DE SALDO DIARIO ---
+
+BALANCE_CHART_POINTS = 400 # Máximo de puntos del gráfico de patrimonio (los historiales de varios años se reducen)
+
+
+def _signed_quantities(led, idx):
+    """Importes con signo (+ ingreso, - resto de tipos) de las filas idx, como hacía el gráfico original"""
+    income = np.array([t == 'Ingreso' for t in led.types], dtype=bool)
+    return np.where(income[led.type_code[idx]], led.quantity[idx], -led.quantity[idx])
+
+
+class BalanceSeries:
+    """Saldo diario como suma prefija indexada por ordinal de día (días desde 1970).
+    prefix[i] es el flujo neto acumulado hasta el día start + i; el saldo de ese día es
+    initial_balance + prefix[i], así cambiar el saldo inicial del perfil no obliga a recalcular nada.
+    El día start es el anterior al primer movimiento (el punto de partida del gráfico)."""
+
+    def __init__(self):
+        self.start = None
+        self._prefix = np.zeros(0, dtype=np.float64) # Con capacidad de sobra al final para añadir días en O(1)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def from_ledger(cls, led):
+        series = cls()
+        if led.empty:
+            return series
+        idx = np.arange(len(led))
+        series.start = int(led.day.min()) - 1
+        flows = np.bincount(led.day - series.start, weights=_signed_quantities(led, idx))
+        series._prefix = np.cumsum(flows)
+        series._size = len(flows)
+        return series
+
+    @classmethod
+    def from_frame(cls, df):
+        from ledger import Ledger
+        return cls.from_ledger(Ledger.from_frame(df))
+
+    def copy(self):
+        series = BalanceSeries()
+        series.start = self.start
+        series._prefix = self._prefix.copy()
+        series._size = self._size
+        return series
+
+    # --- ACTUALIZACIÓN INCREMENTAL ---
+
+    def _grow(self, size):
+        """Alarga la serie hasta size días repitiendo el último saldo (capacidad doblada: O(1) amortizado)"""
+        if size > len(self._prefix):
+            buf = np.empty(max(size, 2 * len(self._prefix)), dtype=np.float64)
+            buf[:self._size] = self._prefix[:self._size]
+            self._prefix = buf
+        self._prefix[self._size:size] = self._prefix[self._size - 1] if self._size else 0.0
+        self._size = size
+
+    def add(self, day, amount):
+        """Suma un flujo el día dado: O(1) para hoy, O(días desde day) para un cambio con fecha pasada"""
+        day = int(day)
+        if self.start is None:
+            self.start = day - 1
+        elif day <= self.start:
+            # Movimiento anterior a todo el historial: desplazamos el origen (raro, O(n))
+            shift = self.start - day + 1
+            buf = np.zeros(self._size + shift, dtype=np.float64)
+            buf[shift:] = self._prefix[:self._size]
+            self._prefix, self._size, self.start = buf, len(buf), day - 1
+        i = day - self.start
+        if i >= self._size:
+            self._grow(i + 1)
+        self._prefix[i:self._size] += amount
+
+    def apply_rows(self, led, idx, sign):
+        """Suma (sign=1) o resta (sign=-1) las filas idx de un ledger"""
+        if len(idx) == 0:
+            return
+        for day, amount in zip(led.day[idx].tolist(), _signed_quantities(led, idx).tolist()):
+            self.add(day, sign * amount)
+
+    # --- CONSULTAS ---
+
+    def balance(self, initial_balance=0.0):
+        """Saldo al final del último día con movimientos"""
+        return initial_balance + (self._prefix[self._size - 1] if self._size else 0.0)
+
+    def points(self, initial_balance=0.0, max_points=BALANCE_CHART_POINTS):
+        """(fechas, saldos) para el gráfico, reducidos a max_points muestras repartidas uniformemente
+        (siempre incluye el primer y el último día)"""
+        if self._size == 0:
+            return pd.DatetimeIndex([]), np.zeros(0)
+        if max_points and self._size > max_points:
+            idx = np.unique(np.linspace(0, self._size - 1, max_points).round().astype(np.int64))
+        else:
+            idx = np.arange(self._size)
+        dates = pd.to_datetime((EPOCH + self.start + idx).astype('datetime64[ns]'))
+        return dates, initial_balance + self._prefix[idx]
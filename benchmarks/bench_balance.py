@@ -0,0 +1,49 @@
+# benchmarks/bench_balance.py
+# Gráfico de patrimonio: cumsum + groupby sobre el DataFrame (antes) vs serie de saldo con sumas prefijas.
+# Uso: python benchmarks/bench_balance.py
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_flatten import make_rows, best_of
+from database import _flatten_transactions
+from aggregates import BalanceSeries
+from ledger import Ledger
+
+SIZES = [1_000, 10_000, 100_000]
+EDITS = 200
+
+def chart_legacy(df):
+    """Copia del cálculo anterior de render_main_dashboard"""
+    df_chart = df.copy().sort_values('date')
+    df_chart['real_qty'] = df_chart.apply(lambda x: x['quantity'] if x['type'] == 'Ingreso' else -x['quantity'], axis=1)
+    df_chart['saldo_acumulado'] = df_chart['real_qty'].cumsum()
+    return df_chart.groupby('date')['saldo_acumulado'].last().reset_index()
+
+def main():
+    print(f"{'filas':>8} | {'anterior (ms)':>14} | {'construir (ms)':>14} | {'puntos (ms)':>11} | "
+          f"{'alta hoy (µs)':>13} | {'edición -30d (µs)':>17}")
+    for n in SIZES:
+        df = _flatten_transactions(make_rows(n))
+        led = Ledger.from_frame(df)
+        old = best_of(chart_legacy, df)
+        build = best_of(BalanceSeries.from_ledger, led)
+        series = led.balance
+        points = best_of(lambda s: s.points(0), series)
+        last = series.start + len(series) - 1
+
+        t0 = time.perf_counter()
+        for _ in range(EDITS): series.add(last, 10.0)
+        append = (time.perf_counter() - t0) / EDITS
+        t0 = time.perf_counter()
+        for _ in range(EDITS): series.add(last - 30, 10.0)
+        backdated = (time.perf_counter() - t0) / EDITS
+        print(f"{n:>8} | {old * 1000:>14.1f} | {build * 1000:>14.2f} | {points * 1000:>11.2f} | "
+              f"{append * 1e6:>13.1f} | {backdated * 1e6:>17.1f}")
+
+if __name__ == "__main__":
+    main()
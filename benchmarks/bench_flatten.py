@@ -0,0 +1,74 @@
+# benchmarks/bench_flatten.py
+# Micro-benchmark del aplanado de movimientos: bucle fila a fila (versión anterior) vs columnar (actual).
+# Uso: python benchmarks/bench_flatten.py
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import _flatten_transactions
+
+SIZES = [1_000, 10_000, 100_000]
+REPEATS = 3
+
+def make_rows(n, seed=42):
+    """Genera filas con la misma forma que devuelve el select con JOIN de user_imputs"""
+    rnd = random.Random(seed)
+    cats = [{'name': f'Cat {i}', 'emoji': '📁', 'budget': 100} for i in range(15)]
+    groups = [None] * 8 + [{'name': 'Piso', 'emoji': '🏠'}, {'name': 'Viaje', 'emoji': '✈️'}]
+    rows = []
+    for i in range(n):
+        cat_idx = rnd.randrange(len(cats))
+        grp_idx = rnd.randrange(len(groups))
+        rows.append({
+            'id': i + 1, 'user_id': 'u1', 'quantity': round(rnd.uniform(1, 500), 2),
+            'type': rnd.choice(['Gasto', 'Gasto', 'Gasto', 'Ingreso']), 'category_id': cat_idx,
+            'date': f"2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+            'notes': f"Concepto {rnd.randrange(500)}", 'group_id': grp_idx if groups[grp_idx] else None,
+            'user_categories': cats[cat_idx], 'groups': groups[grp_idx],
+        })
+    return rows
+
+def flatten_legacy(data):
+    """Copia literal del aplanado anterior (row.copy() + apply) como referencia"""
+    if not data: return pd.DataFrame()
+    flat_data = []
+    for row in data:
+        cat = row.get('user_categories') or {}
+        grp = row.get('groups') or {}
+        flat_row = row.copy()
+        del flat_row['user_categories']
+        if 'groups' in flat_row: del flat_row['groups']
+        flat_row['cat_name'] = cat.get('name', 'General')
+        flat_row['cat_emoji'] = cat.get('emoji', '📁')
+        flat_row['budget'] = cat.get('budget', 0)
+        flat_row['group_name'] = grp.get('name', None)
+        flat_row['group_emoji'] = grp.get('emoji', '👥')
+        flat_data.append(flat_row)
+    df = pd.DataFrame(flat_data)
+    if not df.empty:
+        df['date'] = pd.to_datetime(df['date'])
+        df['cat_display'] = df.apply(lambda x: f"{x['cat_emoji']} {x['cat_name']}", axis=1)
+    return df
+
+def best_of(fn, data):
+    best = float('inf')
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    print(f"{'filas':>8} | {'anterior (ms)':>14} | {'columnar (ms)':>14} | {'mejora':>7}")
+    for n in SIZES:
+        rows = make_rows(n)
+        old = best_of(flatten_legacy, rows)
+        new = best_of(_flatten_transactions, rows)
+        print(f"{n:>8} | {old * 1000:>14.1f} | {new * 1000:>14.1f} | {old / new:>6.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# benchmarks/bench_import.py
+# Tiempo de importar los módulos de la app en un proceso nuevo, descontando las librerías de terceros
+# (streamlit, supabase, pandas...), que se importan antes de empezar a medir.
+# Uso: python benchmarks/bench_import.py  (no necesita .streamlit/secrets.toml)
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ['database', 'database_groups', 'views', 'main']
+REPEAT = 5
+
+SNIPPET = """
+import time
+import streamlit, supabase, pandas, numpy, plotly.express, httpx
+t = time.perf_counter()
+import {module}
+print((time.perf_counter() - t) * 1000)
+"""
+
+def import_ms(module):
+    out = subprocess.run([sys.executable, '-c', SNIPPET.format(module=module)], cwd=ROOT,
+                         capture_output=True, text=True)
+    if out.returncode != 0:
+        return None
+    return float(out.stdout.strip().splitlines()[-1])
+
+def main():
+    print(f"{'módulo':>16} | {'mejor (ms)':>10} | {'mediana (ms)':>12}")
+    for module in MODULES:
+        runs = [import_ms(module) for _ in range(REPEAT)]
+        if None in runs:
+            print(f"{module:>16} | {'error al importar':>25}")
+            continue
+        runs.sort()
+        print(f"{module:>16} | {runs[0]:>10.1f} | {runs[len(runs) // 2]:>12.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+# benchmarks/bench_ledger_memory.py
+# Memoria por cada 10k movimientos: DataFrame object (antes), DataFrame con categóricas y Ledger compacto.
+# Uso: python benchmarks/bench_ledger_memory.py
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_flatten import make_rows, flatten_legacy
+from database import _flatten_transactions
+from ledger import Ledger
+
+SIZES = [10_000, 100_000]
+
+def per_10k(nbytes, n):
+    return nbytes / n * 10_000 / 1024
+
+def main():
+    print(f"{'filas':>8} | {'object (KiB/10k)':>17} | {'categóricas':>12} | {'ledger':>8} | {'vista ledger':>12}")
+    for n in SIZES:
+        rows = make_rows(n)
+        legacy = flatten_legacy(rows).memory_usage(deep=True).sum()
+        df = _flatten_transactions(rows)
+        current = df.memory_usage(deep=True).sum()
+        led = Ledger.from_frame(df)
+        view = led.to_frame().memory_usage(deep=True).sum()
+        print(f"{n:>8} | {per_10k(legacy, n):>17.0f} | {per_10k(current, n):>12.0f} | "
+              f"{per_10k(led.nbytes(), n):>8.0f} | {per_10k(view, n):>12.0f}")
+
+if __name__ == "__main__":
+    main()
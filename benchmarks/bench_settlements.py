@@ -0,0 +1,70 @@
+# benchmarks/bench_settlements.py
+# Liquidación de grupos: emparejamiento voraz en float (antes) vs motor en céntimos con parejas exactas y
+# búsqueda óptima por subconjuntos. Compara nº de transferencias, descuadre tras pagarlas y tiempo.
+# Uso: python benchmarks/bench_settlements.py
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_flatten import best_of
+from settlements import plan_settlements
+
+MEMBERS = [4, 8, 12, 14, 30, 200]
+GROUPS = 20 # Grupos aleatorios por tamaño
+EXPENSES_PER_MEMBER = 5
+
+def settlements_legacy(balances):
+    """Copia del cálculo anterior de database_groups.calculate_settlements"""
+    deudores = [{'id': u, 'amount': abs(a)} for u, a in balances.items() if a < -0.01]
+    acreedores = [{'id': u, 'amount': a} for u, a in balances.items() if a > 0.01]
+    settlements = []
+    i, j = 0, 0
+    while i < len(deudores) and j < len(acreedores):
+        pago = min(deudores[i]['amount'], acreedores[j]['amount'])
+        settlements.append({'from': deudores[i]['id'], 'to': acreedores[j]['id'], 'amount': round(pago, 2)})
+        deudores[i]['amount'] -= pago
+        acreedores[j]['amount'] -= pago
+        if deudores[i]['amount'] < 0.01: i += 1
+        if acreedores[j]['amount'] < 0.01: j += 1
+    return settlements
+
+def make_balances(n, rnd):
+    """Saldos como los de get_pending_balances: gastos con importes redondos repartidos a partes iguales"""
+    balances = {m: 0.0 for m in range(n)}
+    for _ in range(n * EXPENSES_PER_MEMBER):
+        payer = rnd.randrange(n)
+        parts = rnd.sample(range(n), rnd.randint(2, min(n, 4)))
+        cuota = rnd.choice([10, 12, 20, 30, 45, 60, 100]) / len(parts)
+        for p in parts:
+            if p != payer:
+                balances[payer] += cuota
+                balances[p] -= cuota
+    return balances
+
+def residual_cents(balances, transfers):
+    """Céntimos que quedan sin saldar (en valor absoluto) respecto al saldo de cada uno redondeado al céntimo"""
+    left = {m: round(a * 100) for m, a in balances.items()}
+    for t in transfers:
+        left[t['from']] += round(t['amount'] * 100)
+        left[t['to']] -= round(t['amount'] * 100)
+    return sum(abs(v) for v in left.values())
+
+def main():
+    print(f"{'miembros':>8} | {'transf. antes':>13} | {'transf. ahora':>13} | {'descuadre antes (cts)':>21} | "
+          f"{'descuadre ahora (cts)':>21} | {'antes (ms)':>10} | {'ahora (ms)':>10} | {'óptimo':>6}")
+    rnd = random.Random(7)
+    for n in MEMBERS:
+        groups = [make_balances(n, rnd) for _ in range(GROUPS)]
+        old = [settlements_legacy(b) for b in groups]
+        new = [plan_settlements(b) for b in groups]
+        t_old = sum(best_of(settlements_legacy, b) for b in groups) / GROUPS
+        t_new = sum(best_of(plan_settlements, b) for b in groups) / GROUPS
+        print(f"{n:>8} | {sum(map(len, old)) / GROUPS:>13.1f} | {sum(map(len, new)) / GROUPS:>13.1f} | "
+              f"{sum(residual_cents(b, t) for b, t in zip(groups, old)) / GROUPS:>21.1f} | "
+              f"{sum(residual_cents(b, p.transfers) for b, p in zip(groups, new)) / GROUPS:>21.1f} | "
+              f"{t_old * 1000:>10.3f} | {t_new * 1000:>10.3f} | {sum(p.optimal for p in new):>3}/{GROUPS}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+# benchmarks/bench_suite.py
+# Suite de rendimiento de los caminos calientes sobre el backend local (sin red): genera usuarios sintéticos
+# con 1k/10k/100k movimientos, categorías, un grupo con gastos y repartos, y mide cada etapa.
+# El resultado es un JSON (una entrada por tamaño y etapa) para poder comparar entre commits.
+# Uso: python benchmarks/bench_suite.py [--sizes 1000 10000] [--repeats 3] [--output resultados.json]
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+os.environ.setdefault('DATA_BACKEND', 'local')
+os.environ.setdefault('LOCAL_DB_PATH', ':memory:')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+
+import cache
+import database
+import database_groups
+from aggregates import BALANCE_CHART_POINTS, BalanceSeries, MonthlyCube
+from classifier import Classifier
+from database import get_supabase_client, insert_inputs_in_chunks, _flatten_transactions, iter_transaction_pages
+from importer import parse_file
+from ledger import Ledger
+from local_backend import get_database
+
+SIZES = [1_000, 10_000, 100_000]
+REPEATS = 3
+GROUP_MEMBERS = 8
+EXPENSES_PER_MOVEMENT = 0.1 # Gastos de grupo por cada movimiento personal
+SHARED_EXPENSES = 50 # Gastos compartidos con movimiento personal que editan las etapas split_edit_*
+EDITS_PER_RUN = 100
+CONCEPTS = ['MERCADONA', 'Carrefour Express', 'LIDL', 'Repsol', 'Netflix', 'Spotify', 'Amazon', 'ZARA',
+            'Restaurante', 'Bizum', 'Farmacia', 'Alquiler', 'Nómina', 'Transferencia', 'Cajero']
+
+
+# --- DATOS SINTÉTICOS ---
+
+def seed_user(n, rnd):
+    """Usuario con n movimientos en los últimos 3 años, categorías por defecto y un grupo con repartos.
+    Devuelve (user_id, group_id, categorías)."""
+    client = get_supabase_client()
+    user_id = f"bench-{n}"
+    members = [user_id] + [f"bench-{n}-m{i}" for i in range(1, GROUP_MEMBERS)]
+    client.table('profiles').insert([{'id': m, 'name': m} for m in members]).execute()
+    cats = client.table('user_categories').insert(database.default_categories(user_id)).execute().data
+    gastos = [c['id'] for c in cats if c['type'] == 'Gasto']
+    ingresos = [c['id'] for c in cats if c['type'] == 'Ingreso']
+
+    group_id = client.table('groups').insert({'name': 'Piso', 'emoji': '🏠', 'created_by': user_id}).execute().data[0]['id']
+    client.table('group_members').insert([{'group_id': group_id, 'user_id': m} for m in members]).execute()
+
+    today = date.today()
+    rows = []
+    for _ in range(n):
+        ingreso = rnd.random() < 0.1
+        rows.append({
+            'user_id': user_id,
+            'quantity': round(rnd.uniform(800, 2500) if ingreso else rnd.uniform(1, 200), 2),
+            'type': 'Ingreso' if ingreso else 'Gasto',
+            'category_id': rnd.choice(ingresos if ingreso else gastos),
+            'date': (today - timedelta(days=rnd.randrange(3 * 365))).isoformat(),
+            'notes': f"{rnd.choice(CONCEPTS)} {rnd.randrange(1000)}",
+        })
+    insert_inputs_in_chunks(rows)
+
+    expenses, splits = [], []
+    n_expenses = max(1, int(n * EXPENSES_PER_MOVEMENT))
+    first_id = get_database().next_id['group_expenses']
+    for i in range(n_expenses):
+        payer = rnd.choice(members)
+        amount = round(rnd.uniform(5, 300), 2)
+        parts = rnd.sample(members, rnd.randint(2, len(members)))
+        expenses.append({'group_id': group_id, 'paid_by': payer, 'description': rnd.choice(CONCEPTS), 'total_amount': amount,
+                         'date': datetime.now(timezone.utc).isoformat()})
+        settled = rnd.random() < 0.5
+        splits += [{'expense_id': first_id + i, 'user_id': p, 'amount_owed': round(amount / len(parts), 2),
+                    'is_settled': settled} for p in parts]
+    client.table('group_expenses').insert(expenses).execute()
+    for i in range(0, len(splits), 5000):
+        client.table('group_expense_splits').insert(splits[i:i + 5000]).execute()
+    return user_id, group_id, cats
+
+def make_statement(n, rnd):
+    """Extracto CSV como los de los bancos: separador ';' y coma decimal"""
+    lines = ['Fecha;Concepto;Importe']
+    today = date.today()
+    for _ in range(n):
+        qty = rnd.uniform(1, 200) * (1 if rnd.random() < 0.1 else -1)
+        day = (today - timedelta(days=rnd.randrange(365))).strftime('%d/%m/%Y')
+        lines.append(f"{day};{rnd.choice(CONCEPTS)} {rnd.randrange(1000)};{qty:.2f}".replace('.', ','))
+    up = io.BytesIO('\n'.join(lines).encode('utf-8'))
+    up.name = 'extracto.csv'
+    return up
+
+def seed_shared_expenses(user_id, group_id, cats, rnd):
+    """Gastos compartidos creados como en la app (add_shared_expense), con la mitad de los repartos ya saldados.
+    Devuelve [(movement_id, participantes)]."""
+    client = get_supabase_client()
+    members = [m['user_id'] for m in client.table('group_members').select('user_id').eq('group_id', group_id).execute().data]
+    category_id = next(c['id'] for c in cats if c['type'] == 'Gasto')
+    shared = []
+    for _ in range(SHARED_EXPENSES):
+        parts = rnd.sample(members, rnd.randint(2, len(members)))
+        database_groups.add_shared_expense(group_id, {'user_id': user_id, 'quantity': round(rnd.uniform(5, 300), 2),
+                                                      'type': 'Gasto', 'category_id': category_id,
+                                                      'date': date.today().isoformat(), 'notes': 'Compartido'}, parts)
+        mov_id = client.table('user_imputs').select('id').eq('user_id', user_id).order('id', desc=True).limit(1).execute().data[0]['id']
+        shared.append((mov_id, parts))
+    expense_ids = [e['id'] for e in client.table('group_expenses').select('id').in_('movement_id', [m for m, _ in shared]).execute().data]
+    splits = client.table('group_expense_splits').select('id').in_('expense_id', expense_ids).execute().data
+    client.table('group_expense_splits').update({'is_settled': True}) \
+        .in_('id', [s['id'] for s in splits if rnd.random() < 0.5]).execute()
+    return {'members': members, 'category_id': category_id, 'expenses': shared}
+
+
+# --- ETAPAS ---
+# Cada etapa recibe el contexto del tamaño y devuelve el nº de filas que ha procesado.
+
+def stage_get_transactions(ctx):
+    df = database.get_transactions(ctx['user_id'])
+    ctx['df'] = df
+    return len(df)
+
+def stage_flatten(ctx):
+    return len(_flatten_transactions(ctx['raw']))
+
+def stage_ledger(ctx):
+    ctx['ledger'] = Ledger.from_frame(ctx['df'])
+    return len(ctx['ledger'])
+
+def stage_dashboard_balance(ctx):
+    """Lo que calcula render_main_dashboard: saldo total, ahorro del mes y serie del gráfico de patrimonio"""
+    led = ctx['ledger']
+    cube = MonthlyCube.from_ledger(led)
+    hoy = date.today()
+    cube.total('Ingreso') - cube.total('Gasto')
+    cube.total('Ingreso', hoy.year, hoy.month) - cube.total('Gasto', hoy.year, hoy.month)
+    fechas, _ = BalanceSeries.from_ledger(led).points(0.0, BALANCE_CHART_POINTS)
+    return len(fechas)
+
+def stage_dashboard_tabs(ctx):
+    """Agregados de Previsión, Mensual y Anual de render_dashboard para el año y mes actuales"""
+    cube = MonthlyCube.from_ledger(ctx['ledger'])
+    hoy = date.today()
+    meses = max(1, cube.months_with_data('Gasto'))
+    frames = [cube.category_frame('Gasto'), cube.category_frame('Gasto', hoy.year, hoy.month),
+              cube.category_frame('Gasto', hoy.year, hoy.month), cube.category_frame('Gasto', hoy.year)]
+    pd.DataFrame({t: cube.monthly_totals(t, hoy.year) for t in ['Ingreso', 'Gasto']}, index=range(1, 13))
+    for t in ['Ingreso', 'Gasto']:
+        cube.total(t, hoy.year, hoy.month), cube.total(t, hoy.year)
+    return sum(len(f) for f in frames) + meses
+
+def stage_pending_balances(ctx):
+    balances = database_groups.get_pending_balances(ctx['group_id'])
+    database_groups.calculate_settlements(balances)
+    return len(balances)
+
+def _edit_shared_expenses(ctx):
+    """EDITS_PER_RUN ediciones en el mismo grupo: la mitad solo cambia el importe, el resto entra o sale alguien.
+    Deja en ctx['metrics'] las filas de repartos escritas por edición frente a borrarlas y reinsertarlas todas."""
+    rnd, shared, db = ctx['rnd'], ctx['shared'], get_database()
+    before = sum(v for (t, _), v in db.row_writes.items() if t == 'group_expense_splits')
+    legacy = 0
+    for _ in range(EDITS_PER_RUN):
+        i = rnd.randrange(len(shared['expenses']))
+        mov_id, parts = shared['expenses'][i]
+        new_parts = list(parts)
+        if rnd.random() < 0.5:
+            outside = [m for m in shared['members'] if m not in parts]
+            if outside and (len(parts) <= 2 or rnd.random() < 0.5):
+                new_parts.append(rnd.choice(outside))
+            else:
+                new_parts.remove(rnd.choice(parts))
+        database_groups.update_shared_expense(mov_id, {'user_id': ctx['user_id'], 'quantity': round(rnd.uniform(5, 300), 2),
+                                                       'type': 'Gasto', 'category_id': shared['category_id'],
+                                                       'date': date.today().isoformat(), 'notes': 'Compartido'},
+                                              ctx['group_id'], new_parts)
+        legacy += len(parts) + len(new_parts) # Antes: se borraban todos y se insertaban todos
+        shared['expenses'][i] = (mov_id, new_parts)
+    written = sum(v for (t, _), v in db.row_writes.items() if t == 'group_expense_splits') - before
+    ctx['metrics'] = {'split_rows_per_edit': written / EDITS_PER_RUN, 'legacy_split_rows_per_edit': legacy / EDITS_PER_RUN}
+    return EDITS_PER_RUN
+
+def stage_split_edit_rpc(ctx):
+    return _edit_shared_expenses(ctx)
+
+def stage_split_edit_steps(ctx):
+    """Lo mismo sin la función SQL (como con la migración sin desplegar)"""
+    database_groups._missing_rpcs.add(database_groups.UPDATE_EXPENSE_RPC)
+    try:
+        return _edit_shared_expenses(ctx)
+    finally:
+        database_groups._missing_rpcs.discard(database_groups.UPDATE_EXPENSE_RPC)
+
+def stage_import_parse(ctx):
+    up = ctx['statement']
+    up.seek(0)
+    classifier = Classifier.for_user(ctx['cats'], ctx['ledger'])
+    return len(parse_file(up, classifier, 'Importe', 'Fecha', 'Concepto'))
+
+STAGES = {
+    'get_transactions': stage_get_transactions,
+    'flatten': stage_flatten,
+    'ledger': stage_ledger,
+    'dashboard_balance': stage_dashboard_balance,
+    'dashboard_tabs': stage_dashboard_tabs,
+    'pending_balances': stage_pending_balances,
+    'split_edit_rpc': stage_split_edit_rpc,
+    'split_edit_steps': stage_split_edit_steps,
+    'import_parse': stage_import_parse,
+}
+
+
+# --- EJECUCIÓN ---
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_stage(name, fn, ctx, repeats):
+    db = get_database()
+    times = []
+    queries = rows = written = 0
+    for _ in range(repeats):
+        before, writes_before = db.queries, sum(db.row_writes.values())
+        t0 = time.perf_counter()
+        rows = fn(ctx)
+        times.append(time.perf_counter() - t0)
+        queries = db.queries - before
+        written = sum(db.row_writes.values()) - writes_before
+    times.sort()
+    return {'stage': name, 'rows': rows, 'queries': queries, 'rows_written': written, 'repeats': repeats,
+            'best_ms': times[0] * 1000, 'median_ms': times[len(times) // 2] * 1000, **ctx.pop('metrics', {})}
+
+def run(sizes=SIZES, repeats=REPEATS, stages=None, seed=42):
+    results = []
+    for n in sizes:
+        get_database().reset()
+        cache.clear()
+        rnd = random.Random(seed)
+        t0 = time.perf_counter()
+        user_id, group_id, cats = seed_user(n, rnd)
+        ctx = {'user_id': user_id, 'group_id': group_id, 'cats': cats, 'statement': make_statement(n, rnd),
+               'raw': [row for page in iter_transaction_pages(user_id) for row in page], 'rnd': rnd,
+               'shared': seed_shared_expenses(user_id, group_id, cats, rnd)}
+        seed_s = time.perf_counter() - t0
+        for name, fn in STAGES.items():
+            if stages and name not in stages:
+                # Las etapas de las que dependen otras (df, ledger) se ejecutan igualmente una vez
+                if name in ('get_transactions', 'ledger'):
+                    fn(ctx)
+                continue
+            res = run_stage(name, fn, ctx, repeats)
+            res['size'] = n
+            results.append(res)
+            print(f"{n:>8} | {name:<18} | {res['best_ms']:>10.1f} ms | {res['queries']:>5} consultas | "
+                  f"{res['rows_written']:>5} filas escritas", file=sys.stderr)
+        print(f"{n:>8} | {'(datos sintéticos)':<18} | {seed_s * 1000:>10.1f} ms", file=sys.stderr)
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'backend': database.data_backend(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'repeats': repeats,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=None)
+    parser.add_argument('--output', help="Archivo JSON de salida (por defecto, la salida estándar)")
+    args = parser.parse_args()
+    report = run(args.sizes, args.repeats, args.stages)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
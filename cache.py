@@ -0,0 +1,146 @@
+# cache.py
+# Caché en memoria compartida por todas las sesiones de Streamlit del proceso.
+# Las claves son (tipo, user_id): ('transactions', uid), ('categories', uid), ('profile', uid), ('groups', uid)...
+import copy
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+DEFAULT_TTL = 300 # Segundos que vive una entrada si no se invalida antes
+MAX_ENTRIES = 2000 # Entre todos los usuarios; al pasarnos expulsamos la menos usada (LRU)
+
+
+class TTLCache:
+    """Diccionario LRU con caducidad por entrada y contadores de aciertos/fallos"""
+
+    def __init__(self, max_entries=MAX_ENTRIES, default_ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._data = OrderedDict() # clave -> (expira_en, valor)
+        self._lock = threading.RLock()
+        self._stats = {}
+
+    def _count(self, kind, event):
+        per_kind = self._stats.setdefault(kind, {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0})
+        per_kind[event] += 1
+
+    def get(self, key):
+        """Devuelve el valor o None. Cuenta acierto/fallo por tipo de clave."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self._count(key[0], 'misses')
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self._count(key[0], 'expirations')
+                self._count(key[0], 'misses')
+                return None
+            self._data.move_to_end(key)
+            self._count(key[0], 'hits')
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl or self.default_ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                old_key, _ = self._data.popitem(last=False)
+                self._count(old_key[0], 'evictions')
+
+    def update(self, key, fn):
+        """Aplica fn(valor) bajo el candado si la entrada existe (para marcar cambios sin perder la caché)"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                fn(item[1])
+                return True
+            return False
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._count(key[0], 'invalidations')
+
+    def invalidate_kind(self, kind):
+        """Borra todas las entradas de un tipo (para cambios que afectan a muchos usuarios a la vez)"""
+        with self._lock:
+            for key in [k for k in self._data if k[0] == kind]:
+                del self._data[key]
+                self._count(kind, 'invalidations')
+
+    def keys(self, kind):
+        """Ids de las entradas vigentes de un tipo (sin contar aciertos ni fallos)"""
+        now = time.monotonic()
+        with self._lock:
+            return [k[1] for k, (expires_at, _) in self._data.items() if k[0] == kind and expires_at >= now]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            totals = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+            for per_kind in self._stats.values():
+                for k, v in per_kind.items():
+                    totals[k] += v
+            lookups = totals['hits'] + totals['misses']
+            return {
+                'size': len(self._data),
+                'max_entries': self.max_entries,
+                'hit_rate': (totals['hits'] / lookups) if lookups else 0.0,
+                **totals,
+                'by_kind': copy.deepcopy(self._stats),
+            }
+
+
+# Instancia única del proceso
+_store = TTLCache()
+
+def get(kind, user_id):
+    return _store.get((kind, str(user_id)))
+
+def put(kind, user_id, value, ttl=None):
+    _store.set((kind, str(user_id)), value, ttl)
+
+def update(kind, user_id, fn):
+    return _store.update((kind, str(user_id)), fn)
+
+def invalidate(kind, *user_ids):
+    for uid in user_ids:
+        if uid is not None:
+            _store.invalidate((kind, str(uid)))
+
+def invalidate_kind(kind):
+    _store.invalidate_kind(kind)
+
+def keys(kind):
+    return _store.keys(kind)
+
+def clear():
+    _store.clear()
+
+def stats():
+    """Contadores para monitorización (aciertos, fallos, expulsiones LRU, caducidades, invalidaciones)"""
+    return _store.stats()
+
+def cached(kind, ttl=None):
+    """Decorador para lecturas por usuario: la clave es (kind, primer argumento).
+    No guarda resultados vacíos (las funciones de database devuelven [] o None también cuando fallan)
+    y entrega copias para que una vista no pueda modificar lo que ven otras sesiones."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(user_id, *args, **kwargs):
+            value = get(kind, user_id)
+            if value is None:
+                value = fn(user_id, *args, **kwargs)
+                if not value:
+                    return value
+                put(kind, user_id, value, ttl)
+            return copy.deepcopy(value)
+        wrapper.uncached = fn
+        return wrapper
+    return decorator
@@ -0,0 +1,145 @@
+# classifier.py
+# El "Oráculo" de la importación: adivina la categoría de un movimiento por su concepto.
+# Las palabras clave (reglas por defecto + aprendidas del historial del usuario) se compilan en una sola
+# expresión regular con forma de trie, así cada concepto se recorre una vez sea cual sea el número de reglas.
+# Orden: gana la palabra que aparece antes en el concepto (y en la misma posición, la más larga). El bucle
+# original probaba las reglas en el orden del diccionario y se quedaba con la primera que aparecía en el texto.
+import re
+
+import pandas as pd
+
+# REGLAS POR DEFECTO: palabra -> nombre de categoría (solo se usan si el usuario tiene esa categoría)
+DEFAULT_RULES = {
+    "mercadona": "Alimentación", "carrefour": "Alimentación", "lidl": "Alimentación",
+    "repsol": "Gasolina", "cepsa": "Gasolina", "netflix": "Suscripciones",
+    "spotify": "Suscripciones", "amazon": "Compras", "zara": "Ropa",
+    "restaurante": "Ocio", "bizum": "Varios"
+}
+
+# Aprendizaje a partir del historial (notes -> category_id de user_imputs)
+MIN_TOKEN_LENGTH = 4 # Palabras más cortas dan demasiados falsos positivos como subcadena
+MIN_SUPPORT = 2 # Veces que debe aparecer la palabra en movimientos categorizados
+MIN_PRECISION = 0.8 # Fracción de esas veces que tiene que caer en la misma categoría
+MAX_LEARNED_RULES = 1000
+STOPWORDS = {
+    'compra', 'pago', 'tarjeta', 'transferencia', 'recibo', 'cargo', 'abono', 'movimiento',
+    'para', 'desde', 'hacia', 'entre', 'sobre', 'concepto', 'otros', 'varios', 'general',
+}
+TOKEN_RE = r'[^\W\d_]+' # Solo letras (incluye tildes y ñ): descarta importes, fechas y referencias
+
+
+def _trie_pattern(words):
+    """Regex equivalente a 'w1|w2|...' factorizando prefijos comunes (un autómata en vez de N búsquedas).
+    Ante dos palabras que empiezan en la misma posición gana la más larga."""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = True
+
+    def walk(node):
+        branches = [re.escape(ch) + walk(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return walk(trie)
+
+
+def learn_rules(notes, category_ids, min_support=MIN_SUPPORT, min_precision=MIN_PRECISION, limit=MAX_LEARNED_RULES):
+    """Palabras del concepto que casi siempre acaban en la misma categoría -> {palabra: category_id}"""
+    df = pd.DataFrame({'notes': pd.Series(notes, dtype=object), 'category_id': pd.Series(category_ids, dtype=object)})
+    df = df[df['category_id'].notna() & df['notes'].notna()]
+    if df.empty:
+        return {}
+    # Se tokeniza cada concepto distinto una sola vez, con su recuento
+    pairs = df.value_counts(['notes', 'category_id']).rename('n').reset_index()
+    pairs['token'] = pairs['notes'].astype(str).str.lower().str.findall(TOKEN_RE).map(lambda t: list(set(t)))
+    tokens = pairs.explode('token').dropna(subset=['token'])
+    tokens = tokens[(tokens['token'].str.len() >= MIN_TOKEN_LENGTH) & ~tokens['token'].isin(STOPWORDS)]
+    if tokens.empty:
+        return {}
+
+    per_cat = tokens.groupby(['token', 'category_id'])['n'].sum().reset_index()
+    support = per_cat.groupby('token')['n'].transform('sum')
+    per_cat['precision'] = per_cat['n'] / support
+    per_cat['support'] = support
+    best = per_cat[(per_cat['support'] >= min_support) & (per_cat['precision'] >= min_precision)]
+    best = best.sort_values(['support', 'precision'], ascending=False).head(limit)
+    return dict(zip(best['token'], best['category_id']))
+
+
+class Classifier:
+    """Reglas de un usuario compiladas: nombres de categoría sin mayúsculas y palabras clave -> categoría"""
+
+    def __init__(self, categories, rules=None):
+        # Nombre en minúsculas -> nombre real (ante repetidos gana el primero, como el bucle original)
+        self.by_name = {}
+        for cat in categories:
+            self.by_name.setdefault(cat['name'].strip().lower(), cat['name'])
+        self.rules = {}
+        self.learned = set() # Palabras aprendidas: solo cuentan como palabra completa
+        self._pattern = None
+        self.add_rules(rules if rules is not None else DEFAULT_RULES)
+
+    @classmethod
+    def for_user(cls, categories, ledger=None):
+        """Reglas por defecto + reglas aprendidas del historial (las aprendidas mandan si chocan)"""
+        clf = cls(categories)
+        if ledger is not None and not ledger.empty:
+            notes = ledger.notes[ledger.note_code]
+            cat_ids = ledger.cat_ids[ledger.cat_code]
+            clf.add_learned(learn_rules(notes, cat_ids), categories)
+        return clf
+
+    def add_rules(self, rules, learned=False):
+        """rules: {palabra: nombre de categoría}. Se ignoran categorías que el usuario no tiene.
+        Las reglas por defecto casan como subcadena ('mercadona' en 'MERCADONA123'); las aprendidas, solo como
+        palabra completa (una palabra corta del historial no debe casar dentro de otra: 'bar' en 'barcelona')."""
+        for word, cat_name in rules.items():
+            name = self.by_name.get(str(cat_name).strip().lower())
+            word = str(word).strip().lower()
+            if name and word:
+                self.rules[word] = name
+                if learned:
+                    self.learned.add(word)
+                else:
+                    self.learned.discard(word)
+        self._compile()
+
+    def add_learned(self, learned, categories):
+        """learned: {palabra: category_id} (salida de learn_rules)"""
+        names = {str(c['id']): c['name'] for c in categories}
+        self.add_rules({w: names[str(cid)] for w, cid in learned.items() if str(cid) in names}, learned=True)
+
+    def _compile(self):
+        if not self.rules:
+            self._pattern = None
+            return
+        branches = []
+        if self.learned:
+            branches.append(rf'\b(?:{_trie_pattern(self.learned)})\b')
+        substrings = [w for w in self.rules if w not in self.learned]
+        if substrings:
+            branches.append(_trie_pattern(substrings))
+        self._pattern = re.compile(f"({'|'.join(branches)})", re.IGNORECASE)
+
+    # --- CLASIFICACIÓN DE COLUMNAS ENTERAS ---
+
+    def match_names(self, col):
+        """Columna con nombres de categoría escritos a mano -> nombre real o NaN"""
+        return col.astype(object).where(col.notna(), '').astype(str).str.strip().str.lower().map(self.by_name)
+
+    def classify(self, col):
+        """Columna de conceptos -> nombre de categoría o NaN. Gana la palabra que aparece primero en el concepto."""
+        if self._pattern is None:
+            return pd.Series(float('nan'), index=col.index, dtype=object)
+        text = col.astype(object).where(col.notna(), '').astype(str)
+        found = text.str.extract(self._pattern, expand=False)
+        return found.str.lower().map(self.rules)
+
+    def classify_one(self, text):
+        m = self._pattern.search(text or '') if self._pattern else None
+        return self.rules.get(m.group(1).lower()) if m else None
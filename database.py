@@ -1,29 +1,70 @@
+import os
 import streamlit as st
 from supabase import create_client, Client
+from supabase.lib.client_options import SyncClientOptions
 import pandas as pd
 from datetime import datetime
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import httpx
+from postgrest import ReturnMethod
+import cache
+import metrics
+from http_pool import shared_http_client
 
 # --- MODIFICACIÓN PARA MULTIUSUARIO (SESIONES INDEPENDIENTES) ---
+def data_backend():
+    """'supabase' (por defecto) o 'local' (local_backend: SQLite sin red, para benchmarks y pruebas).
+    Se elige con la variable de entorno DATA_BACKEND o con kind = "local" en la sección [backend] de secrets.toml."""
+    kind = os.environ.get('DATA_BACKEND')
+    if kind is None:
+        try:
+            kind = st.secrets.get('backend', {}).get('kind')
+        except Exception: # Sin secrets.toml
+            kind = None
+    return (kind or 'supabase').strip().lower()
+
+# Cliente fijado para el hilo actual (hilos auxiliares de una sesión: no leen st.session_state)
+_bound = threading.local()
+
+def bind_session_client(client):
+    """Fija el cliente que devolverá get_supabase_client en este hilo (None lo suelta)"""
+    _bound.client = client
+
 def get_supabase_client() -> Client:
     """
     Crea o recupera el cliente de Supabase específico para la sesión actual.
     Esto evita colisiones entre diferentes dispositivos/usuarios.
+    Las conexiones HTTP salen de un pool compartido por todo el proceso (http_pool).
     """
+    bound = getattr(_bound, 'client', None)
+    if bound is not None:
+        return bound
     if 'supabase_client' not in st.session_state:
-        url = st.secrets["supabase"]["url"]
-        key = st.secrets["supabase"]["key"]
-        st.session_state.supabase_client = create_client(url, key)
+        if data_backend() == 'local':
+            from local_backend import LocalClient
+            st.session_state.supabase_client = LocalClient()
+        else:
+            url = st.secrets["supabase"]["url"]
+            key = st.secrets["supabase"]["key"]
+            options = SyncClientOptions(httpx_client=shared_http_client())
+            st.session_state.supabase_client = create_client(url, key, options=options)
     return st.session_state.supabase_client
 
-# Definimos una propiedad dinámica para que el resto de tus funciones
-# sigan usando la variable 'supabase' sin tener que cambiar todo el código.
-@property
-def supabase():
-    return get_supabase_client()
+class _SessionClientProxy:
+    """Se comporta como el cliente de la sesión actual, pero no lo crea hasta el primer uso.
+    Así importar database no lee st.secrets ni abre nada, y cada sesión usa su propio cliente
+    (antes 'supabase' quedaba fijado al cliente de la sesión que importó el módulo primero)."""
+
+    def __getattr__(self, name):
+        return getattr(get_supabase_client(), name)
 
-# Reemplazamos la inicialización estática por la llamada a la función
-supabase = get_supabase_client()
+    def __repr__(self):
+        return "<cliente Supabase de la sesión actual>"
+
+# Para los usos de 'supabase.auth...' de main.py
+supabase = _SessionClientProxy()
 
 def init_db():
     pass
@@ -91,6 +132,7 @@ def change_password(new_password):
 
 # --- PERFIL Y AVATAR ---
 
+@cache.cached('profile')
 def get_user_profile(user_id):
     """Obtiene el perfil del usuario mostrando errores reales si los hay"""
     client = get_supabase_client()
@@ -153,6 +195,7 @@ def upsert_profile(profile_data):
             if hasattr(res_insert, 'error') and res_insert.error:
                 st.error(f"🛑 Error al crear el perfil: {res_insert.error}")
                 return False
+        cache.invalidate('profile', user_id)
 
         # 2. Guardamos el historial en un bloque SEPARADO y PROTEGIDO
         try:
@@ -197,9 +240,9 @@ def get_historical_income(user_id, target_date):
 
 # --- CATEGORÍAS ---
 
-def crear_categorias_default(user_uuid):
-    client = get_supabase_client()
-    default_cats = [
+def default_categories(user_uuid):
+    """Categorías con las que empieza cada usuario nuevo"""
+    return [
         {'user_id': user_uuid, 'name': 'Nómina', 'type': 'Ingreso', 'emoji': '💰', 'budget': 0},
         {'user_id': user_uuid, 'name': 'Ahorro', 'type': 'Ingreso', 'emoji': '🐷', 'budget': 0},
         {'user_id': user_uuid, 'name': 'Vivienda', 'type': 'Gasto', 'emoji': '🏠', 'budget': 600},
@@ -209,11 +252,17 @@ def crear_categorias_default(user_uuid):
         {'user_id': user_uuid, 'name': 'Restaurantes', 'type': 'Gasto', 'emoji': '🍔', 'budget': 100},
         {'user_id': user_uuid, 'name': 'Salud', 'type': 'Gasto', 'emoji': '💊', 'budget': 50}
     ]
+
+def crear_categorias_default(user_uuid):
+    client = get_supabase_client()
+    default_cats = default_categories(user_uuid)
     try:
         client.table('user_categories').insert(default_cats).execute()
+        cache.invalidate('categories', user_uuid)
     except Exception as e:
         print(f"Error default cats: {e}")
 
+@cache.cached('categories')
 def get_categories(user_uuid):
     client = get_supabase_client()
     try:
@@ -238,26 +287,34 @@ def save_category(data):
             "budget_type": data.get('budget_type', 'fixed'),
             "budget_percent": data.get('budget_percent', 0)
         }).execute()
+        cache.invalidate('categories', data['user_id'])
     except Exception as e:
         st.error(f"Error guardando categoría: {e}")
 
 def update_category(cat_id, data):
     client = get_supabase_client()
     try:
-        client.table('user_categories').update({
+        res = client.table('user_categories').update({
             "name": data['name'],
             "emoji": data.get('emoji', '📁'),
             "budget": data.get('budget', 0),
             "budget_type": data.get('budget_type', 'fixed'),
             "budget_percent": data.get('budget_percent', 0)
         }).eq('id', cat_id).execute()
+        # El nombre/emoji de la categoría va embebido en cada movimiento: recarga completa
+        for owner in {r['user_id'] for r in res.data or []}:
+            cache.invalidate('categories', owner)
+            mark_transactions_changed(owner, full=True)
     except Exception as e:
         st.error(f"Error actualizando categoría: {e}")
 
 def delete_category(cat_id):
     client = get_supabase_client()
     try:
-        client.table('user_categories').delete().eq('id', cat_id).execute()
+        res = client.table('user_categories').delete().eq('id', cat_id).execute()
+        for owner in {r['user_id'] for r in res.data or []}:
+            cache.invalidate('categories', owner)
+            mark_transactions_changed(owner, full=True)
     except Exception as e:
         st.error(f"Error: {e}")
 
@@ -276,72 +333,175 @@ def save_input(data):
         "notes": data['notes'],
         "group_id": data.get('group_id', None)
     }).execute()
+    mark_transactions_changed(data['user_id'])
 
 def update_input(data):
     client = get_supabase_client()
     try:
-        client.table('user_imputs').update({
+        res = client.table('user_imputs').update({
             "quantity": data['quantity'],
             "type": data['type'],
             "category_id": data['category_id'],
             "date": str(data['date']),
             "notes": data['notes']
         }).eq('id', data['id']).execute()
+        for owner in {r['user_id'] for r in res.data or []}:
+            mark_transactions_changed(owner, changed_ids=[data['id']])
     except Exception as e:
         st.error(f"Error update input: {e}")
 
 def delete_input(mov_id):
+    # Import circular: database_groups importa database
+    from database_groups import bump_group_version, invalidate_locked_movements, invalidate_net_positions
     client = get_supabase_client()
     try:
         # 1. Primero buscamos si este movimiento estaba en algún grupo y lo borramos de allí
-        client.table('group_expenses').delete().eq('movement_id', mov_id).execute()
+        res_exp = client.table('group_expenses').delete().eq('movement_id', mov_id).execute()
+        group_ids = {r['group_id'] for r in res_exp.data or []}
         
         # 2. Luego borramos el movimiento personal original
-        client.table('user_imputs').delete().eq('id', mov_id).execute()
+        res = client.table('user_imputs').delete().eq('id', mov_id).execute()
+        owners = {r['user_id'] for r in res.data or []}
+        for owner in owners:
+            mark_transactions_changed(owner, deleted_ids=[mov_id])
+
+        # 3. Sus repartos se han ido en cascada: la foto, los candados y las posiciones netas de esos grupos ya no valen
+        for gid in group_ids:
+            invalidate_locked_movements(gid, *owners)
+        bump_group_version(*group_ids)
+        invalidate_net_positions(*group_ids)
     except Exception as e:
         import streamlit as st
         st.error(f"Error delete input: {e}")
 
-def get_transactions(user_uuid):
+# --- CARGA PAGINADA E INCREMENTAL DE MOVIMIENTOS ---
+
+TX_SELECT = '*, user_categories(name, emoji, budget), groups(name, emoji)'
+TX_PAGE_SIZE = 1000 # No debe superar el max-rows de PostgREST (1000 por defecto en Supabase)
+TX_POLL_SECONDS = 10 # Sin cambios apuntados en este proceso, cada cuánto se pregunta por el cursor (otros dispositivos)
+TX_FULL_RESYNC_SECONDS = 600 # Cada cuánto forzamos una recarga completa (red de seguridad: nombres de categoría embebidos...)
+
+def iter_transaction_pages(user_uuid, since=None, columns=TX_SELECT, page_size=TX_PAGE_SIZE):
+    """Recorre los movimientos del usuario por páginas usando el id como cursor (keyset).
+    Así el historial no se trunca en el límite de filas de PostgREST.
+    since: solo los creados o modificados después de esa marca (columna updated_at, la fija un trigger)."""
     client = get_supabase_client()
+    cursor = None
+    while True:
+        query = client.table('user_imputs').select(columns).eq('user_id', user_uuid)
+        if since is not None:
+            query = query.gt('updated_at', since)
+        if cursor is not None:
+            query = query.gt('id', cursor)
+        page = query.order('id').limit(page_size).execute().data or []
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        cursor = page[-1]['id']
+
+def transactions_cursor(df):
+    """Marca updated_at más reciente de un DataFrame de movimientos (None si no hay filas)"""
+    if df.empty or 'updated_at' not in df.columns:
+        return None
+    top = pd.to_datetime(df['updated_at'], utc=True, format='ISO8601').max()
+    return None if pd.isna(top) else top.isoformat()
+
+# Columnas con pocos valores distintos: como categóricas ocupan un código por fila en vez de un objeto
+TX_CATEGORICAL_COLUMNS = ['category_id', 'type', 'group_name']
+
+def _as_categoricals(df):
+    for col in TX_CATEGORICAL_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+def _flatten_transactions(data):
+    """Aplana el JOIN de categorías y grupos construyendo columnas enteras (sin copiar filas ni apply)"""
+    if not data: return pd.DataFrame()
+
+    df = pd.DataFrame.from_records(data)
+    n = len(df)
+    cats = [c or {} for c in df.pop('user_categories')] if 'user_categories' in df.columns else [{}] * n
+    grps = [g or {} for g in df.pop('groups')] if 'groups' in df.columns else [{}] * n
+
+    df['cat_name'] = [c.get('name', 'General') for c in cats]
+    df['cat_emoji'] = [c.get('emoji', '📁') for c in cats]
+    df['budget'] = [c.get('budget', 0) for c in cats]
+
+    # Guardamos los datos del grupo en la fila
+    df['group_name'] = [g.get('name', None) for g in grps]
+    df['group_emoji'] = [g.get('emoji', '👥') for g in grps]
+
+    df['date'] = pd.to_datetime(df['date'])
+    df['cat_display'] = df['cat_emoji'].fillna('📁').astype(str) + ' ' + df['cat_name'].fillna('General').astype(str)
+    return _as_categoricals(df)
+
+def get_transactions(user_uuid):
     try:
-        # Añadimos groups(name, emoji) al JOIN
-        response = client.table('user_imputs') \
-            .select('*, user_categories(name, emoji, budget), groups(name, emoji)') \
-            .eq('user_id', user_uuid) \
-            .execute()
-        
-        data = response.data
-        if not data: return pd.DataFrame()
-            
-        flat_data = []
-        for row in data:
-            cat = row.get('user_categories') or {}
-            grp = row.get('groups') or {} # Extraemos info del grupo
-            
-            flat_row = row.copy()
-            del flat_row['user_categories']
-            if 'groups' in flat_row: del flat_row['groups']
-            
-            flat_row['cat_name'] = cat.get('name', 'General')
-            flat_row['cat_emoji'] = cat.get('emoji', '📁')
-            flat_row['budget'] = cat.get('budget', 0)
-            
-            # Guardamos los datos del grupo en la fila
-            flat_row['group_name'] = grp.get('name', None)
-            flat_row['group_emoji'] = grp.get('emoji', '👥')
-            
-            flat_data.append(flat_row)
-            
-        df = pd.DataFrame(flat_data)
-        if not df.empty:
-            df['date'] = pd.to_datetime(df['date'])
-            df['cat_display'] = df.apply(lambda x: f"{x['cat_emoji']} {x['cat_name']}", axis=1)
-        return df
+        rows = [row for page in iter_transaction_pages(user_uuid) for row in page]
+        return _flatten_transactions(rows)
     except Exception as e:
         print(f"Error cargando transacciones: {e}")
         return pd.DataFrame()
 
+def get_transactions_delta(user_uuid, since):
+    """Trae los movimientos creados o modificados después del cursor, vengan de esta sesión o de otro dispositivo.
+    A diferencia de get_transactions, deja subir la excepción para que quien llama conserve su caché."""
+    rows = [row for page in iter_transaction_pages(user_uuid, since=since) for row in page]
+    return _flatten_transactions(rows)
+
+def count_transactions(user_uuid):
+    """Número de movimientos del usuario (una petición con count, sin traer filas): delata borrados hechos fuera"""
+    client = get_supabase_client()
+    res = client.table('user_imputs').select('id', count='exact').eq('user_id', user_uuid).limit(1).execute()
+    return res.count
+
+def get_transaction_ids(user_uuid):
+    """Ids de todos los movimientos del usuario (solo la columna id, paginada)"""
+    return {row['id'] for page in iter_transaction_pages(user_uuid, columns='id') for row in page}
+
+def merge_transactions(df_cached, df_delta, drop_ids=()):
+    """Fusiona un delta sobre el DataFrame cacheado: quita los ids borrados/modificados y añade las filas frescas"""
+    drop = {str(i) for i in drop_ids}
+    if not df_delta.empty:
+        drop |= set(df_delta['id'].astype(str))
+    base = df_cached
+    if drop and not df_cached.empty:
+        base = df_cached[~df_cached['id'].astype(str).isin(drop)]
+    if df_delta.empty:
+        return base.reset_index(drop=True)
+    if base.empty:
+        return df_delta.reset_index(drop=True)
+    # Alineamos columnas: un delta puede no traer (o traer de más) columnas opcionales.
+    # Al concatenar categóricas con categorías distintas pandas las degrada a object: las restauramos.
+    merged = pd.concat([base, df_delta], ignore_index=True, sort=False)
+    return _as_categoricals(merged)
+
+def _empty_changes():
+    return {'dirty': False, 'changed': set(), 'deleted': set(), 'full': False}
+
+def mark_transactions_changed(user_id, changed_ids=(), deleted_ids=(), full=False):
+    """Apunta en la caché del usuario qué movimientos se han tocado para que la próxima carga
+    pida solo ese delta. Sin ids solo marca la caché como sucia (altas nuevas: las trae el cursor)."""
+    def _mark(state):
+        pending = state['pending']
+        pending['dirty'] = True
+        pending['changed'].update(str(i) for i in changed_ids if i is not None)
+        pending['deleted'].update(str(i) for i in deleted_ids if i is not None)
+        pending['full'] = pending['full'] or full
+    cache.update('transactions', user_id, _mark)
+
+def take_transactions_changes(user_id):
+    """Devuelve y limpia los cambios pendientes apuntados por mark_transactions_changed"""
+    taken = _empty_changes()
+    def _take(state):
+        taken.update(state['pending'])
+        state['pending'] = _empty_changes()
+    cache.update('transactions', user_id, _take)
+    return taken
+
 def recalculate_category_budgets(user_id, new_total_income):
     client = get_supabase_client()
     try:
@@ -356,28 +516,81 @@ def recalculate_category_budgets(user_id, new_total_income):
                     new_euro_budget = (new_total_income * percent) / 100
                     client.table('user_categories').update({"budget": new_euro_budget}).eq('id', cat['id']).execute()
                     count += 1
+        if count:
+            cache.invalidate('categories', user_id)
         
         return count
     except Exception as e:
         print(f"Error recalculando presupuestos: {e}") 
         return 0
 
+# --- IMPORTACIÓN MASIVA ---
+BULK_CHUNK_SIZE = 500 # Filas por INSERT
+BULK_MAX_WORKERS = 4 # Bloques enviados a la vez (no saturar PostgREST)
+BULK_RETRIES = 2 # Reintentos por bloque antes de darlo por fallido
+BULK_RETRY_DELAY = 0.5 # Segundos de espera antes del primer reintento (se dobla en cada uno)
+# Fallos al conectar: la petición no llegó a enviarse, así que repetirla no puede duplicar filas
+BULK_RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+def _insert_chunk(client, index, chunk, retries):
+    """Inserta un bloque con reintentos. Devuelve el resultado del bloque en vez de lanzar.
+    Solo se reintenta si el bloque no llegó a enviarse: con returning=minimal no hay forma de saber si un
+    INSERT que se quedó sin respuesta se guardó, y repetirlo podría duplicar los movimientos."""
+    started = time.perf_counter()
+    error = None
+    for attempt in range(1, retries + 2):
+        try:
+            # minimal: no necesitamos que Supabase nos devuelva las filas insertadas
+            res = client.table('user_imputs').insert(chunk, returning=ReturnMethod.minimal).execute()
+            if hasattr(res, 'error') and res.error:
+                raise Exception(res.error)
+            return {'chunk': index, 'rows': len(chunk), 'ok': True, 'attempts': attempt,
+                    'error': None, 'seconds': time.perf_counter() - started}
+        except BULK_RETRYABLE_ERRORS as e:
+            error = str(e)
+            if attempt <= retries:
+                time.sleep(BULK_RETRY_DELAY * 2 ** (attempt - 1))
+        except Exception as e:
+            # Rechazado por el servidor o cortado tras enviarlo: no se repite
+            return {'chunk': index, 'rows': len(chunk), 'ok': False, 'attempts': attempt,
+                    'error': str(e), 'seconds': time.perf_counter() - started}
+    return {'chunk': index, 'rows': len(chunk), 'ok': False, 'attempts': retries + 1,
+            'error': error, 'seconds': time.perf_counter() - started}
+
+def insert_inputs_in_chunks(data_list, on_chunk=None, chunk_size=BULK_CHUNK_SIZE,
+                            max_workers=BULK_MAX_WORKERS, retries=BULK_RETRIES):
+    """Sube movimientos en bloques desde un pool de hilos acotado, con reintentos por bloque (solo si no llegó a enviarse).
+    on_chunk(resultado, hechos, total) se llama desde el hilo que llama (se puede pintar en Streamlit).
+    Devuelve la lista de resultados por bloque ordenada por número de bloque."""
+    client = get_supabase_client() # En el hilo principal: los hilos del pool no ven st.session_state
+    chunks = [data_list[i:i + chunk_size] for i in range(0, len(data_list), chunk_size)]
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as pool:
+        futures = [pool.submit(_insert_chunk, client, n, chunk, retries) for n, chunk in enumerate(chunks)]
+        for future in as_completed(futures):
+            results.append(future.result())
+            if on_chunk:
+                on_chunk(results[-1], len(results), len(chunks))
+
+    owners = {row['user_id'] for row in data_list}
+    if any(r['ok'] for r in results):
+        for owner in owners:
+            mark_transactions_changed(owner)
+    return sorted(results, key=lambda r: r['chunk'])
+
 def save_bulk_inputs(data_list):
     """Guarda múltiples registros de una sola vez (Bulk Insert)"""
-    client = get_supabase_client()
-    
-    chunk_size = 500 # Subimos de 500 en 500 para ser seguros
-    total_inserted = 0
-    
-    for i in range(0, len(data_list), chunk_size):
-        chunk = data_list[i:i + chunk_size]
-        
-        # El método insert() de Supabase acepta una lista de diccionarios enteros
-        res = client.table('user_imputs').insert(chunk).execute()
-        
-        if hasattr(res, 'error') and res.error:
-            raise Exception(f"Error en bloque: {res.error}")
-            
-        total_inserted += len(chunk)
-        
-    return total_inserted
+    results = insert_inputs_in_chunks(data_list)
+    failed = [r for r in results if not r['ok']]
+    if failed:
+        raise Exception(f"Error en {len(failed)} bloque(s): {failed[0]['error']}")
+    return sum(r['rows'] for r in results)
+
+
+# --- INSTRUMENTACIÓN ---
+# Cada función de datos apunta latencia, filas, peticiones y bytes (metrics). Las auxiliares que no van a la base
+# de datos no se miden. Va al final para que 'from database import ...' reciba ya las versiones medidas.
+metrics.instrument_module(globals(), 'db', skip={'data_backend', 'get_supabase_client', 'bind_session_client',
+                                                  'default_categories',
+                                                  'merge_transactions', 'mark_transactions_changed',
+                                                  'take_transactions_changes', 'transactions_cursor'})
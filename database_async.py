@@ -0,0 +1,93 @@
+# database_async.py
+# Versión asíncrona de las funciones de datos de database.py, con los mismos nombres.
+# No usa el cliente async de Supabase: cada función async ejecuta la síncrona en un pool de hilos del proceso,
+# así solo hay una implementación de la lógica, la caché y las métricas (las funciones síncronas no cambian).
+# - Límite: ASYNC_MAX_CONCURRENCY hilos para todo el proceso, compartidos por todas las sesiones. Por encima,
+#   las llamadas esperan turno en la cola del pool (también las de otras sesiones).
+# - Las conexiones salen del pool HTTP compartido (http_pool) que ya usan los clientes de sesión.
+# - Cada llamada corre con el cliente de la sesión que la lanzó, leído en su hilo (las políticas RLS ven al
+#   mismo usuario), y con su contexto de Streamlit para que los st.error se pinten en su página.
+# - Nada depende del event loop: se puede llamar desde cualquier loop, también con asyncio.run() repetidos.
+# - Desde código síncrono (Streamlit) se usa run()/run_all(), que ejecutan en un event loop de fondo del proceso.
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+import database
+
+# Funciones de datos ejecutándose a la vez en todo el proceso (variable de entorno ASYNC_MAX_CONCURRENCY)
+ASYNC_MAX_CONCURRENCY = int(os.environ.get('ASYNC_MAX_CONCURRENCY', 8))
+
+# Login, registro y avatar siguen solo en síncrono (flujos de auth/storage del hilo del script)
+SYNC_ONLY = {'init_db', 'login_user', 'register_user', 'recover_password', 'change_password', 'upload_avatar'}
+
+_script_ctx = contextvars.ContextVar('streamlit_script_ctx', default=None)
+_session_client = contextvars.ContextVar('supabase_session_client', default=None)
+_executor = ThreadPoolExecutor(max_workers=ASYNC_MAX_CONCURRENCY, thread_name_prefix="supabase-async")
+
+# --- PUENTE ENTRE EL EVENT LOOP Y LAS FUNCIONES SÍNCRONAS ---
+
+def _call_in_context(ctx, client, fn, args, kwargs):
+    # Siempre se fijan (también a None): el hilo del pool no debe heredar la sesión de la llamada anterior
+    add_script_run_ctx(threading.current_thread(), ctx)
+    database.bind_session_client(client)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        database.bind_session_client(None)
+
+def as_async(fn):
+    """Corrutina que ejecuta fn en el pool con el cliente y el contexto de la sesión que la llama"""
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        ctx = _script_ctx.get() or get_script_run_ctx(suppress_warning=True)
+        # Sin run() delante solo hay sesión si estamos en su hilo del script: ahí sí se puede leer st.session_state
+        client = _session_client.get() or (database.get_supabase_client() if ctx is not None else None)
+        return await asyncio.get_running_loop().run_in_executor(_executor, _call_in_context, ctx, client, fn, args, kwargs)
+    wrapper.sync = fn
+    return wrapper
+
+def async_namespace(module, namespace, skip=()):
+    """Define en namespace una versión async (mismo nombre) de cada función de datos de module: las que
+    instrument_module mide por consultar o escribir, no los cálculos ni las versiones en memoria"""
+    for name, obj in vars(module).items():
+        if hasattr(obj, 'instrumented') and obj.__module__ == module.__name__ and name not in skip:
+            namespace[name] = as_async(obj)
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def _background_loop():
+    """Event loop del proceso en un hilo demonio (para run/run_all desde código síncrono)"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="supabase-async-loop", daemon=True).start()
+    return _loop
+
+async def _with_ctx(ctx, client, awaitable):
+    _script_ctx.set(ctx)
+    _session_client.set(client)
+    return await awaitable
+
+def run(coro):
+    """Ejecuta una corrutina de esta capa desde código síncrono y devuelve su resultado.
+    No llamar desde dentro del propio event loop de fondo (se bloquearía esperándose a sí mismo)."""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    client = database.get_supabase_client() if ctx is not None else None # Se lee aquí, en el hilo del script
+    return asyncio.run_coroutine_threadsafe(_with_ctx(ctx, client, coro), _background_loop()).result()
+
+def run_all(*coros):
+    """Varias corrutinas a la vez (solapando la E/S); devuelve sus resultados en el mismo orden"""
+    async def _gather():
+        return await asyncio.gather(*coros)
+    return run(_gather())
+
+
+async_namespace(database, globals(), skip=SYNC_ONLY)
@@ -1,6 +1,13 @@
 # database_groups.py
 import streamlit as st # <-- ¡CRÍTICO PARA LOS CHIVATOS!
-from database import get_supabase_client
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+import cache
+import metrics
+from database import get_supabase_client, mark_transactions_changed
+from settlements import plan_settlements
 
 # ==========================================
 # 1. CORE DE GRUPOS (Crear, Leer, Borrar)
@@ -16,11 +23,13 @@ def create_group(name, emoji, color, user_id):
             group_id = res.data[0]['id']
             member_data = {"group_id": group_id, "user_id": user_id}
             client.table("group_members").insert(member_data).execute()
+            cache.invalidate('groups', user_id)
             return True, "Grupo creado con éxito"
         return False, "Error al crear grupo."
     except Exception as e:
         return False, str(e)
 
+@cache.cached('groups')
 def get_user_groups(user_id):
     """Obtiene todos los grupos a los que pertenece el usuario."""
     client = get_supabase_client()
@@ -65,8 +74,14 @@ def delete_group(group_id):
     """Elimina un grupo (borrando primero a los miembros)."""
     client = get_supabase_client()
     try:
-        client.table("group_members").delete().eq("group_id", group_id).execute()
+        res = client.table("group_members").delete().eq("group_id", group_id).execute()
         client.table("groups").delete().eq("id", group_id).execute()
+        member_ids = [m['user_id'] for m in res.data or [] if m.get('user_id')]
+        cache.invalidate('groups', *member_ids)
+        bump_group_version(group_id)
+        invalidate_net_positions(group_id)
+        for uid in member_ids:
+            mark_transactions_changed(uid, full=True) # Sus movimientos pierden el grupo embebido
         return True
     except Exception as e:
         print(f"Error borrando grupo: {e}")
@@ -77,6 +92,30 @@ def delete_group(group_id):
 # 2. GESTIÓN DE MIEMBROS
 # ==========================================
 
+def _group_member_ids(client, group_id):
+    """user_id de los miembros reales de un grupo (los externos no tienen caché propia)"""
+    res = client.table("group_members").select("user_id").eq("group_id", group_id).execute()
+    return [m['user_id'] for m in res.data or [] if m.get('user_id')]
+
+BULK_FILTER_CHUNK = 1000 # Valores por filtro in_ (van en la URL: no conviene pasarse)
+
+def _bulk_update(client, table, values, column, ids, **filters):
+    """UPDATE de todas las filas con column IN ids (+ filtros eq) en una consulta por cada BULK_FILTER_CHUNK ids"""
+    ids = list(ids)
+    for i in range(0, len(ids), BULK_FILTER_CHUNK):
+        query = client.table(table).update(values).in_(column, ids[i:i + BULK_FILTER_CHUNK])
+        for col, value in filters.items():
+            query = query.eq(col, value)
+        query.execute()
+
+def _bulk_delete(client, table, column, ids, **filters):
+    ids = list(ids)
+    for i in range(0, len(ids), BULK_FILTER_CHUNK):
+        query = client.table(table).delete().in_(column, ids[i:i + BULK_FILTER_CHUNK])
+        for col, value in filters.items():
+            query = query.eq(col, value)
+        query.execute()
+
 def get_group_members(group_id):
     client = get_supabase_client()
     try:
@@ -94,6 +133,8 @@ def remove_group_member(group_id, target_user_id):
     client = get_supabase_client()
     try:
         client.table("group_members").delete().eq("group_id", group_id).eq("user_id", target_user_id).execute()
+        cache.invalidate('groups', target_user_id)
+        bump_group_version(group_id)
         return True
     except Exception as e:
         st.error(f"🛑 Error DB (Eliminando Miembro): {e}")
@@ -104,6 +145,7 @@ def request_leave_group(group_id, user_id):
     client = get_supabase_client()
     try:
         client.table("group_members").update({"leave_status": "pending"}).eq("group_id", group_id).eq("user_id", user_id).execute()
+        bump_group_version(group_id)
         return True
     except Exception as e:
         st.error(f"🛑 Error DB (Pidiendo Salir): {e}")
@@ -111,12 +153,20 @@ def request_leave_group(group_id, user_id):
 
 def resolve_leave_request(group_id, target_user_id, approve=True):
     """El admin aprueba o rechaza la solicitud de salida"""
+    return resolve_leave_requests(group_id, [target_user_id], approve)
+
+def resolve_leave_requests(group_id, target_user_ids, approve=True):
+    """Aprueba o rechaza de golpe varias solicitudes de salida (una consulta para todos)"""
     client = get_supabase_client()
     try:
+        if not target_user_ids:
+            return True
         if approve:
-            client.table("group_members").delete().eq("group_id", group_id).eq("user_id", target_user_id).execute()
+            _bulk_delete(client, "group_members", "user_id", target_user_ids, group_id=group_id)
+            cache.invalidate('groups', *target_user_ids)
         else:
-            client.table("group_members").update({"leave_status": "none"}).eq("group_id", group_id).eq("user_id", target_user_id).execute()
+            _bulk_update(client, "group_members", {"leave_status": "none"}, "user_id", target_user_ids, group_id=group_id)
+        bump_group_version(group_id)
         return True
     except Exception as e:
         st.error(f"🛑 Error DB (Resolviendo Solicitud): {e}")
@@ -169,6 +219,8 @@ def respond_invitation(invitation_id, group_id, user_id, accept=True):
         client.table("group_invitations").update({"status": status}).eq("id", invitation_id).execute()
         if accept:
             client.table("group_members").insert({"group_id": group_id, "user_id": user_id}).execute()
+            cache.invalidate('groups', user_id)
+            bump_group_version(group_id)
         return True
     except:
         return False
@@ -183,6 +235,7 @@ def update_group_setting(group_id, setting_name, value):
     client = get_supabase_client()
     try:
         client.table("groups").update({setting_name: value}).eq("id", group_id).execute()
+        bump_group_version(group_id)
         return True
     except Exception as e:
         st.error(f"🛑 Error DB (Guardando Ajuste): {e}")
@@ -197,15 +250,62 @@ def update_group_details(group_id, name, emoji, color):
             "emoji": emoji,
             "color": color
         }).eq("id", group_id).execute()
+        # Nombre, emoji y color se ven en los grupos de cada miembro y embebidos en sus movimientos
+        member_ids = _group_member_ids(client, group_id)
+        cache.invalidate('groups', *member_ids)
+        bump_group_version(group_id)
+        for uid in member_ids:
+            mark_transactions_changed(uid, full=True)
         return True, "Grupo actualizado correctamente"
     except Exception as e:
         st.error(f"🛑 Error DB (Actualizando Grupo): {e}")
         return False, str(e)
 
+ADD_EXPENSE_RPC = 'add_shared_expense' # supabase/migrations/20261018010000_shared_expense_rpc.sql
+UPDATE_EXPENSE_RPC = 'update_shared_expense'
+_RPC_MISSING_CODES = {'PGRST202', '42883'} # Función no encontrada (aún sin desplegar la migración)
+_missing_rpcs = set() # Funciones que el servidor no tiene: no se reintentan en cada rerun
+
+def _call_rpc(client, name, params):
+    """Resultado de la función SQL, o None si no está desplegada (y entonces se hace desde la app).
+    Cualquier otro error se propaga."""
+    if name in _missing_rpcs:
+        return None
+    try:
+        return client.rpc(name, params).execute().data
+    except Exception as e:
+        if getattr(e, 'code', None) not in _RPC_MISSING_CODES:
+            raise
+        _missing_rpcs.add(name)
+        print(f"Función {name} no desplegada, se hace desde la app: {e}")
+        return None
+
 def add_shared_expense(group_id, movement_data, member_ids):
-    """Inserta el gasto y vincula el reparto, manejando pagadores reales o externos"""
+    """Inserta el gasto y vincula el reparto, manejando pagadores reales o externos.
+    Movimiento, ticket y repartos van en una sola petición atómica (función add_shared_expense)."""
+    member_ids = list(member_ids or [])
+    if not member_ids: # Antes de escribir nada: sin participantes no hay reparto posible
+        return False, "Elige al menos un participante para repartir el gasto."
     client = get_supabase_client()
-    
+    real_paid_by = movement_data.get('paid_by_custom', movement_data['user_id'])
+    try:
+        res = _call_rpc(client, ADD_EXPENSE_RPC, {
+            "p_group_id": group_id, "p_movement": movement_data, "p_member_ids": member_ids})
+        if res is None:
+            return _add_shared_expense_steps(client, group_id, movement_data, member_ids)
+
+        if res.get('movement_id'):
+            mark_transactions_changed(real_paid_by)
+        bump_group_version(group_id)
+        # Los repartos tal como quedaron guardados (no volvemos a calcular la cuota aquí)
+        apply_net_deltas(group_id, _split_deltas((s['user_id'], real_paid_by, float(s['amount_owed']))
+                                                 for s in res.get('splits') or []))
+        return True, "Gasto compartido registrado correctamente"
+    except Exception as e:
+        return False, f"🛑 Error Técnico: {str(e)}"
+
+def _add_shared_expense_steps(client, group_id, movement_data, member_ids):
+    """add_shared_expense en tres inserts (sin la función SQL desplegada; no es atómico)"""
     # 0. Determinamos quién es el pagador real
     real_paid_by = movement_data.get('paid_by_custom', movement_data['user_id'])
     es_externo = str(real_paid_by).startswith("ext_")
@@ -230,6 +330,7 @@ def add_shared_expense(group_id, movement_data, member_ids):
                 
             if res_mov.data:
                 mov_id = res_mov.data[0]['id']
+                mark_transactions_changed(real_paid_by)
 
         # 2. Registrar el ticket en el Grupo (group_expenses)
         expense_data = {
@@ -248,6 +349,7 @@ def add_shared_expense(group_id, movement_data, member_ids):
             return False, "Error desconocido al crear el ticket de grupo."
             
         exp_id = res_exp.data[0]['id']
+        bump_group_version(group_id)
         
         # 3. Crear los repartos (splits)
         cuota = movement_data.get('quantity', 0) / len(member_ids)
@@ -263,6 +365,8 @@ def add_shared_expense(group_id, movement_data, member_ids):
         res_splits = client.table("group_expense_splits").insert(splits).execute()
         if hasattr(res_splits, 'error') and res_splits.error:
             return False, f"Error DB Repartos: {res_splits.error}"
+        apply_net_deltas(group_id, _split_deltas((s['user_id'], real_paid_by, float(s['amount_owed']))
+                                                 for s in res_splits.data or []))
 
         return True, "Gasto compartido registrado correctamente"
         
@@ -292,10 +396,16 @@ def delete_group_expense(expense_id, movement_id):
     try:
         # 1. Borramos el gasto personal de la tabla user_imputs (si existe)
         if movement_id:
-            client.table('user_imputs').delete().eq('id', movement_id).execute()
+            res = client.table('user_imputs').delete().eq('id', movement_id).execute()
+            for owner in {r['user_id'] for r in res.data or []}:
+                mark_transactions_changed(owner, deleted_ids=[movement_id])
             
         # 2. Borramos el registro del ticket del grupo
-        client.table('group_expenses').delete().eq('id', expense_id).execute()
+        res_exp = client.table('group_expenses').delete().eq('id', expense_id).execute()
+        for r in res_exp.data or []:
+            invalidate_locked_movements(r['group_id'], r['paid_by']) # Si tenía repartos saldados, ya no bloquean nada
+        bump_group_version(*{r['group_id'] for r in res_exp.data or []})
+        invalidate_net_positions(*{r['group_id'] for r in res_exp.data or []}) # Sus repartos se van en cascada
         
         return True
     except Exception as e:
@@ -314,198 +424,330 @@ def get_expense_participants(movement_id):
         return []
 
 def update_shared_expense(mov_id, mov_data, new_group_id, participant_ids):
-    """Actualiza un gasto a todos los niveles (personal y grupo) manejando los cambios de forma inteligente"""
+    """Actualiza un gasto a todos los niveles (personal y grupo) manejando los cambios de forma inteligente.
+    Todo va en una sola petición atómica (función update_shared_expense)."""
     client = get_supabase_client()
     try:
-        # 1. Actualizar el movimiento personal SIEMPRE
-        client.table('user_imputs').update({
-            "quantity": mov_data['quantity'],
-            "type": mov_data['type'],
-            "category_id": mov_data['category_id'],
-            "date": mov_data['date'],
-            "notes": mov_data['notes'],
-            "group_id": new_group_id # Guardamos si ahora tiene grupo o no
-        }).eq('id', mov_id).execute()
-
-        # 2. Ver si este movimiento ya era un gasto de grupo antes
-        res_exp = client.table('group_expenses').select('id, group_id').eq('movement_id', mov_id).execute()
-        old_exp = res_exp.data[0] if res_exp.data else None
-
-        # ESCENARIO A: Lo hemos desvinculado del grupo (Ahora es un gasto personal normal)
-        if new_group_id is None:
-            if old_exp:
-                client.table('group_expenses').delete().eq('id', old_exp['id']).execute()
-        
-        # ESCENARIO B: Sigue teniendo grupo (El mismo o uno nuevo)
+        res = _call_rpc(client, UPDATE_EXPENSE_RPC, {
+            "p_movement_id": mov_id, "p_movement": mov_data, "p_new_group_id": new_group_id,
+            "p_participant_ids": list(participant_ids or [])})
+        if res is None:
+            res = _update_shared_expense_steps(client, mov_id, mov_data, new_group_id, participant_ids)
         else:
-            cuota = mov_data['quantity'] / len(participant_ids) if participant_ids else 0
-            splits = [{"user_id": pid, "amount_owed": cuota, "is_settled": False} for pid in participant_ids]
-
-            if old_exp and old_exp['group_id'] == new_group_id:
-                # B1: Es el MISMO grupo. Actualizamos el precio y los participantes
-                exp_id = old_exp['id']
-                client.table('group_expenses').update({
-                    "description": mov_data['notes'], "total_amount": mov_data['quantity']
-                }).eq('id', exp_id).execute()
-                
-                # Borramos los repartos viejos y metemos los nuevos (por si quitaste a alguien)
-                client.table('group_expense_splits').delete().eq('expense_id', exp_id).execute()
-                for s in splits: s['expense_id'] = exp_id
-                if splits: client.table('group_expense_splits').insert(splits).execute()
-                
-            else:
-                # B2: Es un GRUPO DISTINTO o ANTES ERA PERSONAL. Borramos lo viejo y creamos nuevo.
-                if old_exp:
-                    client.table('group_expenses').delete().eq('id', old_exp['id']).execute()
-                
-                new_exp = client.table('group_expenses').insert({
-                    "group_id": new_group_id, "movement_id": mov_id, 
-                    "paid_by": mov_data['user_id'], "description": mov_data['notes'], 
-                    "total_amount": mov_data['quantity']
-                }).execute()
-                
-                if new_exp.data:
-                    n_exp_id = new_exp.data[0]['id']
-                    for s in splits: s['expense_id'] = n_exp_id
-                    if splits: client.table('group_expense_splits').insert(splits).execute()
-                    
+            mark_transactions_changed(mov_data['user_id'], changed_ids=[mov_id])
+        _after_expense_update(res, mov_data, new_group_id, participant_ids)
         return True, "Actualizado correctamente"
     except Exception as e:
         import streamlit as st
         st.error(f"🛑 Error DB: {e}")
         return False, str(e)
 
+SPLIT_AMOUNT_TOLERANCE = 0.005 # Euros: por debajo, el importe de un reparto se da por igual y no se reescribe
+
+def diff_splits(existing, participant_ids, cuota):
+    """Cambios mínimos para pasar de los repartos existing ([{id, user_id, amount_owed, is_settled}]) a
+    participant_ids pagando cuota cada uno: {'insert': [user_id], 'delete': [reparto], 'update': [reparto]}.
+    Quien sigue con el mismo importe conserva is_settled y settlement_requested; los de 'update' (con su importe
+    e is_settled anteriores) vuelven a quedar pendientes, porque lo que se saldó era el importe viejo."""
+    wanted = list(dict.fromkeys(participant_ids or []))
+    kept, delete = {}, []
+    for s in sorted(existing, key=lambda s: s['id']):
+        if s['user_id'] in kept or s['user_id'] not in wanted:
+            delete.append(s) # Ya no participa (o es una fila repetida del mismo miembro)
+        else:
+            kept[s['user_id']] = s
+    update = [s for s in kept.values() if abs(float(s['amount_owed']) - cuota) >= SPLIT_AMOUNT_TOLERANCE]
+    return {'insert': [uid for uid in wanted if uid not in kept], 'delete': delete, 'update': update}
+
+def _after_expense_update(res, mov_data, new_group_id, participant_ids):
+    """Posiciones netas y versiones de grupo tras editar un gasto.
+    res es lo que devuelve la función SQL: {old_expense, split_diff, expense_id}."""
+    old_exp = res['old_expense']
+    cuota = mov_data['quantity'] / len(participant_ids) if participant_ids else 0
+    if new_group_id is not None and old_exp and old_exp['group_id'] == new_group_id:
+        # Mismo grupo: quitamos lo que estaba pendiente y sumamos los importes nuevos (los actualizados quedan pendientes)
+        payer = old_exp['paid_by']
+        diff = res['split_diff']
+        deltas = _split_deltas(((s['user_id'], payer, float(s['amount_owed'])) for s in diff['delete'] + diff['update']
+                                if not s.get('is_settled')), sign=-1)
+        added = [s['user_id'] for s in diff['update']] + diff['insert']
+        for uid, amount in _split_deltas((pid, payer, cuota) for pid in added).items():
+            deltas[uid] = deltas.get(uid, 0.0) + amount
+        apply_net_deltas(new_group_id, deltas)
+    else:
+        if old_exp:
+            invalidate_net_positions(old_exp['group_id'])
+        if new_group_id is not None and res['expense_id'] is not None:
+            apply_net_deltas(new_group_id, _split_deltas((pid, mov_data['user_id'], cuota) for pid in participant_ids))
+    # Los candados del pagador en el grupo viejo y en el nuevo (repartos saldados que se van o se reinician)
+    if old_exp:
+        invalidate_locked_movements(old_exp['group_id'], old_exp['paid_by'])
+    if new_group_id is not None:
+        invalidate_locked_movements(new_group_id, mov_data['user_id'])
+    bump_group_version(old_exp['group_id'] if old_exp else None, new_group_id)
+
+def _update_shared_expense_steps(client, mov_id, mov_data, new_group_id, participant_ids):
+    """update_shared_expense petición a petición (sin la función SQL desplegada; no es atómico).
+    Devuelve lo mismo que la función SQL."""
+    # 1. Actualizar el movimiento personal SIEMPRE
+    client.table('user_imputs').update({
+        "quantity": mov_data['quantity'],
+        "type": mov_data['type'],
+        "category_id": mov_data['category_id'],
+        "date": mov_data['date'],
+        "notes": mov_data['notes'],
+        "group_id": new_group_id # Guardamos si ahora tiene grupo o no
+    }).eq('id', mov_id).execute()
+    mark_transactions_changed(mov_data['user_id'], changed_ids=[mov_id])
+
+    # 2. Ver si este movimiento ya era un gasto de grupo antes
+    res_exp = client.table('group_expenses').select('id, group_id, paid_by').eq('movement_id', mov_id).execute()
+    old_exp = res_exp.data[0] if res_exp.data else None
+    result = {'old_expense': old_exp, 'split_diff': None, 'expense_id': None}
+
+    # ESCENARIO A: Lo hemos desvinculado del grupo (Ahora es un gasto personal normal)
+    if new_group_id is None:
+        if old_exp:
+            client.table('group_expenses').delete().eq('id', old_exp['id']).execute()
+
+    # ESCENARIO B: Sigue teniendo grupo (El mismo o uno nuevo)
+    else:
+        cuota = mov_data['quantity'] / len(participant_ids) if participant_ids else 0
+        splits = [{"user_id": pid, "amount_owed": cuota, "is_settled": False} for pid in participant_ids]
+
+        if old_exp and old_exp['group_id'] == new_group_id:
+            # B1: Es el MISMO grupo. Actualizamos el precio y los participantes
+            exp_id = result['expense_id'] = old_exp['id']
+            client.table('group_expenses').update({
+                "description": mov_data['notes'], "total_amount": mov_data['quantity']
+            }).eq('id', exp_id).execute()
+
+            # Solo tocamos los repartos que cambian (si cambia su importe, un reparto saldado vuelve a pendiente)
+            existing = client.table('group_expense_splits').select('id, user_id, amount_owed, is_settled') \
+                .eq('expense_id', exp_id).execute()
+            diff = result['split_diff'] = diff_splits(existing.data or [], participant_ids, cuota)
+            if diff['delete']:
+                _bulk_delete(client, 'group_expense_splits', 'id', [s['id'] for s in diff['delete']])
+            if diff['update']:
+                _bulk_update(client, 'group_expense_splits', {"amount_owed": cuota, "is_settled": False, "settlement_requested": False},
+                             'id', [s['id'] for s in diff['update']])
+            if diff['insert']:
+                client.table('group_expense_splits').insert([
+                    {"expense_id": exp_id, "user_id": pid, "amount_owed": cuota, "is_settled": False}
+                    for pid in diff['insert']]).execute()
+
+        else:
+            # B2: Es un GRUPO DISTINTO o ANTES ERA PERSONAL. Borramos lo viejo y creamos nuevo.
+            if old_exp:
+                client.table('group_expenses').delete().eq('id', old_exp['id']).execute()
+
+            new_exp = client.table('group_expenses').insert({
+                "group_id": new_group_id, "movement_id": mov_id,
+                "paid_by": mov_data['user_id'], "description": mov_data['notes'],
+                "total_amount": mov_data['quantity']
+            }).execute()
+
+            if new_exp.data:
+                n_exp_id = result['expense_id'] = new_exp.data[0]['id']
+                for s in splits: s['expense_id'] = n_exp_id
+                if splits: client.table('group_expense_splits').insert(splits).execute()
+    return result
+
+PENDING_BALANCES_RPC = 'group_pending_balances' # supabase/migrations/20261018000000_group_pending_balances.sql
+
 def get_pending_balances(group_id):
-    """Calcula los balances ignorando las deudas que ya han sido pagadas (is_settled = True)"""
+    """Calcula los balances ignorando las deudas que ya han sido pagadas (is_settled = True).
+    Los suma la base de datos (una fila por miembro); si la función no está desplegada, se suman aquí."""
     client = get_supabase_client()
+    try:
+        rows = _call_rpc(client, PENDING_BALANCES_RPC, {"p_group_id": group_id})
+        if rows is not None:
+            return {r['user_id']: float(r['balance']) for r in rows}
+    except Exception as e:
+        print(f"Balances por RPC no disponibles, se calculan en la app: {e}")
+    return _pending_balances_from_splits(client, group_id)
+
+def pending_balances_from_rows(rows):
+    """Suma en Python de los repartos pendientes (con su group_expenses embebido) por miembro"""
+    balances = {}
+    for row in rows:
+        debtor = row['user_id']
+        creditor = row['group_expenses']['paid_by']
+        amount = float(row['amount_owed'])
+
+        if debtor == creditor: continue # Ignoramos lo que nos debemos a nosotros mismos
+
+        balances[creditor] = balances.get(creditor, 0.0) + amount
+        balances[debtor] = balances.get(debtor, 0.0) - amount
+    return balances
+
+def _pending_balances_from_splits(client, group_id):
     try:
         res = client.table("group_expense_splits") \
             .select("amount_owed, is_settled, user_id, group_expenses!inner(group_id, paid_by)") \
             .eq("group_expenses.group_id", group_id) \
             .eq("is_settled", False) \
             .execute()
-        
-        balances = {}
-        for row in res.data:
-            debtor = row['user_id']
-            creditor = row['group_expenses']['paid_by']
-            amount = float(row['amount_owed'])
-            
-            if debtor == creditor: continue # Ignoramos lo que nos debemos a nosotros mismos
-            
-            balances[creditor] = balances.get(creditor, 0.0) + amount
-            balances[debtor] = balances.get(debtor, 0.0) - amount
-            
-        return balances
+        return pending_balances_from_rows(res.data)
     except Exception as e:
         print(f"Error calculando balances pendientes: {e}")
         return {}
 
 def calculate_settlements(balances):
-    """Genera las transacciones para dejar a cero a los miembros"""
-    deudores = [{'id': u, 'amount': abs(a)} for u, a in balances.items() if a < -0.01]
-    acreedores = [{'id': u, 'amount': a} for u, a in balances.items() if a > 0.01]
-    settlements = []
-    
-    i, j = 0, 0
-    while i < len(deudores) and j < len(acreedores):
-        pago = min(deudores[i]['amount'], acreedores[j]['amount'])
-        settlements.append({'from': deudores[i]['id'], 'to': acreedores[j]['id'], 'amount': round(pago, 2)})
-        deudores[i]['amount'] -= pago
-        acreedores[j]['amount'] -= pago
-        if deudores[i]['amount'] < 0.01: i += 1
-        if acreedores[j]['amount'] < 0.01: j += 1
-    return settlements
+    """Genera las transacciones para dejar a cero a los miembros (mínimas y en céntimos: ver settlements)"""
+    return plan_settlements(balances).transfers
+
+def _reduce_movements(quantities, mov_ids, amount_to_reduce):
+    """Reparte la reducción por orden entre los movimientos: {mov_id: nueva cantidad} solo de los que cambian.
+    Un mismo movimiento puede venir repetido (varios repartos del mismo gasto): se reduce una sola vez."""
+    quantities = dict(quantities)
+    new_qty = {}
+    for mov_id in dict.fromkeys(mov_ids):
+        if amount_to_reduce <= 0.01: break
+        if mov_id not in quantities: continue
+        curr_qty = quantities[mov_id]
+        if curr_qty > amount_to_reduce:
+            new_qty[mov_id] = curr_qty - amount_to_reduce
+            amount_to_reduce = 0
+        else:
+            new_qty[mov_id] = 0
+            amount_to_reduce -= curr_qty
+        quantities[mov_id] = new_qty[mov_id]
+    return new_qty
+
+SETTLE_DEBT_RPC = 'settle_debt_between_users' # supabase/migrations/20261018030000_settle_debt_rpc.sql
 
 def settle_debt_between_users(group_id, creditor_id, debtor_id):
-    """Liquida las deudas cruzadas entre dos usuarios y ajusta el gasto personal por el importe NETO"""
+    """Liquida las deudas cruzadas entre dos usuarios y ajusta el gasto personal por el importe NETO.
+    Todo va en una sola petición atómica (función settle_debt_between_users). Cada liquidación queda en el
+    panel de rendimiento (tipo 'settlement') con los repartos saldados como filas y todas sus peticiones."""
     client = get_supabase_client()
     try:
-        # 1. Calcular deuda de B hacia A (Lo grande)
-        res_B_to_A = client.table("group_expense_splits") \
-            .select("expense_id, amount_owed, group_expenses!inner(group_id, paid_by, movement_id)") \
-            .eq("user_id", debtor_id) \
-            .eq("group_expenses.group_id", group_id) \
-            .eq("group_expenses.paid_by", creditor_id) \
-            .eq("is_settled", False).execute()
-        
-        gross_B_to_A = sum(float(r['amount_owed']) for r in res_B_to_A.data)
-
-        # 2. Calcular deuda de A hacia B (La deuda cruzada a compensar)
-        res_A_to_B = client.table("group_expense_splits") \
-            .select("expense_id, amount_owed, group_expenses!inner(group_id, paid_by, movement_id)") \
-            .eq("user_id", creditor_id) \
-            .eq("group_expenses.group_id", group_id) \
-            .eq("group_expenses.paid_by", debtor_id) \
-            .eq("is_settled", False).execute()
-        
-        gross_A_to_B = sum(float(r['amount_owed']) for r in res_A_to_B.data)
-
-        # 3. El dinero real (NETO) que se está transfiriendo
-        net_amount = gross_B_to_A - gross_A_to_B
-
-        # 4. Candado Cruzado 🔒: Marcar TODAS las deudas en ambas direcciones como saldadas
-        for r in res_B_to_A.data:
-            client.table("group_expense_splits").update({"is_settled": True, "settlement_requested": False}) \
-                .eq("expense_id", r['expense_id']).eq("user_id", debtor_id).execute()
-            
-        for r in res_A_to_B.data:
-            client.table("group_expense_splits").update({"is_settled": True, "settlement_requested": False}) \
-                .eq("expense_id", r['expense_id']).eq("user_id", creditor_id).execute()
-
-        # 5. Reducir el gasto personal de quien cobra por el valor NETO recibido
-        if net_amount > 0:
-            mov_ids = [r['group_expenses']['movement_id'] for r in res_B_to_A.data if r['group_expenses'].get('movement_id')]
-            amount_to_reduce = net_amount
-            
-            for mov_id in mov_ids:
-                if amount_to_reduce <= 0.01: break
-                
-                mov_res = client.table("user_imputs").select("quantity").eq("id", mov_id).execute()
-                if mov_res.data:
-                    curr_qty = float(mov_res.data[0]['quantity'])
-                    if curr_qty > amount_to_reduce:
-                        new_qty = curr_qty - amount_to_reduce
-                        client.table("user_imputs").update({"quantity": new_qty}).eq("id", mov_id).execute()
-                        amount_to_reduce = 0
-                    else:
-                        client.table("user_imputs").update({"quantity": 0}).eq("id", mov_id).execute()
-                        amount_to_reduce -= curr_qty
+        with metrics.timer('settlement', 'settle_debt_between_users') as timing:
+            res = _call_rpc(client, SETTLE_DEBT_RPC, {
+                "p_group_id": group_id, "p_creditor_id": creditor_id, "p_debtor_id": debtor_id})
+            if res is None:
+                res = _settle_debt_steps(client, group_id, creditor_id, debtor_id)
 
+            settled = res['settled_splits']
+            if settled:
+                apply_net_deltas(group_id, _split_deltas(((s['user_id'], s['paid_by'], float(s['amount_owed']))
+                                                          for s in settled), sign=-1))
+            if res['changed_movements']:
+                mark_transactions_changed(creditor_id, changed_ids=res['changed_movements'])
+            invalidate_locked_movements(group_id, creditor_id, debtor_id)
+            bump_group_version(group_id)
+            timing.rows = len(settled)
         return True, "Deudas cruzadas liquidadas y contabilidad ajustada."
     except Exception as e:
+        # Sin la función SQL pudo quedar a medias: lo cacheado del grupo ya no es fiable
+        invalidate_net_positions(group_id)
+        bump_group_version(group_id)
         return False, str(e)
-        
-def get_locked_movements():
-    """Devuelve un listado rápido de IDs de movimientos que tienen candado"""
+
+def _settle_debt_steps(client, group_id, creditor_id, debtor_id):
+    """settle_debt_between_users petición a petición (sin la función SQL desplegada; no es atómico).
+    Número fijo de consultas sea cual sea el número de gastos: 1 lectura de repartos, 1 UPDATE de repartos
+    (uno por cada BULK_FILTER_CHUNK repartos), 1 lectura de movimientos y como mucho 2 UPDATE de movimientos
+    (los que quedan a 0 y el parcial). Devuelve lo mismo que la función SQL."""
+    # 1. Todas las deudas pendientes entre los dos, en ambas direcciones, en una sola lectura
+    res = client.table("group_expense_splits") \
+        .select("id, user_id, amount_owed, group_expenses!inner(group_id, paid_by, movement_id)") \
+        .in_("user_id", [debtor_id, creditor_id]) \
+        .eq("group_expenses.group_id", group_id) \
+        .in_("group_expenses.paid_by", [creditor_id, debtor_id]) \
+        .eq("is_settled", False).order("id").execute()
+
+    B_to_A = [r for r in res.data if r['user_id'] == debtor_id and r['group_expenses']['paid_by'] == creditor_id]
+    A_to_B = [r for r in res.data if r['user_id'] == creditor_id and r['group_expenses']['paid_by'] == debtor_id]
+    gross_B_to_A = sum(float(r['amount_owed']) for r in B_to_A)
+    gross_A_to_B = sum(float(r['amount_owed']) for r in A_to_B)
+
+    # 2. El dinero real (NETO) que se está transfiriendo
+    net_amount = gross_B_to_A - gross_A_to_B
+
+    # 3. Candado Cruzado 🔒: Marcar TODAS las deudas en ambas direcciones como saldadas (un solo UPDATE)
+    split_ids = [r['id'] for r in B_to_A + A_to_B]
+    if split_ids:
+        _bulk_update(client, "group_expense_splits", {"is_settled": True, "settlement_requested": False}, "id", split_ids)
+    settled = [{'id': r['id'], 'user_id': r['user_id'], 'paid_by': r['group_expenses']['paid_by'],
+                'amount_owed': r['amount_owed'], 'movement_id': r['group_expenses'].get('movement_id')}
+               for r in B_to_A + A_to_B]
+
+    # 4. Reducir el gasto personal de quien cobra por el valor NETO recibido (calculado en local)
+    new_qty = {}
+    if net_amount > 0:
+        mov_ids = [r['group_expenses']['movement_id'] for r in B_to_A if r['group_expenses'].get('movement_id')]
+        if mov_ids:
+            mov_res = client.table("user_imputs").select("id, quantity").in_("id", mov_ids).execute()
+            quantities = {m['id']: float(m['quantity']) for m in mov_res.data}
+            new_qty = _reduce_movements(quantities, mov_ids, net_amount)
+
+            zeroed = [m for m, q in new_qty.items() if q == 0]
+            if zeroed:
+                _bulk_update(client, "user_imputs", {"quantity": 0}, "id", zeroed)
+            for mov_id, q in new_qty.items():
+                if q != 0: # Como mucho uno: el que absorbe el resto
+                    client.table("user_imputs").update({"quantity": q}).eq("id", mov_id).execute()
+    return {'settled_splits': settled, 'changed_movements': list(new_qty)}
+
+def get_locked_movements(user_id=None, group_id=None):
+    """IDs de movimientos con candado (algún reparto ya saldado), solo de los movimientos del usuario
+    (user_id) o de los gastos de un grupo (group_id). Se guarda en caché como frozenset: 'in' en O(1)."""
+    kind, key = ('locked', user_id) if user_id is not None else ('locked_group', group_id)
+    if key is not None:
+        locked = cache.get(kind, key)
+        if locked is not None:
+            return locked
+
     client = get_supabase_client()
     try:
-        res = client.table("group_expenses").select("movement_id, group_expense_splits!inner(is_settled)").eq("group_expense_splits.is_settled", True).execute()
-        return {r['movement_id'] for r in res.data if r.get('movement_id')}
+        query = client.table("group_expenses").select("movement_id, group_expense_splits!inner(is_settled)") \
+            .eq("group_expense_splits.is_settled", True)
+        if user_id is not None:
+            query = query.eq("paid_by", user_id) # El movimiento personal de un gasto compartido es de quien pagó
+        elif group_id is not None:
+            query = query.eq("group_id", group_id)
+        res = query.execute()
+        locked = frozenset(r['movement_id'] for r in res.data if r.get('movement_id'))
+        if key is not None:
+            cache.put(kind, key, locked) # También si está vacío: es la respuesta más habitual
+        return locked
     except:
-        return set()
+        return frozenset()
+
+def invalidate_locked_movements(group_id, *user_ids):
+    """Tras saldar, borrar o editar repartos: índice del grupo y de los usuarios cuyos movimientos pueden haber
+    quedado bloqueados o desbloqueados"""
+    cache.invalidate('locked_group', group_id)
+    cache.invalidate('locked', *user_ids)
+
+REQUEST_SETTLEMENT_RPC = 'request_settlement' # supabase/migrations/20261018040000_request_settlement_rpc.sql
 
 def request_settlement(group_id, debtor_id, creditor_id):
-    """El net-deudor avisa de que ha pagado la deuda neta"""
+    """El net-deudor avisa de que ha pagado la deuda neta.
+    Un solo UPDATE filtrado por grupo y acreedor (función request_settlement)."""
     client = get_supabase_client()
     try:
         # Solo marcamos los splits donde el deudor debe al acreedor
         # para que la alerta roja le llegue solo a quien recibe el dinero
-        res = client.table("group_expense_splits") \
-            .select("expense_id, group_expenses!inner(group_id, paid_by)") \
-            .eq("user_id", debtor_id) \
-            .eq("group_expenses.group_id", group_id) \
-            .eq("group_expenses.paid_by", creditor_id) \
-            .eq("is_settled", False).execute()
-        
-        for r in res.data:
-            client.table("group_expense_splits").update({"settlement_requested": True}) \
-                .eq("expense_id", r['expense_id']).eq("user_id", debtor_id).execute()
+        res = _call_rpc(client, REQUEST_SETTLEMENT_RPC, {
+            "p_group_id": group_id, "p_debtor_id": debtor_id, "p_creditor_id": creditor_id})
+        if res is None:
+            # Sin la función: PostgREST no deja filtrar un UPDATE por la tabla embebida, leemos los ids y marcamos
+            res = client.table("group_expense_splits") \
+                .select("id, group_expenses!inner(group_id, paid_by)") \
+                .eq("user_id", debtor_id) \
+                .eq("group_expenses.group_id", group_id) \
+                .eq("group_expenses.paid_by", creditor_id) \
+                .eq("is_settled", False).execute()
+            _bulk_update(client, "group_expense_splits", {"settlement_requested": True}, "id", [r['id'] for r in res.data])
+        bump_group_version(group_id)
         return True
     except Exception as e:
         print(f"Error requesting settlement: {e}")
         return False
-        
+
 def get_settlement_requests(group_id):
     """Devuelve las parejas (deudor, acreedor) que están pendientes de confirmación"""
     client = get_supabase_client()
@@ -534,36 +776,9 @@ def check_pending_confirmations(user_id):
         return set()
 
 def get_total_user_debt(user_id):
-    """Calcula el balance neto del usuario en todos los grupos. Positivo = le deben, Negativo = debe."""
-    client = get_supabase_client()
-    total_owed_to_me = 0.0
-    total_i_owe = 0.0
-    try:
-        # 1. Buscar todo el dinero que me deben (Yo pagué, otros deben y no está saldado)
-        res_creditor = client.table("group_expense_splits") \
-            .select("amount_owed, user_id, group_expenses!inner(paid_by)") \
-            .eq("group_expenses.paid_by", user_id) \
-            .eq("is_settled", False).execute()
-
-        for r in res_creditor.data:
-            if r['user_id'] != user_id: # No sumar mi propia parte de mis tickets
-                total_owed_to_me += float(r['amount_owed'])
-
-        # 2. Buscar todo el dinero que yo debo (Otros pagaron, yo debo y no está saldado)
-        res_debtor = client.table("group_expense_splits") \
-            .select("amount_owed, group_expenses!inner(paid_by)") \
-            .eq("user_id", user_id) \
-            .eq("is_settled", False).execute()
-
-        for r in res_debtor.data:
-            if r['group_expenses']['paid_by'] != user_id:
-                total_i_owe += float(r['amount_owed'])
-
-        # Retornamos el Neto: Si es positivo, soy acreedor. Si es negativo, soy deudor.
-        return total_owed_to_me - total_i_owe
-    except Exception as e:
-        print(f"Error calculando deuda total: {e}")
-        return 0.0
+    """Calcula el balance neto del usuario en todos los grupos. Positivo = le deben, Negativo = debe.
+    Suma las posiciones netas materializadas por grupo (ver sección 6): sin consultas si están en caché."""
+    return sum(get_net_positions(user_id).values())
 
 def add_external_member(group_id, name):
     """Crea un usuario 'fantasma' en el grupo"""
@@ -576,6 +791,7 @@ def add_external_member(group_id, name):
             "external_name": name,
             "user_id": None # No tiene cuenta real
         }).execute()
+        bump_group_version(group_id)
         return True, "Usuario externo añadido"
     except Exception as e:
         return False, str(e)
@@ -608,15 +824,245 @@ def settle_debt_to_external(group_id, debtor_id, external_name):
         # Buscamos los gastos donde el externo pagó (ext_) y el usuario real debe
         # Marcamos como settled los repartos correspondientes
         res = client.table("group_expense_splits") \
-            .select("id, group_expenses!inner(group_id, paid_by)") \
+            .select("id, amount_owed, group_expenses!inner(group_id, paid_by)") \
             .eq("group_expenses.group_id", group_id) \
             .eq("user_id", debtor_id) \
             .eq("is_settled", False).execute()
         
         if res.data:
-            ids_to_settle = [r['id'] for r in res.data]
-            client.table("group_expense_splits").update({"is_settled": True}).in_("id", ids_to_settle).execute()
+            _bulk_update(client, "group_expense_splits", {"is_settled": True}, "id", [r['id'] for r in res.data])
+            apply_net_deltas(group_id, _split_deltas(((debtor_id, r['group_expenses']['paid_by'], float(r['amount_owed']))
+                                                      for r in res.data), sign=-1))
+            # El candado cae sobre el movimiento de quien pagó cada gasto
+            invalidate_locked_movements(group_id, *{r['group_expenses']['paid_by'] for r in res.data})
+            bump_group_version(group_id)
             
         return True, f"Deuda con {external_name} saldada."
     except Exception as e:
         return False, str(e)
+
+
+# ==========================================
+# 5. FOTO DEL GRUPO (una sola consulta para toda la pantalla)
+# ==========================================
+
+GROUP_SNAPSHOT_TTL = 60 # Segundos: red de seguridad para cambios hechos desde otro proceso
+
+# Versión por grupo: cualquier escritura sobre el grupo la sube. Los valores salen de un contador global
+# que nunca se repite, así una foto leída antes de un cambio nunca puede pasar por actual.
+_group_versions = {}
+_version_counter = itertools.count(1)
+_versions_lock = threading.Lock()
+
+def bump_group_version(*group_ids):
+    with _versions_lock:
+        for gid in group_ids:
+            if gid is not None:
+                _group_versions[str(gid)] = next(_version_counter)
+
+def group_version(group_id):
+    return _group_versions.get(str(group_id), 0)
+
+@dataclass(frozen=True)
+class GroupSnapshot:
+    """Todo lo que pintan las pestañas de un grupo. Compartida entre las sesiones del usuario: no modificar."""
+    group_id: object
+    version: int
+    info: dict
+    members: list
+    expenses: list # Ordenados por fecha descendente, con sus repartos embebidos (cuota de cada uno y candados)
+    balances: dict # user_id -> saldo pendiente (+ le deben, - debe), sumado en la base de datos
+    settlement_requests: frozenset # (deudor, acreedor) con aviso de pago pendiente
+    locked_movements: frozenset # movement_id con algún reparto ya saldado
+    loaded_at: float = field(default_factory=time.time)
+
+    @property
+    def pending_leave(self):
+        return [m for m in self.members if m.get('leave_status') == 'pending']
+
+    def has_pending_confirmation(self, user_id):
+        """Equivale a group_id in check_pending_confirmations(user_id) para este grupo"""
+        return any(creditor == user_id for _, creditor in self.settlement_requests)
+
+def _snapshot_from_row(group_id, version, row, balances):
+    members = row.pop('group_members', None) or []
+    expenses = row.pop('group_expenses', None) or []
+    requests = set()
+    locked = set()
+    for g in expenses:
+        for s in g.get('group_expense_splits') or []:
+            if s.get('is_settled'):
+                if g.get('movement_id'): locked.add(g['movement_id'])
+            elif s.get('settlement_requested'):
+                requests.add((s['user_id'], g['paid_by']))
+    return GroupSnapshot(group_id=group_id, version=version, info=row, members=members, expenses=expenses,
+                         balances=balances, settlement_requests=frozenset(requests), locked_movements=frozenset(locked))
+
+SNAPSHOT_RPC = 'group_snapshot' # supabase/migrations/20261018000000_group_pending_balances.sql
+SNAPSHOT_SELECT = "*, group_members(id, user_id, leave_status, is_external, external_name, profiles(*)), " \
+                  "group_expenses(*, group_expense_splits(user_id, amount_owed, is_settled, settlement_requested))"
+
+def load_group_snapshot(group_id, user_id):
+    """Info, miembros, gastos con repartos, balances pendientes, avisos de pago y candados de un grupo en una sola
+    petición (función group_snapshot; sin ella, la consulta embebida más get_pending_balances).
+    Se guarda en caché por (grupo, usuario), porque lo que se lee depende de las políticas RLS de quien llama,
+    mientras la versión del grupo no cambie."""
+    version = group_version(group_id)
+    key = f"{group_id}:{user_id}"
+    snap = cache.get('group_snapshot', key)
+    if snap is not None and snap.version == version:
+        return snap
+
+    client = get_supabase_client()
+    try:
+        res = _call_rpc(client, SNAPSHOT_RPC, {"p_group_id": group_id})
+        if res is None:
+            rows = client.table("groups").select(SNAPSHOT_SELECT) \
+                .eq("id", group_id) \
+                .order("date", desc=True, foreign_table="group_expenses") \
+                .execute().data
+            res = {'group': rows[0] if rows else None, 'balances': get_pending_balances(group_id) if rows else {}}
+        if not res.get('group'):
+            return None
+        balances = {uid: float(v) for uid, v in (res.get('balances') or {}).items()}
+        snap = _snapshot_from_row(group_id, version, dict(res['group']), balances)
+        cache.put('group_snapshot', key, snap, ttl=GROUP_SNAPSHOT_TTL)
+        return snap
+    except Exception as e:
+        print(f"Error cargando el grupo: {e}")
+        return None
+
+
+
+# ==========================================
+# 6. POSICIÓN NETA POR (USUARIO, GRUPO)
+# ==========================================
+# Lo que me deben menos lo que debo en cada grupo, calculado una vez por usuario y guardado en caché.
+# Las escrituras que saben el cambio exacto (alta y edición de gastos, liquidaciones) lo suman encima;
+# las que no (borrar un gasto o un grupo, moverlo de grupo) invalidan el grupo y se recalcula al leer.
+
+NET_POSITION_TTL = 300 # Segundos: red de seguridad para cambios hechos desde otro proceso
+NET_POSITION_TOLERANCE = 0.01 # Euros de diferencia a partir de los que la conciliación da una posición por mala
+
+# Versión por grupo solo para las posiciones: la suben las escrituras que no conocen el cambio exacto.
+# Cada posición guarda la versión de su grupo al calcularse; si ya no coincide, la entrada se recalcula.
+_net_versions = {}
+
+def invalidate_net_positions(*group_ids):
+    with _versions_lock:
+        for gid in group_ids:
+            if gid is not None:
+                _net_versions[str(gid)] = next(_version_counter)
+
+def _net_version(group_id):
+    return _net_versions.get(str(group_id), 0)
+
+def _split_deltas(rows, sign=1):
+    """(deudor, acreedor, importe) de repartos pendientes -> {user_id: cambio de su posición neta}.
+    sign=-1 para repartos que dejan de estar pendientes (saldados o borrados)."""
+    deltas = {}
+    for debtor, creditor, amount in rows:
+        if debtor == creditor: continue # Lo que nos debemos a nosotros mismos no cuenta
+        deltas[creditor] = deltas.get(creditor, 0.0) + sign * amount
+        deltas[debtor] = deltas.get(debtor, 0.0) - sign * amount
+    return deltas
+
+def apply_net_deltas(group_id, deltas):
+    """Suma los deltas a las posiciones en caché de esos usuarios en el grupo.
+    Quien no tiene posición en caché no se toca: la calculará entera al leerla."""
+    gid = str(group_id)
+    version = _net_version(gid)
+    for user_id, amount in deltas.items():
+        def add(positions, amount=amount):
+            entry = positions.get(gid)
+            if entry is None:
+                positions[gid] = [amount, version]
+            else:
+                entry[0] += amount
+        cache.update('net_position', user_id, add)
+
+def _compute_net_positions(user_id):
+    """Recálculo completo: {group_id (str): [posición, versión]} a partir de todos los repartos pendientes"""
+    client = get_supabase_client()
+    versions = dict(_net_versions) # Antes de leer: si alguien invalida mientras tanto, la entrada nace caducada
+    # 1. Lo que me deben (yo pagué, otros deben y no está saldado)
+    res_creditor = client.table("group_expense_splits") \
+        .select("amount_owed, user_id, group_expenses!inner(group_id, paid_by)") \
+        .eq("group_expenses.paid_by", user_id) \
+        .eq("is_settled", False).execute()
+    # 2. Lo que debo yo (otros pagaron, yo debo y no está saldado)
+    res_debtor = client.table("group_expense_splits") \
+        .select("amount_owed, group_expenses!inner(group_id, paid_by)") \
+        .eq("user_id", user_id) \
+        .eq("is_settled", False).execute()
+    return _net_positions_from_rows(user_id, res_creditor.data, res_debtor.data, versions)
+
+def _net_positions_from_rows(user_id, creditor_rows, debtor_rows, versions):
+    positions = {}
+    for r in creditor_rows:
+        if r['user_id'] != user_id: # No sumar mi propia parte de mis tickets
+            gid = str(r['group_expenses']['group_id'])
+            positions[gid] = positions.get(gid, 0.0) + float(r['amount_owed'])
+    for r in debtor_rows:
+        if r['group_expenses']['paid_by'] != user_id:
+            gid = str(r['group_expenses']['group_id'])
+            positions[gid] = positions.get(gid, 0.0) - float(r['amount_owed'])
+    return {gid: [net, versions.get(gid, 0)] for gid, net in positions.items()}
+
+def _cached_net_positions(user_id):
+    """Posiciones en caché si ninguno de sus grupos se ha invalidado desde que se calcularon; si no, None"""
+    positions = cache.get('net_position', user_id)
+    if positions is None:
+        return None
+    positions = dict(positions)
+    if not all(version == _net_version(gid) for gid, (_, version) in positions.items()):
+        return None
+    return {gid: net for gid, (net, _) in positions.items()}
+
+def get_net_positions(user_id):
+    """{group_id (str): posición neta del usuario}. Positivo = le deben, Negativo = debe.
+    Si está en caché y ningún grupo se ha invalidado, es una búsqueda en memoria sin consultas."""
+    current = _cached_net_positions(user_id)
+    if current is not None:
+        return current
+    try:
+        positions = _compute_net_positions(user_id)
+    except Exception as e:
+        print(f"Error calculando posiciones netas: {e}")
+        return {}
+    cache.put('net_position', user_id, positions, ttl=NET_POSITION_TTL)
+    return {gid: net for gid, (net, _) in positions.items()}
+
+def reconcile_net_positions(user_ids=None, tolerance=NET_POSITION_TOLERANCE):
+    """Conciliación: recalcula las posiciones en caché (todas, o las de user_ids), las compara y deja
+    en caché las recalculadas. Devuelve las que no cuadraban: [{user_id, group_id, cached, actual}]."""
+    if user_ids is None:
+        user_ids = cache.keys('net_position')
+    mismatches = []
+    for user_id in user_ids:
+        cached = cache.get('net_position', user_id)
+        if cached is None:
+            continue
+        cached = dict(cached)
+        try:
+            fresh = _compute_net_positions(user_id)
+        except Exception as e:
+            print(f"Error conciliando posiciones de {user_id}: {e}")
+            continue
+        for gid in set(cached) | set(fresh):
+            net, version = cached.get(gid, [0.0, _net_version(gid)])
+            if version != _net_version(gid):
+                continue # Ya invalidada: se iba a recalcular igualmente al leerla
+            actual = fresh[gid][0] if gid in fresh else 0.0
+            if abs(net - actual) > tolerance:
+                mismatches.append({'user_id': user_id, 'group_id': gid, 'cached': net, 'actual': actual})
+        cache.put('net_position', user_id, fresh, ttl=NET_POSITION_TTL)
+    if mismatches:
+        print(f"Conciliación de posiciones netas: {len(mismatches)} descuadres corregidos")
+    return mismatches
+
+# --- INSTRUMENTACIÓN ---
+# Igual que en database: se miden las funciones que consultan o escriben, no los cálculos ni las versiones en memoria
+metrics.instrument_module(globals(), 'db', skip={'calculate_settlements', 'bump_group_version', 'group_version',
+                                                  'invalidate_locked_movements', 'invalidate_net_positions',
+                                                  'apply_net_deltas', 'pending_balances_from_rows', 'diff_splits'})
@@ -0,0 +1,7 @@
+# database_groups_async.py
+# Versión asíncrona de database_groups.py (mismos nombres). Como database_async: cada función ejecuta la
+# síncrona en el pool de hilos del proceso, así que solo hay una implementación de la lógica de grupos.
+import database_groups
+from database_async import async_namespace
+
+async_namespace(database_groups, globals())
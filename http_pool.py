@@ -0,0 +1,134 @@
+# http_pool.py
+# Transporte HTTP compartido por todos los clientes de Supabase del proceso (uno por sesión de Streamlit).
+# Cada sesión conserva su cliente (y con él su token), pero las peticiones salen por un único pool de
+# conexiones keep-alive acotado: sin handshakes TLS nuevos por sesión ni sockets que se abren y se tiran.
+# PostgREST, auth y storage mandan las cabeceras (apikey + Authorization) en cada petición, así que
+# compartir el httpx.Client no mezcla identidades.
+import threading
+import time
+
+import httpx
+
+import metrics
+
+HTTP_MAX_CONNECTIONS = 32 # Conexiones abiertas como mucho entre todas las sesiones
+HTTP_KEEPALIVE_SECONDS = 30 # Una conexión ociosa se cierra pasado este tiempo
+HTTP_TIMEOUT = 120 # Segundos por petición (el mismo valor por defecto que postgrest-py)
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Cuerpo de la respuesta que devuelve el hueco del pool al cerrarse (httpx lo cierra al leerlo entero).
+    Al cerrarse también apunta la petición y los bytes leídos en el contador del hilo que la hizo (metrics)."""
+
+    def __init__(self, stream, release, counter):
+        self._stream = stream
+        self._release = release
+        self._counter = counter
+        self._bytes = 0
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._bytes += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+            if self._counter is not None:
+                metrics.count_request(self._bytes, self._counter)
+                self._counter = None
+
+
+class PooledTransport(httpx.HTTPTransport):
+    """HTTPTransport con tantos huecos como conexiones: quien no encuentra hueco espera aquí,
+    así podemos medir la espera por conexión (httpcore no la expone)."""
+
+    def __init__(self, max_connections=HTTP_MAX_CONNECTIONS, keepalive_expiry=HTTP_KEEPALIVE_SECONDS):
+        super().__init__(limits=httpx.Limits(max_connections=max_connections,
+                                             max_keepalive_connections=max_connections,
+                                             keepalive_expiry=keepalive_expiry))
+        self.max_connections = max_connections
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._waiting = 0
+        self._requests = 0
+        self._waited = 0 # Peticiones que no encontraron hueco libre a la primera
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def handle_request(self, request):
+        counter = metrics.request_counter()
+        started = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._waiting += 1
+            try:
+                self._slots.acquire()
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._in_use += 1
+            self._requests += 1
+            self._wait_total += waited
+            if waited > 0.001:
+                self._waited += 1
+            self._wait_max = max(self._wait_max, waited)
+
+        released = threading.Event()
+        def release():
+            if not released.is_set():
+                released.set()
+                with self._lock:
+                    self._in_use -= 1
+                self._slots.release()
+
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            release()
+            metrics.count_request(0, counter)
+            raise
+        response.stream = _ReleasingStream(response.stream, release, counter)
+        return response
+
+    def stats(self):
+        connections = list(self._pool.connections)
+        with self._lock:
+            return {
+                'max_connections': self.max_connections,
+                'open_connections': len(connections),
+                'idle_connections': sum(1 for c in connections if c.is_idle()),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'requests': self._requests,
+                'waited_requests': self._waited,
+                'wait_avg_ms': (self._wait_total / self._requests * 1000) if self._requests else 0.0,
+                'wait_max_ms': self._wait_max * 1000,
+            }
+
+
+# Instancia única del proceso
+_transport = None
+_client = None
+_client_lock = threading.Lock()
+
+def shared_http_client():
+    """httpx.Client del proceso para SyncClientOptions(httpx_client=...). No cerrarlo desde una sesión."""
+    global _transport, _client
+    with _client_lock:
+        if _client is None:
+            _transport = PooledTransport(HTTP_MAX_CONNECTIONS, HTTP_KEEPALIVE_SECONDS)
+            _client = httpx.Client(transport=_transport, timeout=HTTP_TIMEOUT, follow_redirects=True)
+        return _client
+
+def pool_stats():
+    """Tamaño del pool, conexiones abiertas/ociosas, peticiones en curso y en espera, y tiempos de espera"""
+    if _transport is None:
+        return {'max_connections': HTTP_MAX_CONNECTIONS, 'open_connections': 0, 'idle_connections': 0, 'in_use': 0,
+                'waiting': 0, 'requests': 0, 'waited_requests': 0, 'wait_avg_ms': 0.0, 'wait_max_ms': 0.0}
+    return _transport.stats()
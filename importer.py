@@ -0,0 +1,183 @@
+# importer.py
+# Importación masiva de extractos bancarios (CSV/XLSX): lectura por bloques, parseo vectorizado
+# y preparación de las filas para database.insert_inputs_in_chunks.
+import numpy as np
+import pandas as pd
+
+from database import BULK_CHUNK_SIZE
+
+IMPORT_READ_CHUNK = 20_000 # Filas que se leen del archivo de cada vez
+SIN_CLASIFICAR = "⚠️ Sin clasificar"
+AUTO_TIPO = "-- Autodetectar por signo (-/+) --"
+AUTO_CATEGORIA = "-- Autodetectar por concepto (Oráculo) --"
+
+
+# --- LECTURA POR BLOQUES ---
+
+def _is_csv(up):
+    return up.name.lower().endswith('.csv')
+
+def _sniff_separator(up):
+    """Detecta el separador mirando la cabecera (sep=None obliga al motor python, mucho más lento).
+    En la cabecera no hay importes con coma decimal, así que el carácter que más se repite es el separador."""
+    up.seek(0)
+    header = up.readline()
+    up.seek(0)
+    if isinstance(header, bytes):
+        header = header.decode('utf-8', errors='replace')
+    counts = {sep: header.count(sep) for sep in (';', ',', '\t', '|')}
+    best = max(counts, key=counts.get)
+    return best if counts[best] else ','
+
+def read_columns(up):
+    """Solo la cabecera del archivo, para los selectores de columnas"""
+    if _is_csv(up):
+        cols = pd.read_csv(up, sep=_sniff_separator(up), nrows=0).columns.tolist()
+    else:
+        from openpyxl import load_workbook
+        up.seek(0)
+        wb = load_workbook(up, read_only=True, data_only=True)
+        header = next(wb.active.iter_rows(max_row=1, values_only=True), ())
+        wb.close()
+        cols = [str(c) for c in header if c is not None]
+    up.seek(0)
+    return cols
+
+def iter_file_chunks(up, chunksize=IMPORT_READ_CHUNK):
+    """Genera DataFrames de como mucho chunksize filas sin cargar el archivo entero"""
+    if _is_csv(up):
+        yield from pd.read_csv(up, sep=_sniff_separator(up), chunksize=chunksize)
+        return
+
+    from openpyxl import load_workbook
+    up.seek(0)
+    wb = load_workbook(up, read_only=True, data_only=True) # read_only: filas en streaming
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = [str(c) if c is not None else f"Columna {i + 1}" for i, c in enumerate(next(rows, ()))]
+        batch = []
+        for row in rows:
+            batch.append(row[:len(header)])
+            if len(batch) >= chunksize:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        wb.close()
+
+
+# --- PARSEO VECTORIZADO ---
+
+def _parse_amounts(col):
+    if col.dtype.kind in 'if':
+        return col.astype(float)
+    clean = col.astype(object).where(col.notna(), '').astype(str)
+    clean = clean.str.replace('€', '', regex=False).str.replace(',', '.', regex=False).str.strip()
+    return pd.to_numeric(clean, errors='coerce')
+
+def _parse_dates(col):
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return col
+    dates = pd.to_datetime(col, errors='coerce')
+    # El formato se infiere con la primera fila: las que no encajan se leen una a una, como antes de vectorizar
+    retry = dates.isna() & col.notna()
+    if retry.any():
+        dates[retry] = [_parse_date(v) for v in col[retry]]
+    return dates
+
+def _parse_date(value):
+    try:
+        return pd.to_datetime(value)
+    except (ValueError, TypeError, OverflowError):
+        return pd.NaT
+
+def _text(col):
+    return col.astype(object).where(col.notna(), '').astype(str)
+
+def parse_chunk(df, classifier, sel_qty, sel_date, sel_note, sel_tipo=AUTO_TIPO, sel_cat=AUTO_CATEGORIA):
+    """Convierte un bloque del extracto en filas Fecha/Concepto/Tipo/Cantidad/Categoría.
+    Las filas sin importe o fecha legibles se descartan. classifier: classifier.Classifier del usuario."""
+    qty = _parse_amounts(df[sel_qty])
+    fechas = _parse_dates(df[sel_date])
+    concepto = _text(df[sel_note])
+
+    # Lógica Híbrida de Tipo
+    if sel_tipo != AUTO_TIPO:
+        es_ingreso = _text(df[sel_tipo]).str.upper().str.contains('ING', regex=False)
+    else:
+        es_ingreso = qty >= 0
+    tipo = pd.Series(np.where(es_ingreso, "Ingreso", "Gasto"), index=df.index)
+
+    # LÓGICA HÍBRIDA DE CATEGORÍA
+    # A) Columna del Excel con la categoría: coincidencia exacta ignorando mayúsculas
+    categoria = pd.Series(SIN_CLASIFICAR, index=df.index, dtype=object)
+    if sel_cat != AUTO_CATEGORIA:
+        categoria = classifier.match_names(df[sel_cat]).fillna(SIN_CLASIFICAR).astype(object)
+
+    # B) El Oráculo (reglas compiladas) para lo que siga sin clasificar
+    pendiente = categoria == SIN_CLASIFICAR
+    if pendiente.any():
+        categoria[pendiente] = classifier.classify(concepto[pendiente]).fillna(SIN_CLASIFICAR)
+
+    valid = qty.notna() & fechas.notna()
+    return pd.DataFrame({
+        "Fecha": fechas[valid].dt.date,
+        "Concepto": concepto[valid],
+        "Tipo": tipo[valid],
+        "Cantidad": qty[valid].abs(),
+        "Categoría": categoria[valid],
+    }).reset_index(drop=True)
+
+def parse_file(up, classifier, sel_qty, sel_date, sel_note, sel_tipo=AUTO_TIPO, sel_cat=AUTO_CATEGORIA,
+               on_progress=None, chunksize=IMPORT_READ_CHUNK):
+    """Lee y parsea el archivo bloque a bloque. on_progress(filas_leidas, filas_validas) tras cada bloque."""
+    parts = []
+    read = valid = 0
+    for chunk in iter_file_chunks(up, chunksize):
+        parsed = parse_chunk(chunk, classifier, sel_qty, sel_date, sel_note, sel_tipo, sel_cat)
+        parts.append(parsed)
+        read += len(chunk)
+        valid += len(parsed)
+        if on_progress:
+            on_progress(read, valid)
+    up.seek(0)
+    if not parts:
+        return pd.DataFrame(columns=["Fecha", "Concepto", "Tipo", "Cantidad", "Categoría"])
+    return pd.concat(parts, ignore_index=True)
+
+
+# --- PREPARACIÓN PARA LA BASE DE DATOS ---
+
+ROW_FIELDS = ("user_id", "quantity", "type", "category_id", "date", "notes")
+
+def _valid_mask(edited_df, cat_lookup):
+    cantidad = pd.to_numeric(edited_df["Cantidad"], errors='coerce')
+    fechas = pd.to_datetime(edited_df["Fecha"], errors='coerce')
+    conocida = edited_df["Categoría"].isin(list(cat_lookup.keys()))
+    return conocida & cantidad.notna() & fechas.notna(), conocida, cantidad, fechas
+
+def build_rows(edited_df, user_id, cat_lookup):
+    """Filas listas para user_imputs a partir de la tabla revisada.
+    Devuelve (filas, errores) con errores como lista de (nº de fila, motivo)."""
+    ok, conocida, cantidad, fechas = _valid_mask(edited_df, cat_lookup)
+
+    errores = [(i + 1, "Categoría desconocida" if not c else "Cantidad o fecha no válida")
+               for i, c in zip(np.flatnonzero(~ok.to_numpy()).tolist(), conocida[~ok].tolist())]
+    good = edited_df[ok]
+    columns = (
+        [user_id] * len(good),
+        cantidad[ok].astype(float).tolist(),
+        good["Tipo"].astype(str).tolist(),
+        good["Categoría"].map(cat_lookup).tolist(),
+        fechas[ok].dt.strftime('%Y-%m-%d').tolist(),
+        good["Concepto"].astype(str).tolist(),
+    )
+    # zip sobre listas: bastante más rápido que DataFrame.to_dict('records') con decenas de miles de filas
+    return [dict(zip(ROW_FIELDS, values)) for values in zip(*columns)], errores
+
+def failed_chunk_rows(edited_df, cat_lookup, results, chunk_size=BULK_CHUNK_SIZE):
+    """Filas de la tabla revisada que iban en bloques rechazados (para dejarlas pendientes y reintentar)"""
+    positions = [i for r in results if not r['ok'] for i in range(r['chunk'] * chunk_size, r['chunk'] * chunk_size + r['rows'])]
+    ok = _valid_mask(edited_df, cat_lookup)[0]
+    return edited_df[ok].iloc[positions].reset_index(drop=True)
@@ -0,0 +1,247 @@
+# ledger.py
+# Representación compacta de los movimientos de un usuario para tenerla en caché por usuario.
+# En vez de un DataFrame lleno de columnas object (notas, emojis, nombre de categoría repetido en cada
+# fila...) guardamos arrays numéricos + tablas laterales con los valores únicos.
+import sys
+
+import numpy as np
+import pandas as pd
+
+from aggregates import BalanceSeries, MonthlyCube
+
+# Código 0 reservado en cada tabla lateral para "sin valor" (categoría o grupo borrado, nota vacía...)
+NO_CATEGORY = (None, 'General', '📁', 0)
+NO_GROUP = (None, None, '👥')
+
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+# Columnas con un valor por movimiento (el resto son tablas laterales indexadas por código)
+ROW_COLUMNS = ('ids', 'quantity', 'day', 'type_code', 'cat_code', 'group_code', 'note_code', 'user_code')
+
+# Columnas de get_transactions que el ledger guarda en formato compacto (cat_display se deriva al pedir la vista).
+# Cualquier otra (created_at, updated_at...) se guarda tal cual en 'extra' para devolverla en to_frame.
+FRAME_COLUMNS = ('id', 'user_id', 'quantity', 'type', 'category_id', 'date', 'notes', 'group_id',
+                 'cat_name', 'cat_emoji', 'budget', 'group_name', 'group_emoji', 'cat_display')
+
+
+def _intern(values, default):
+    """Factoriza una columna: devuelve códigos int32 (0 = default) y la tabla de valores únicos"""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    table = np.empty(len(uniques) + 1, dtype=object)
+    table[0] = default
+    table[1:] = list(uniques)
+    return (codes + 1).astype(np.int32), table
+
+
+def _first_by_code(codes, size, *columns):
+    """Para cada código, el valor de cada columna en su primera aparición (tabla lateral por código)"""
+    _, first_idx = np.unique(codes, return_index=True)
+    tables = []
+    for col in columns:
+        table = np.empty(size, dtype=object)
+        table[codes[first_idx]] = np.asarray(col, dtype=object)[first_idx]
+        tables.append(table)
+    return tables
+
+
+def _remap(table, fresh_table):
+    """Códigos de otra tabla lateral (fresh_table) dentro de table, añadiendo al final los valores que no estaban.
+    Devuelve (tabla ampliada, array código en fresh_table -> código en la tabla ampliada)"""
+    values = fresh_table[1:]
+    found = pd.Index(table[1:], dtype=object).get_indexer(pd.Index(values, dtype=object))
+    missing = found < 0
+    found[missing] = len(table) - 1 + np.arange(missing.sum())
+    if missing.any():
+        table = np.concatenate([table, values[missing]])
+    return table, np.concatenate([[0], found + 1]).astype(np.int32)
+
+
+def _patch(table, size, codes, values):
+    """Copia de una tabla lateral ampliada a size, con values en las posiciones codes"""
+    out = np.empty(size, dtype=table.dtype)
+    out[:len(table)] = table
+    out[codes] = values
+    return out
+
+
+def _categorical(codes, table):
+    """Columna categórica a partir de códigos sobre una tabla lateral (la tabla puede repetir valores)"""
+    t_codes, uniques = pd.factorize(pd.Series(table, dtype=object), use_na_sentinel=True)
+    return pd.Categorical.from_codes(t_codes[codes], categories=pd.Index(list(uniques)))
+
+
+class Ledger:
+    """Movimientos en formato columnar: ids int64, importes float64, fechas como int32 (días desde 1970)
+    y categorías/grupos/tipos/notas como códigos int32 sobre tablas internadas."""
+
+    __slots__ = ('ids', 'quantity', 'day', 'type_code', 'cat_code', 'group_code', 'note_code', 'user_code',
+                 'types', 'users', 'notes', 'cat_ids', 'cat_names', 'cat_emojis', 'cat_budgets',
+                 'group_ids', 'group_names', 'group_emojis', 'extra', 'version', '_cube', '_balance')
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def empty(self):
+        return len(self.ids) == 0
+
+    @classmethod
+    def from_frame(cls, df, version=0):
+        """Construye el ledger a partir de la salida de database.get_transactions"""
+        led = cls()
+        led.version = version
+        led._cube = None
+        led._balance = None
+        n = len(df)
+        if n == 0:
+            df = pd.DataFrame(columns=['id', 'user_id', 'quantity', 'type', 'category_id', 'date', 'notes',
+                                       'group_id', 'cat_name', 'cat_emoji', 'budget', 'group_name', 'group_emoji'])
+
+        ids = pd.to_numeric(df['id'], errors='coerce')
+        led.ids = ids.to_numpy(dtype=np.int64) if n and ids.notna().all() else df['id'].to_numpy(dtype=object)
+        led.quantity = pd.to_numeric(df['quantity'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+        dates = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[D]')
+        led.day = (dates - EPOCH).astype(np.int32)
+
+        led.type_code, led.types = _intern(df['type'], None)
+        led.user_code, led.users = _intern(df['user_id'], None)
+        # Nota vacía y nula se muestran igual ('Sin concepto'): las unificamos en ''
+        led.note_code, led.notes = _intern(df['notes'].astype(object).where(df['notes'].notna(), ''), '')
+
+        # Categoría y grupo: el código sale del id; nombre/emoji/presupuesto se guardan una vez por id
+        led.cat_code, led.cat_ids = _intern(df['category_id'], NO_CATEGORY[0])
+        led.cat_names, led.cat_emojis, budgets = _first_by_code(
+            led.cat_code, len(led.cat_ids), df['cat_name'], df['cat_emoji'], df['budget'])
+        led.cat_names[0], led.cat_emojis[0], budgets[0] = NO_CATEGORY[1:]
+        led.cat_budgets = pd.to_numeric(pd.Series(budgets), errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+        led.group_code, led.group_ids = _intern(df['group_id'], NO_GROUP[0])
+        led.group_names, led.group_emojis = _first_by_code(
+            led.group_code, len(led.group_ids), df['group_name'], df['group_emoji'])
+        led.group_names[0], led.group_emojis[0] = NO_GROUP[1:]
+
+        led.extra = {col: df[col].to_numpy(dtype=object) for col in df.columns if col not in FRAME_COLUMNS}
+        return led
+
+    @property
+    def cube(self):
+        """Cubo mensual de agregados: se construye una vez por versión del ledger"""
+        if self._cube is None:
+            self._cube = MonthlyCube.from_ledger(self)
+        return self._cube
+
+    @property
+    def balance(self):
+        """Serie de saldo diario (sumas prefijas): también una vez por versión del ledger"""
+        if self._balance is None:
+            self._balance = BalanceSeries.from_ledger(self)
+        return self._balance
+
+    def _positions(self, ids):
+        """Posición de cada id en el ledger (-1 si no está), con un índice hash sobre la columna de ids"""
+        ids = pd.Series(list(ids), dtype=object)
+        if self.ids.dtype == object:
+            return pd.Index(self.ids.astype(str)).get_indexer(ids.astype(str))
+        return pd.Index(self.ids).get_indexer(pd.to_numeric(ids, errors='coerce'))
+
+    def merge(self, delta_df, drop_ids=()):
+        """Nuevo ledger (versión + 1) con el delta de una carga incremental aplicado columna a columna:
+        las altas se añaden al final, las filas modificadas se sobrescriben en su posición y las borradas
+        se quitan con una máscara. Solo se internan los valores del delta, no se reconstruye todo el ledger.
+        Si el cubo o la serie de saldo ya existían se actualizan restando las filas viejas y sumando las nuevas."""
+        fresh = Ledger.from_frame(delta_df)
+        if self.empty:
+            fresh.version = self.version + 1
+            return fresh
+
+        pos = self._positions(fresh.ids)
+        changed, added = pos >= 0, pos < 0
+        in_delta = {str(i) for i in fresh.ids}
+        gone = self._positions([i for i in drop_ids if str(i) not in in_delta])
+        gone = gone[gone >= 0]
+
+        new = Ledger()
+        new.version = self.version + 1
+        new._cube = None
+        new._balance = None
+
+        # Tablas laterales: los valores del delta que no estaban van al final; nombres y emojis, los del delta
+        maps = {}
+        for code, table in (('type_code', 'types'), ('user_code', 'users'), ('note_code', 'notes'),
+                            ('cat_code', 'cat_ids'), ('group_code', 'group_ids')):
+            extended, maps[code] = _remap(getattr(self, table), getattr(fresh, table))
+            setattr(new, table, extended)
+        for code, ids_table, tables in (('cat_code', 'cat_ids', ('cat_names', 'cat_emojis', 'cat_budgets')),
+                                        ('group_code', 'group_ids', ('group_names', 'group_emojis'))):
+            size = len(getattr(new, ids_table))
+            for table in tables:
+                setattr(new, table, _patch(getattr(self, table), size, maps[code][1:], getattr(fresh, table)[1:]))
+
+        # Columnas por fila
+        for name in ROW_COLUMNS:
+            column, values = getattr(self, name), getattr(fresh, name)
+            if name in maps:
+                values = maps[name][values]
+            column = np.concatenate([column, values[added]]) if added.any() else column.copy()
+            column[pos[changed]] = values[changed]
+            if len(gone):
+                column = np.delete(column, gone)
+            setattr(new, name, column)
+
+        # Columnas extra: la que falte en un lado se rellena con None
+        new.extra = {}
+        for name in list(self.extra) + [c for c in fresh.extra if c not in self.extra]:
+            column = self.extra.get(name, np.full(len(self), None, dtype=object))
+            values = fresh.extra.get(name, np.full(len(fresh), None, dtype=object))
+            column = np.concatenate([column, values[added]]) if added.any() else column.copy()
+            column[pos[changed]] = values[changed]
+            new.extra[name] = np.delete(column, gone) if len(gone) else column
+
+        if self._cube is None and self._balance is None:
+            return new
+        old_idx = np.concatenate([pos[changed], gone])
+        # Copias: otras sesiones pueden estar pintando con la versión anterior
+        for slot in ('_cube', '_balance'):
+            current = getattr(self, slot)
+            if current is not None:
+                updated = current.copy()
+                updated.apply_rows(self, old_idx, -1)
+                updated.apply_rows(fresh, np.arange(len(fresh)), 1)
+                setattr(new, slot, updated)
+        return new
+
+    def to_frame(self):
+        """Vista DataFrame con las mismas columnas que get_transactions, para las pestañas existentes.
+        Las columnas repetitivas son categóricas construidas desde los códigos; las notas son object como en
+        get_transactions (la nota vacía llega como ''), y las columnas extra salen tal cual."""
+        if self.empty:
+            return pd.DataFrame()
+        displays = np.array([f"{e or '📁'} {n or 'General'}" for e, n in zip(self.cat_emojis, self.cat_names)], dtype=object)
+        return pd.DataFrame({
+            'id': self.ids,
+            'user_id': _categorical(self.user_code, self.users),
+            'quantity': self.quantity,
+            'type': _categorical(self.type_code, self.types),
+            'category_id': _categorical(self.cat_code, self.cat_ids),
+            'date': pd.to_datetime((EPOCH + self.day).astype('datetime64[ns]')),
+            'notes': pd.Series(self.notes[self.note_code], dtype=object),
+            'group_id': _categorical(self.group_code, self.group_ids),
+            'cat_name': _categorical(self.cat_code, self.cat_names),
+            'cat_emoji': _categorical(self.cat_code, self.cat_emojis),
+            'budget': self.cat_budgets[self.cat_code],
+            'group_name': _categorical(self.group_code, self.group_names),
+            'group_emoji': _categorical(self.group_code, self.group_emojis),
+            'cat_display': _categorical(self.cat_code, displays),
+            **self.extra,
+        })
+
+    def nbytes(self):
+        """Memoria aproximada: arrays numéricos + tablas laterales (contando las cadenas)"""
+        total = 0
+        values = [getattr(self, name, None) for name in self.__slots__] + list(getattr(self, 'extra', {}).values())
+        for value in values:
+            if isinstance(value, np.ndarray):
+                total += value.nbytes
+                if value.dtype == object:
+                    total += sum(sys.getsizeof(v) for v in value if v is not None)
+        return total
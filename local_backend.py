@@ -0,0 +1,890 @@
+# local_backend.py
+# Backend local (SQLite, en memoria o en archivo) que imita la parte de Supabase que usa la app:
+# las tablas, el query builder de PostgREST (select con embebidos y !inner, eq/in_/gt/lte..., order, limit,
+# insert/upsert/update/delete, count="exact"), las funciones RPC de supabase/migrations y lo mínimo de auth y storage.
+# Sirve para benchmarks y pruebas de carga sin red. Se activa con DATA_BACKEND=local (ver database.data_backend).
+# No hay RLS: todas las sesiones ven todas las filas.
+import itertools
+import os
+import sqlite3
+import threading
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+
+import streamlit as st
+
+import metrics
+
+LOCAL_DB_PATH = ':memory:' # Por defecto en memoria y compartida por todo el proceso
+SQL_IN_CHUNK = 900 # Valores por IN (...) al resolver embebidos
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+def _today():
+    return date.today().isoformat()
+
+
+# --- ESQUEMA ---
+# Tipos: int, float, text, bool, date, timestamp. Las columnas que no estén aquí se crean solas
+# (como text/float/bool según el primer valor) la primera vez que se escriben.
+TABLES = {
+    'profiles': {
+        'columns': {'id': 'text', 'name': 'text', 'lastname': 'text', 'avatar_url': 'text', 'profile_color': 'text',
+                    'icon_color': 'text', 'social_active': 'bool', 'initial_balance': 'float', 'base_salary': 'float',
+                    'payments_per_year': 'int', 'other_fixed_income': 'float', 'other_income_frequency': 'int',
+                    'created_at': 'timestamp'},
+        'identity': False,
+        'defaults': {'social_active': False, 'initial_balance': 0, 'base_salary': 0, 'payments_per_year': 12,
+                     'created_at': _now},
+    },
+    'income_history': {
+        'columns': {'id': 'int', 'user_id': 'text', 'base_salary': 'float', 'other_fixed_income': 'float',
+                    'other_income_frequency': 'int', 'valid_from': 'date', 'created_at': 'timestamp'},
+        'unique': ('user_id', 'valid_from'), # Clave de conflicto del upsert
+        'defaults': {'valid_from': _today, 'created_at': _now},
+    },
+    'user_categories': {
+        'columns': {'id': 'int', 'user_id': 'text', 'name': 'text', 'type': 'text', 'emoji': 'text', 'budget': 'float',
+                    'budget_type': 'text', 'budget_percent': 'float', 'created_at': 'timestamp'},
+        'defaults': {'emoji': '📁', 'budget': 0, 'budget_type': 'fixed', 'budget_percent': 0, 'created_at': _now},
+    },
+    'user_imputs': {
+        'columns': {'id': 'int', 'user_id': 'text', 'quantity': 'float', 'type': 'text', 'category_id': 'int',
+                    'date': 'date', 'notes': 'text', 'group_id': 'int', 'created_at': 'timestamp',
+                    'updated_at': 'timestamp'},
+        'defaults': {'date': _today, 'created_at': _now, 'updated_at': _now},
+        'touch': 'updated_at', # La fija el trigger de UPDATE (supabase/migrations)
+    },
+    'groups': {
+        'columns': {'id': 'int', 'name': 'text', 'emoji': 'text', 'color': 'text', 'created_by': 'text',
+                    'allow_leaving': 'bool', 'created_at': 'timestamp'},
+        'defaults': {'emoji': '👥', 'color': '#636EFA', 'allow_leaving': True, 'created_at': _now},
+    },
+    'group_members': {
+        'columns': {'id': 'int', 'group_id': 'int', 'user_id': 'text', 'leave_status': 'text', 'is_external': 'bool',
+                    'external_name': 'text', 'created_at': 'timestamp'},
+        'defaults': {'leave_status': 'none', 'is_external': False, 'created_at': _now},
+    },
+    'group_expenses': {
+        'columns': {'id': 'int', 'group_id': 'int', 'movement_id': 'int', 'paid_by': 'text', 'description': 'text',
+                    'total_amount': 'float', 'date': 'timestamp', 'created_at': 'timestamp'},
+        'defaults': {'date': _now, 'created_at': _now},
+    },
+    'group_expense_splits': {
+        'columns': {'id': 'int', 'expense_id': 'int', 'user_id': 'text', 'amount_owed': 'float', 'is_settled': 'bool',
+                    'settlement_requested': 'bool'},
+        'defaults': {'is_settled': False, 'settlement_requested': False},
+    },
+    'group_invitations': {
+        'columns': {'id': 'int', 'group_id': 'int', 'invited_email': 'text', 'status': 'text', 'created_at': 'timestamp'},
+        'defaults': {'status': 'pending', 'created_at': _now},
+    },
+}
+
+# Claves ajenas (tabla hija, tabla madre) -> (columna de la hija, ON DELETE). Con ellas se resuelven los embebidos:
+# desde la hija la madre llega como objeto, desde la madre las hijas llegan como lista.
+RELATIONS = {
+    ('user_imputs', 'user_categories'): ('category_id', 'SET NULL'),
+    ('user_imputs', 'groups'): ('group_id', 'SET NULL'),
+    ('income_history', 'profiles'): ('user_id', 'CASCADE'),
+    ('group_members', 'groups'): ('group_id', 'CASCADE'),
+    ('group_members', 'profiles'): ('user_id', 'CASCADE'),
+    ('group_expenses', 'groups'): ('group_id', 'CASCADE'),
+    ('group_expenses', 'user_imputs'): ('movement_id', 'SET NULL'),
+    ('group_expense_splits', 'group_expenses'): ('expense_id', 'CASCADE'),
+    ('group_invitations', 'groups'): ('group_id', 'CASCADE'),
+}
+
+SQL_TYPES = {'int': 'INTEGER', 'float': 'REAL', 'text': 'TEXT', 'bool': 'INTEGER', 'date': 'TEXT', 'timestamp': 'TEXT'}
+
+
+class LocalBackendError(Exception):
+    """Equivalente a postgrest.APIError para el backend local"""
+
+
+def _relation(parent, child):
+    """(columna fk, la madre es la de fuera) para embeber child dentro de parent"""
+    if (parent, child) in RELATIONS:
+        return RELATIONS[(parent, child)][0], True # parent.fk -> child.id: objeto
+    if (child, parent) in RELATIONS:
+        return RELATIONS[(child, parent)][0], False # child.fk -> parent.id: lista
+    raise LocalBackendError(f"No hay relación entre '{parent}' y '{child}'")
+
+def _to_sql(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+# --- BASE DE DATOS ---
+
+class LocalDatabase:
+    """Conexión SQLite del proceso. Un candado serializa las consultas (como haría un único backend)."""
+
+    def __init__(self, path=LOCAL_DB_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        self.lock = threading.RLock()
+        self.columns = {}
+        self.next_id = {}
+        self.users = {} # email -> {'id', 'email', 'password'} (auth local)
+        self.files = {} # (bucket, ruta) -> bytes (storage local)
+        self.queries = 0 # Peticiones atendidas (cada execute() contaría como un viaje de red)
+        self.row_writes = Counter() # Filas escritas por (tabla, 'insert'/'update'/'delete'): mide cuánto se revuelve cada tabla
+        self._savepoints = 0
+        self._create_schema()
+
+    def _create_schema(self):
+        with self.lock:
+            for table, spec in TABLES.items():
+                cols = []
+                for col, kind in spec['columns'].items():
+                    sql = f'"{col}" {SQL_TYPES[kind]}'
+                    if col == 'id':
+                        sql += ' PRIMARY KEY'
+                    cols.append(sql)
+                for (child, parent), (fk, on_delete) in RELATIONS.items():
+                    if child == table:
+                        cols.append(f'FOREIGN KEY ("{fk}") REFERENCES "{parent}"(id) ON DELETE {on_delete}')
+                if spec.get('unique'):
+                    cols.append('UNIQUE (' + ', '.join(f'"{c}"' for c in spec['unique']) + ')')
+                self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({", ".join(cols)})')
+                for (child, _), (fk, _) in RELATIONS.items():
+                    if child == table:
+                        self.conn.execute(f'CREATE INDEX IF NOT EXISTS "ix_{table}_{fk}" ON "{table}"("{fk}")')
+                self.columns[table] = dict(spec['columns'])
+                # En un archivo ya existente puede haber columnas creadas sobre la marcha en otra ejecución
+                for info in self.conn.execute(f'PRAGMA table_info("{table}")'):
+                    if info['name'] not in self.columns[table]:
+                        self.columns[table][info['name']] = {'INTEGER': 'int', 'REAL': 'float'}.get(info['type'], 'text')
+                row = self.conn.execute(f'SELECT MAX(id) FROM "{table}"').fetchone()
+                if spec.get('identity', True):
+                    self.next_id[table] = (row[0] or 0) + 1
+            # Índices de las consultas calientes de la app
+            self.conn.execute('CREATE INDEX IF NOT EXISTS ix_user_imputs_user_id ON user_imputs(user_id, id)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS ix_splits_user ON group_expense_splits(user_id, is_settled)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS ix_expenses_paid_by ON group_expenses(paid_by)')
+
+    def ensure_columns(self, table, rows):
+        """Crea las columnas que aún no existen (la app guarda alguna columna de perfil/ajustes no declarada)"""
+        if table not in self.columns:
+            raise LocalBackendError(f"La tabla '{table}' no existe")
+        known = self.columns[table]
+        for row in rows:
+            for col, value in row.items():
+                if col not in known:
+                    kind = 'bool' if isinstance(value, bool) else 'float' if isinstance(value, (int, float)) else 'text'
+                    self.conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{col}" {SQL_TYPES[kind]}')
+                    known[col] = kind
+
+    def decode(self, table, row):
+        """Fila SQLite -> dict con los tipos de Python que devolvería PostgREST"""
+        kinds = self.columns[table]
+        out = dict(row)
+        for col, value in out.items():
+            if value is not None and kinds.get(col) == 'bool':
+                out[col] = bool(value)
+        return out
+
+    @contextmanager
+    def transaction(self):
+        """Transacción anidable (SAVEPOINT): dentro de una RPC, todas sus escrituras se confirman o deshacen juntas"""
+        with self.lock:
+            name = f'sp{self._savepoints}'
+            self._savepoints += 1
+            self.conn.execute(f'SAVEPOINT {name}')
+            try:
+                yield
+            except BaseException:
+                self.conn.execute(f'ROLLBACK TO {name}')
+                self.conn.execute(f'RELEASE {name}')
+                raise
+            else:
+                self.conn.execute(f'RELEASE {name}')
+            finally:
+                self._savepoints -= 1
+
+    def reset(self):
+        with self.lock:
+            self.conn.execute('PRAGMA foreign_keys = OFF')
+            for table in TABLES:
+                self.conn.execute(f'DELETE FROM "{table}"')
+                if table in self.next_id:
+                    self.next_id[table] = 1
+            self.conn.execute('PRAGMA foreign_keys = ON')
+            self.users.clear()
+            self.files.clear()
+            self.queries = 0
+            self.row_writes.clear()
+
+
+_database = None
+_database_lock = threading.Lock()
+
+def _configured_path():
+    path = os.environ.get('LOCAL_DB_PATH')
+    if path is None:
+        try:
+            path = st.secrets.get('backend', {}).get('path')
+        except Exception:
+            path = None
+    return path or LOCAL_DB_PATH
+
+def get_database():
+    """Base de datos local del proceso (se crea en el primer uso)"""
+    global _database
+    with _database_lock:
+        if _database is None:
+            _database = LocalDatabase(_configured_path())
+        return _database
+
+
+# --- QUERY BUILDER ---
+
+class _Node:
+    """Un nivel del select: tabla, columnas, embebidos y sus propios filtros/orden"""
+
+    def __init__(self, table, key, inner=False):
+        self.table = table
+        self.key = key
+        self.inner = inner
+        self.columns = []
+        self.embeds = []
+        self.filters = [] # (columna, operador, valor)
+        self.orders = [] # (columna, desc, nullsfirst)
+
+    def child(self, key):
+        for e in self.embeds:
+            if e.key == key:
+                return e
+        raise LocalBackendError(f"'{key}' no está embebido en la consulta de '{self.table}'")
+
+
+def _split_top_level(text):
+    parts, depth, current = [], 0, []
+    for ch in text:
+        if ch == ',' and depth == 0:
+            parts.append(''.join(current))
+            current = []
+            continue
+        depth += (ch == '(') - (ch == ')')
+        current.append(ch)
+    parts.append(''.join(current))
+    return [p.strip() for p in parts if p.strip()]
+
+def _parse_select(table, text, key=None, inner=False):
+    node = _Node(table, key or table, inner)
+    for item in _split_top_level(text):
+        if '(' not in item:
+            node.columns.append(item)
+            continue
+        head, body = item.split('(', 1)
+        head = head.strip()
+        alias = None
+        if ':' in head:
+            alias, head = (s.strip() for s in head.split(':', 1))
+        name, _, hint = head.partition('!')
+        node.embeds.append(_parse_select(name, body.rsplit(')', 1)[0], alias or name, hint == 'inner'))
+    return node
+
+
+class LocalResponse:
+    """Misma forma que postgrest.APIResponse: .data y .count"""
+
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+    def __repr__(self):
+        return f"LocalResponse(data={len(self.data)} filas, count={self.count})"
+
+
+class LocalQuery:
+    """Imita el request builder de postgrest-py. execute() devuelve LocalResponse."""
+
+    def __init__(self, client, table):
+        self._db = client.db
+        self._table = table
+        self._action = None
+        self._node = _Node(table, table)
+        self._payload = None
+        self._count = None
+        self._returning = 'representation'
+        self._on_conflict = None
+        self._limit = None
+
+    # Acciones
+    def select(self, columns='*', count=None, **_):
+        self._action = 'select'
+        self._node = _parse_select(self._table, columns)
+        self._count = count
+        return self
+
+    def insert(self, json, *, count=None, returning=None, upsert=False, default_to_null=True, **_):
+        self._action = 'upsert' if upsert else 'insert'
+        self._payload = json if isinstance(json, list) else [json]
+        self._count = count
+        self._returning = getattr(returning, 'value', returning) or 'representation'
+        return self
+
+    def upsert(self, json, *, count=None, returning=None, on_conflict='', ignore_duplicates=False, **_):
+        self.insert(json, count=count, returning=returning, upsert=True)
+        self._on_conflict = on_conflict or None
+        return self
+
+    def update(self, json, *, count=None, returning=None, **_):
+        self._action = 'update'
+        self._payload = json
+        self._returning = getattr(returning, 'value', returning) or 'representation'
+        return self
+
+    def delete(self, *, count=None, returning=None, **_):
+        self._action = 'delete'
+        self._returning = getattr(returning, 'value', returning) or 'representation'
+        return self
+
+    # Filtros ('tabla_embebida.columna' filtra el embebido)
+    def _filter(self, column, op, value):
+        node = self._node
+        *path, col = column.split('.')
+        for key in path:
+            node = node.child(key)
+        node.filters.append((col, op, value))
+        return self
+
+    def eq(self, column, value): return self._filter(column, '=', value)
+    def neq(self, column, value): return self._filter(column, '<>', value)
+    def gt(self, column, value): return self._filter(column, '>', value)
+    def gte(self, column, value): return self._filter(column, '>=', value)
+    def lt(self, column, value): return self._filter(column, '<', value)
+    def lte(self, column, value): return self._filter(column, '<=', value)
+    def in_(self, column, values): return self._filter(column, 'in', list(values))
+    def is_(self, column, value): return self._filter(column, 'is', value)
+
+    def order(self, column, *, desc=False, nullsfirst=None, foreign_table=None):
+        node = self._node
+        for key in (foreign_table.split('.') if foreign_table else []):
+            node = node.child(key)
+        node.orders.append((column, desc, nullsfirst))
+        return self
+
+    def limit(self, size, *, foreign_table=None):
+        self._limit = size
+        return self
+
+    def execute(self):
+        return self._run()
+
+    def _run(self):
+        metrics.count_request()
+        with self._db.lock:
+            self._db.queries += 1
+            return self._dispatch()
+
+    def _dispatch(self):
+        """Ejecuta la consulta sin contarla como petición (las RPC la usan para sus pasos internos)"""
+        with self._db.lock:
+            if self._action == 'select':
+                return self._run_select()
+            if self._action in ('insert', 'upsert'):
+                return self._run_insert()
+            if self._action == 'update':
+                return self._run_update()
+            if self._action == 'delete':
+                return self._run_delete()
+            raise LocalBackendError("Consulta sin acción (select/insert/update/delete)")
+
+    # --- SQL ---
+
+    def _condition(self, column, op, value, params):
+        if op == 'in':
+            if not value:
+                return '0'
+            params.extend(_to_sql(v) for v in value)
+            return f'{column} IN ({", ".join("?" * len(value))})'
+        if op == 'is':
+            if value is None or str(value).lower() == 'null':
+                return f'{column} IS NULL'
+            params.append(_to_sql(value))
+            return f'{column} IS ?'
+        params.append(_to_sql(value))
+        return f'{column} {op} ?'
+
+    def _where(self, node, alias, params, counter):
+        clauses = [self._condition(f'{alias}."{c}"', op, v, params) for c, op, v in node.filters]
+        for child in node.embeds:
+            if not child.inner:
+                continue
+            fk, child_is_parent = _relation(node.table, child.table)
+            sub = f't{next(counter)}'
+            sub_where = self._where(child, sub, params, counter)
+            extra = ''.join(f' AND {w}' for w in sub_where)
+            if child_is_parent:
+                clauses.append(f'{alias}."{fk}" IN (SELECT {sub}.id FROM "{child.table}" {sub} WHERE 1{extra})')
+            else:
+                clauses.append(f'EXISTS (SELECT 1 FROM "{child.table}" {sub} WHERE {sub}."{fk}" = {alias}.id{extra})')
+        return clauses
+
+    @staticmethod
+    def _order_sql(node, alias):
+        parts = []
+        for col, desc, nullsfirst in node.orders:
+            nulls = nullsfirst if nullsfirst is not None else desc # Por defecto como Postgres
+            parts.append(f'{alias}."{col}" {"DESC" if desc else "ASC"} NULLS {"FIRST" if nulls else "LAST"}')
+        return (' ORDER BY ' + ', '.join(parts)) if parts else ''
+
+    def _fetch(self, node, extra_clause='', extra_params=(), limit=None):
+        """Filas de un nivel (sin proyectar) con sus embebidos ya resueltos"""
+        params = list(extra_params)
+        clauses = [extra_clause] if extra_clause else []
+        clauses += self._where(node, 't0', params, itertools.count(1))
+        sql = f'SELECT t0.* FROM "{node.table}" t0'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += self._order_sql(node, 't0')
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+        rows = [self._db.decode(node.table, r) for r in self._db.conn.execute(sql, params)]
+        for child in node.embeds:
+            rows = self._embed(node, rows, child)
+        return rows
+
+    def _embed(self, node, rows, child):
+        fk, child_is_parent = _relation(node.table, child.table)
+        key_col = fk if child_is_parent else 'id'
+        keys = list({r[key_col] for r in rows if r.get(key_col) is not None})
+        match_col = 'id' if child_is_parent else fk
+        found = []
+        for i in range(0, len(keys), SQL_IN_CHUNK):
+            chunk = keys[i:i + SQL_IN_CHUNK]
+            clause = f't0."{match_col}" IN ({", ".join("?" * len(chunk))})'
+            found += self._fetch(child, clause, [_to_sql(k) for k in chunk])
+        if len(keys) > SQL_IN_CHUNK and child.orders:
+            found = self._sort(found, child.orders)
+
+        if child_is_parent:
+            by_id = {r['id']: self._project(child, r) for r in found}
+            for r in rows:
+                r[child.key] = by_id.get(r.get(fk))
+        else:
+            grouped = {}
+            for r in found:
+                grouped.setdefault(r[fk], []).append(self._project(child, r))
+            for r in rows:
+                r[child.key] = grouped.get(r['id'], [])
+        if child.inner:
+            rows = [r for r in rows if r[child.key]]
+        return rows
+
+    @staticmethod
+    def _sort(rows, orders):
+        for col, desc, _ in reversed(orders):
+            rows.sort(key=lambda r: (r.get(col) is None, r.get(col)), reverse=desc)
+        return rows
+
+    @staticmethod
+    def _project(node, row):
+        if not node.columns or '*' in node.columns:
+            return row
+        keep = set(node.columns) | {e.key for e in node.embeds}
+        return {k: v for k, v in row.items() if k in keep}
+
+    def _run_select(self):
+        rows = self._fetch(self._node, limit=self._limit)
+        count = None
+        if self._count:
+            params = []
+            clauses = self._where(self._node, 't0', params, itertools.count(1))
+            sql = f'SELECT COUNT(*) FROM "{self._table}" t0' + (' WHERE ' + ' AND '.join(clauses) if clauses else '')
+            count = self._db.conn.execute(sql, params).fetchone()[0]
+        return LocalResponse([self._project(self._node, r) for r in rows], count)
+
+    def _matching_ids(self):
+        if self._node.embeds:
+            raise LocalBackendError("PostgREST no permite filtrar un UPDATE/DELETE por una tabla embebida")
+        params = []
+        clauses = self._where(self._node, 't0', params, itertools.count(1))
+        sql = f'SELECT t0.rowid FROM "{self._table}" t0' + (' WHERE ' + ' AND '.join(clauses) if clauses else '')
+        return [r[0] for r in self._db.conn.execute(sql, params)]
+
+    def _rows_by_rowid(self, rowids):
+        rows = []
+        for i in range(0, len(rowids), SQL_IN_CHUNK):
+            chunk = rowids[i:i + SQL_IN_CHUNK]
+            sql = f'SELECT * FROM "{self._table}" WHERE rowid IN ({", ".join("?" * len(chunk))}) ORDER BY rowid'
+            rows += [self._db.decode(self._table, r) for r in self._db.conn.execute(sql, chunk)]
+        return rows
+
+    def _run_insert(self):
+        db = self._db
+        spec = TABLES.get(self._table, {})
+        rows = []
+        for raw in self._payload:
+            row = {}
+            for col, default in spec.get('defaults', {}).items():
+                if col not in raw:
+                    row[col] = default() if callable(default) else default
+            row.update(raw)
+            if spec.get('identity', True) and row.get('id') is None:
+                row['id'] = db.next_id[self._table]
+                db.next_id[self._table] += 1
+            elif self._table in db.next_id and isinstance(row.get('id'), int):
+                db.next_id[self._table] = max(db.next_id[self._table], row['id'] + 1)
+            rows.append(row)
+        if not rows:
+            return LocalResponse([])
+        db.ensure_columns(self._table, rows)
+
+        columns = list(dict.fromkeys(c for r in rows for c in r))
+        sql = f'INSERT INTO "{self._table}" ({", ".join(f"{chr(34)}{c}{chr(34)}" for c in columns)}) ' \
+              f'VALUES ({", ".join("?" * len(columns))})'
+        if self._action == 'upsert':
+            conflict = self._on_conflict.split(',') if self._on_conflict else list(spec.get('unique') or ('id',))
+            updates = [c for c in columns if c not in conflict]
+            sql += f' ON CONFLICT ({", ".join(conflict)}) DO ' + \
+                   (('UPDATE SET ' + ', '.join(f'"{c}" = excluded."{c}"' for c in updates)) if updates else 'NOTHING')
+        try:
+            with db.transaction():
+                db.conn.executemany(sql, [[_to_sql(r.get(c)) for c in columns] for r in rows])
+        except sqlite3.Error as e:
+            raise LocalBackendError(str(e)) from e
+        db.row_writes[(self._table, 'insert')] += len(rows)
+
+        if self._returning == 'minimal':
+            return LocalResponse([])
+        if self._action == 'upsert':
+            keys = list(spec.get('unique') or ('id',)) if not self._on_conflict else self._on_conflict.split(',')
+            out = []
+            for r in rows:
+                where = ' AND '.join(f'"{k}" = ?' for k in keys)
+                found = db.conn.execute(f'SELECT * FROM "{self._table}" WHERE {where}', [_to_sql(r.get(k)) for k in keys]).fetchone()
+                if found is not None:
+                    out.append(db.decode(self._table, found))
+            return LocalResponse(out)
+        ids = [r['id'] for r in rows]
+        found = {}
+        for i in range(0, len(ids), SQL_IN_CHUNK):
+            chunk = ids[i:i + SQL_IN_CHUNK]
+            for r in db.conn.execute(f'SELECT * FROM "{self._table}" WHERE id IN ({", ".join("?" * len(chunk))})', chunk):
+                found[r['id']] = db.decode(self._table, r)
+        return LocalResponse([found[i] for i in ids if i in found])
+
+    def _run_update(self):
+        db = self._db
+        db.ensure_columns(self._table, [self._payload])
+        rowids = self._matching_ids()
+        if rowids and self._payload:
+            payload = dict(self._payload)
+            touch = TABLES.get(self._table, {}).get('touch')
+            if touch:
+                payload[touch] = _now()
+            cols = list(payload)
+            sets = ', '.join(f'"{c}" = ?' for c in cols)
+            values = [_to_sql(payload[c]) for c in cols]
+            try:
+                with db.transaction():
+                    for i in range(0, len(rowids), SQL_IN_CHUNK):
+                        chunk = rowids[i:i + SQL_IN_CHUNK]
+                        db.conn.execute(f'UPDATE "{self._table}" SET {sets} WHERE rowid IN ({", ".join("?" * len(chunk))})',
+                                        values + chunk)
+            except sqlite3.Error as e:
+                raise LocalBackendError(str(e)) from e
+            db.row_writes[(self._table, 'update')] += len(rowids)
+        return LocalResponse([] if self._returning == 'minimal' else self._rows_by_rowid(rowids))
+
+    def _run_delete(self):
+        db = self._db
+        rowids = self._matching_ids()
+        deleted = [] if self._returning == 'minimal' else self._rows_by_rowid(rowids)
+        try:
+            with db.transaction():
+                for i in range(0, len(rowids), SQL_IN_CHUNK):
+                    chunk = rowids[i:i + SQL_IN_CHUNK]
+                    db.conn.execute(f'DELETE FROM "{self._table}" WHERE rowid IN ({", ".join("?" * len(chunk))})', chunk)
+        except sqlite3.Error as e:
+            raise LocalBackendError(str(e)) from e
+        db.row_writes[(self._table, 'delete')] += len(rowids)
+        return LocalResponse(deleted)
+
+
+# --- FUNCIONES (RPC) ---
+# Equivalentes locales de las funciones SQL de supabase/migrations: mismo nombre, parámetros y filas devueltas.
+
+def _rpc_group_pending_balances(db, params):
+    """Saldo pendiente de cada miembro del grupo en una sola consulta agrupada (+ le deben, - debe)"""
+    rows = db.conn.execute('''
+        SELECT member AS user_id, SUM(amount) AS balance FROM (
+            SELECT e.paid_by AS member, s.amount_owed AS amount, s.id AS split_id, 0 AS side
+            FROM group_expense_splits s JOIN group_expenses e ON e.id = s.expense_id
+            WHERE e.group_id = ? AND s.is_settled = 0 AND s.user_id IS NOT e.paid_by
+            UNION ALL
+            SELECT s.user_id, -s.amount_owed, s.id, 1
+            FROM group_expense_splits s JOIN group_expenses e ON e.id = s.expense_id
+            WHERE e.group_id = ? AND s.is_settled = 0 AND s.user_id IS NOT e.paid_by
+            ORDER BY split_id, side
+        ) GROUP BY member''', (params['p_group_id'], params['p_group_id']))
+    return [dict(r) for r in rows]
+
+def _rpc_group_snapshot(db, params):
+    """Grupo con miembros, gastos y repartos (la misma forma que la consulta embebida) y sus balances pendientes"""
+    group_id = params['p_group_id']
+    rows = _rpc_step(db, 'groups') \
+        .select('*, group_members(id, user_id, leave_status, is_external, external_name, profiles(*)), '
+                'group_expenses(*, group_expense_splits(user_id, amount_owed, is_settled, settlement_requested))') \
+        .eq('id', group_id).order('date', desc=True, foreign_table='group_expenses')._dispatch().data
+    balances = {r['user_id']: r['balance'] for r in _rpc_group_pending_balances(db, params)}
+    return {'group': rows[0] if rows else None, 'balances': balances}
+
+def _rpc_step(db, table):
+    """Consulta interna de una RPC: comparte su transacción y no cuenta como petición aparte"""
+    return LocalClient(db).table(table)
+
+def _rpc_add_shared_expense(db, params):
+    """Movimiento (si paga un usuario real), ticket y repartos del gasto compartido, todo o nada"""
+    mov, group_id, members = params['p_movement'], params['p_group_id'], params['p_member_ids'] or []
+    if not members:
+        raise LocalBackendError("El reparto necesita al menos un participante")
+    paid_by = mov.get('paid_by_custom') or mov['user_id']
+    quantity = mov.get('quantity') or 0
+    movement_id = None
+    if not str(paid_by).startswith('ext_'):
+        movement_id = _rpc_step(db, 'user_imputs').insert({
+            'user_id': paid_by, 'quantity': mov.get('quantity'), 'type': mov.get('type'),
+            'category_id': mov.get('category_id'), 'date': mov.get('date'), 'notes': mov.get('notes'), 'group_id': group_id,
+        })._dispatch().data[0]['id']
+    expense_id = _rpc_step(db, 'group_expenses').insert({
+        'group_id': group_id, 'movement_id': movement_id, 'paid_by': paid_by,
+        'description': mov.get('notes') or 'Gasto compartido', 'total_amount': quantity,
+    })._dispatch().data[0]['id']
+    splits = _rpc_step(db, 'group_expense_splits').insert([
+        {'expense_id': expense_id, 'user_id': m, 'amount_owed': quantity / len(members), 'is_settled': False}
+        for m in members])._dispatch().data
+    return {'movement_id': movement_id, 'expense_id': expense_id,
+            'splits': [{'user_id': s['user_id'], 'amount_owed': s['amount_owed']} for s in splits]}
+
+def _rpc_update_shared_expense(db, params):
+    """Movimiento, ticket y repartos de un gasto editado, todo o nada; devuelve lo que había antes.
+    En el mismo grupo solo se tocan los repartos que cambian (como la función SQL)."""
+    mov, mov_id, new_group_id = params['p_movement'], params['p_movement_id'], params['p_new_group_id']
+    participants = params['p_participant_ids'] or []
+    quantity = mov.get('quantity') or 0
+    cuota = quantity / len(participants) if participants else 0
+    _rpc_step(db, 'user_imputs').update({
+        'quantity': mov.get('quantity'), 'type': mov.get('type'), 'category_id': mov.get('category_id'),
+        'date': mov.get('date'), 'notes': mov.get('notes'), 'group_id': new_group_id,
+    }).eq('id', mov_id)._dispatch()
+
+    old = _rpc_step(db, 'group_expenses').select('id, group_id, paid_by').eq('movement_id', mov_id).limit(1)._dispatch().data
+    old = old[0] if old else None
+    diff, expense_id, inserted = None, None, []
+    if old and old['group_id'] == new_group_id:
+        expense_id = old['id']
+        _rpc_step(db, 'group_expenses').update({'description': mov.get('notes'), 'total_amount': quantity}) \
+            .eq('id', expense_id)._dispatch()
+        existing = _rpc_step(db, 'group_expense_splits').select('id, user_id, amount_owed, is_settled') \
+            .eq('expense_id', expense_id).order('id')._dispatch().data
+        kept, deleted = set(), []
+        for s in existing:
+            if s['user_id'] in kept or s['user_id'] not in participants:
+                deleted.append(s)
+            else:
+                kept.add(s['user_id'])
+        updated = [s for s in existing if s not in deleted and abs(s['amount_owed'] - cuota) >= 0.005]
+        if deleted:
+            _rpc_step(db, 'group_expense_splits').delete().in_('id', [s['id'] for s in deleted])._dispatch()
+        if updated:
+            _rpc_step(db, 'group_expense_splits').update({'amount_owed': cuota, 'is_settled': False, 'settlement_requested': False}) \
+                .in_('id', [s['id'] for s in updated])._dispatch()
+        inserted = [p for p in dict.fromkeys(participants) if p not in kept]
+        diff = {'insert': inserted, 'delete': deleted, 'update': updated}
+    else:
+        if old:
+            _rpc_step(db, 'group_expenses').delete().eq('id', old['id'])._dispatch()
+        if new_group_id is not None:
+            expense_id = _rpc_step(db, 'group_expenses').insert({
+                'group_id': new_group_id, 'movement_id': mov_id, 'paid_by': mov.get('user_id'),
+                'description': mov.get('notes'), 'total_amount': quantity,
+            })._dispatch().data[0]['id']
+            inserted = participants
+    if expense_id is not None and inserted:
+        _rpc_step(db, 'group_expense_splits').insert([
+            {'expense_id': expense_id, 'user_id': p, 'amount_owed': cuota, 'is_settled': False}
+            for p in inserted])._dispatch()
+    return {'old_expense': old, 'split_diff': diff, 'expense_id': expense_id}
+
+def _rpc_settle_debt_between_users(db, params):
+    """Salda los repartos pendientes entre dos miembros y reduce el gasto de quien cobra por el NETO, todo o nada"""
+    group_id, creditor, debtor = params['p_group_id'], params['p_creditor_id'], params['p_debtor_id']
+    pending = _rpc_step(db, 'group_expense_splits') \
+        .select('id, user_id, amount_owed, group_expenses!inner(group_id, paid_by, movement_id)') \
+        .in_('user_id', [debtor, creditor]).eq('group_expenses.group_id', group_id) \
+        .in_('group_expenses.paid_by', [creditor, debtor]).eq('is_settled', False).order('id')._dispatch().data
+    settled = [{'id': r['id'], 'user_id': r['user_id'], 'paid_by': r['group_expenses']['paid_by'],
+                'amount_owed': r['amount_owed'], 'movement_id': r['group_expenses']['movement_id']}
+               for r in pending if r['user_id'] != r['group_expenses']['paid_by']]
+    if settled:
+        _rpc_step(db, 'group_expense_splits').update({'is_settled': True, 'settlement_requested': False}) \
+            .in_('id', [s['id'] for s in settled])._dispatch()
+
+    left = sum(s['amount_owed'] if s['user_id'] == debtor else -s['amount_owed'] for s in settled)
+    changed = []
+    if left > 0:
+        mov_ids = list(dict.fromkeys(s['movement_id'] for s in settled if s['user_id'] == debtor and s['movement_id']))
+        quantities = {m['id']: m['quantity'] for m in
+                      _rpc_step(db, 'user_imputs').select('id, quantity').in_('id', mov_ids)._dispatch().data}
+        for mov_id in mov_ids:
+            if left <= 0.01: break
+            if mov_id not in quantities: continue
+            new_qty = quantities[mov_id] - left if quantities[mov_id] > left else 0
+            left -= quantities[mov_id] - new_qty
+            _rpc_step(db, 'user_imputs').update({'quantity': new_qty}).eq('id', mov_id)._dispatch()
+            changed.append(mov_id)
+    return {'settled_splits': settled, 'changed_movements': changed}
+
+def _rpc_request_settlement(db, params):
+    """Marca settlement_requested en los repartos pendientes del deudor con el acreedor (un solo UPDATE)"""
+    with db.transaction():
+        cur = db.conn.execute('''
+            UPDATE group_expense_splits SET settlement_requested = 1
+            WHERE is_settled = 0 AND user_id = ? AND expense_id IN (
+                SELECT id FROM group_expenses WHERE group_id = ? AND paid_by = ?)
+            RETURNING id''', (params['p_debtor_id'], params['p_group_id'], params['p_creditor_id']))
+        ids = [r[0] for r in cur.fetchall()]
+    db.row_writes[('group_expense_splits', 'update')] += len(ids)
+    return ids
+
+RPC_FUNCTIONS = {
+    'group_pending_balances': _rpc_group_pending_balances,
+    'group_snapshot': _rpc_group_snapshot,
+    'add_shared_expense': _rpc_add_shared_expense,
+    'update_shared_expense': _rpc_update_shared_expense,
+    'settle_debt_between_users': _rpc_settle_debt_between_users,
+    'request_settlement': _rpc_request_settlement,
+}
+
+
+class LocalRpc:
+    """Imita client.rpc(nombre, parámetros).execute() de postgrest-py"""
+
+    def __init__(self, client, name, params):
+        if name not in RPC_FUNCTIONS:
+            raise LocalBackendError(f"La función '{name}' no existe")
+        self._db = client.db
+        self._name = name
+        self._params = params or {}
+
+    def execute(self):
+        return self._run()
+
+    def _run(self):
+        metrics.count_request()
+        with self._db.lock:
+            self._db.queries += 1
+            with self._db.transaction(): # Si un paso falla no queda nada escrito, como en Postgres
+                return LocalResponse(RPC_FUNCTIONS[self._name](self._db, self._params))
+
+
+# --- AUTH Y STORAGE (lo justo para los flujos de la app) ---
+
+class LocalAuth:
+    """Usuarios en memoria; la sesión es del cliente (como en supabase-py, un cliente por sesión de Streamlit)"""
+
+    def __init__(self, db):
+        self._db = db
+        self._session = None
+
+    @staticmethod
+    def _user(record):
+        return SimpleNamespace(id=record['id'], email=record['email'])
+
+    def _start(self, record):
+        user = self._user(record)
+        self._session = SimpleNamespace(user=user, access_token=f"local-{record['id']}", refresh_token=None)
+        return SimpleNamespace(user=user, session=self._session)
+
+    def sign_up(self, credentials):
+        email = credentials['email'].lower().strip()
+        with self._db.lock:
+            if email in self._db.users:
+                raise LocalBackendError("User already registered")
+            record = {'id': str(uuid.uuid4()), 'email': email, 'password': credentials['password']}
+            self._db.users[email] = record
+        return self._start(record)
+
+    def sign_in_with_password(self, credentials):
+        record = self._db.users.get(credentials['email'].lower().strip())
+        if record is None or record['password'] != credentials['password']:
+            raise LocalBackendError("Invalid login credentials")
+        return self._start(record)
+
+    def get_session(self):
+        return self._session
+
+    def get_user(self, jwt=None):
+        return SimpleNamespace(user=self._session.user) if self._session else None
+
+    def sign_out(self, options=None):
+        self._session = None
+
+    def reset_password_email(self, email, options=None):
+        pass # Sin correo en local
+
+    def update_user(self, attributes):
+        if self._session is None:
+            raise LocalBackendError("Auth session missing!")
+        record = self._db.users[self._session.user.email]
+        if 'password' in attributes:
+            record['password'] = attributes['password']
+        return SimpleNamespace(user=self._session.user)
+
+    def exchange_code_for_session(self, params):
+        raise LocalBackendError("Los enlaces de correo no existen en el backend local")
+
+
+class _LocalBucket:
+    def __init__(self, db, bucket):
+        self._db = db
+        self._bucket = bucket
+
+    def upload(self, path, file, file_options=None):
+        self._db.files[(self._bucket, path)] = bytes(file)
+        return SimpleNamespace(path=path)
+
+    def get_public_url(self, path, options=None):
+        return f"local://{self._bucket}/{path}"
+
+
+class LocalStorage:
+    def __init__(self, db):
+        self._db = db
+
+    def from_(self, bucket):
+        return _LocalBucket(self._db, bucket)
+
+
+# --- CLIENTE ---
+
+class LocalClient:
+    """Sustituto de supabase.Client para la app: table/from_, auth y storage sobre la base local"""
+
+    def __init__(self, db=None):
+        self.db = db or get_database()
+        self.auth = LocalAuth(self.db)
+        self.storage = LocalStorage(self.db)
+
+    def table(self, name):
+        return LocalQuery(self, name)
+
+    def from_(self, name):
+        return LocalQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return LocalRpc(self, name, params)
@@ -1,19 +1,29 @@
 import streamlit as st
 import pandas as pd
 import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from streamlit_option_menu import option_menu 
 from streamlit_cookies_controller import CookieController
 
 # IMPORTANTE: He añadido 'change_password' y 'supabase' a las importaciones
 from database import (init_db, login_user, register_user, recover_password, 
                       get_user_profile, get_transactions, get_categories, 
-                      change_password, supabase, upsert_profile)
+                      change_password, supabase, upsert_profile, get_supabase_client, bind_session_client,
+                      get_transactions_delta, count_transactions, get_transaction_ids,
+                      mark_transactions_changed, take_transactions_changes, transactions_cursor,
+                      TX_FULL_RESYNC_SECONDS, TX_POLL_SECONDS)
+import cache
+import metrics
+from ledger import Ledger
 from styles import get_custom_css
 
 # Importaciones unificadas
 from views import render_dashboard, render_categories, render_profile, render_import, render_main_dashboard
 from views_groups import render_groups
+from views_admin import show_metrics_panel, render_metrics_panel
 
 # 1. Configuración de página
 st.set_page_config(page_title="Finanzas", page_icon="💰", layout="wide", initial_sidebar_state="expanded")
@@ -60,6 +70,99 @@ def reset_captcha():
     st.session_state.captcha_n1 = random.randint(1, 10)
     st.session_state.captcha_n2 = random.randint(1, 10)
 
+# Un candado por usuario: sus sesiones comparten la entrada de caché y no deben fusionar deltas a la vez
+_ledger_locks = {}
+_ledger_locks_guard = threading.Lock()
+
+def _ledger_lock(user_id):
+    with _ledger_locks_guard:
+        return _ledger_locks.setdefault(user_id, threading.Lock())
+
+def _full_transactions_state(user_id):
+    df = get_transactions(user_id)
+    ledger = Ledger.from_frame(df)
+    state = {
+        'ledger': ledger,
+        'cursor': transactions_cursor(df),
+        'checked_at': time.monotonic(),
+        'pending': {'dirty': False, 'changed': set(), 'deleted': set(), 'full': False},
+    }
+    # La caducidad de la entrada hace de recarga completa periódica (red de seguridad)
+    if not df.empty:
+        cache.put('transactions', user_id, state, ttl=TX_FULL_RESYNC_SECONDS)
+    return ledger
+
+def _drop_missing(user_id, ledger):
+    """Si el recuento de la base no cuadra con la caché, alguien borró movimientos fuera: quitamos los que faltan"""
+    if count_transactions(user_id) == len(ledger):
+        return ledger
+    gone = {str(i) for i in ledger.ids} - {str(i) for i in get_transaction_ids(user_id)}
+    return ledger.merge(pd.DataFrame(), gone) if gone else ledger
+
+def load_ledger(user_id):
+    """Movimientos cacheados por usuario en formato compacto (compartidos entre sus sesiones).
+    Se piden solo los creados o modificados después del cursor updated_at: al momento si este proceso ha
+    apuntado cambios y, si no, como mucho cada TX_POLL_SECONDS (cambios desde otros dispositivos)."""
+    with _ledger_lock(user_id):
+        state = cache.get('transactions', user_id)
+        if state is None:
+            return _full_transactions_state(user_id)
+
+        changes = take_transactions_changes(user_id)
+        if changes['full']:
+            return _full_transactions_state(user_id)
+        if not changes['dirty'] and time.monotonic() - state['checked_at'] < TX_POLL_SECONDS:
+            return state['ledger']
+
+        try:
+            delta = get_transactions_delta(user_id, since=state['cursor'])
+            ledger = state['ledger']
+            if not delta.empty or changes['deleted']:
+                ledger = ledger.merge(delta, changes['deleted'])
+            ledger = _drop_missing(user_id, ledger)
+        except Exception as e:
+            print(f"Error en la carga incremental, se reintentará: {e}")
+            # Devolvemos los cambios a la cola para no perderlos en el próximo rerun
+            mark_transactions_changed(user_id, changes['changed'], changes['deleted'])
+            return state['ledger']
+
+        state['ledger'] = ledger
+        state['cursor'] = transactions_cursor(delta) or state['cursor']
+        state['checked_at'] = time.monotonic()
+        return ledger
+
+PREFETCH_WORKERS = 4
+MENU_KEY = 'menu_principal' # Página seleccionada en st.session_state
+
+def prefetch(tasks, defaults):
+    """Lanza a la vez las lecturas independientes del rerun: la página espera a la más lenta, no a la suma.
+    tasks: {nombre: (función, arg1, arg2...)}. Devuelve {nombre: resultado}; si una lectura falla se apunta
+    y se usa su valor de defaults, sin tumbar el rerun ni las demás lecturas."""
+    ctx = get_script_run_ctx()
+    # El cliente de la sesión se lee aquí, en el hilo del script: los hilos lo reciben fijado y no tocan st.session_state
+    client = get_supabase_client()
+    def init():
+        add_script_run_ctx(threading.current_thread(), ctx) # Para que los st.error de las funciones de datos se pinten
+        bind_session_client(client)
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(PREFETCH_WORKERS, len(tasks)), initializer=init) as pool:
+        futures = {name: pool.submit(fn, *args) for name, (fn, *args) in tasks.items()}
+        for name, f in futures.items():
+            try:
+                results[name] = f.result()
+            except Exception as e:
+                print(f"Error en la lectura '{name}' del prefetch: {e}")
+                results[name] = defaults.get(name)
+    return results
+
+def _session_email():
+    """Email del usuario de la sesión (usando la lógica segura)"""
+    session_user = get_supabase_client().auth.get_user()
+    try:
+        return session_user.user.email
+    except AttributeError:
+        return session_user.data.user.email if hasattr(session_user, 'data') else None
+
 def main():
     # --- LA MAGIA: INTERCEPTAR ENLACES DEL CORREO ---
     if "code" in st.query_params:
@@ -91,8 +194,26 @@ def main():
     if st.session_state.user:
         user_profile = st.session_state.user
         user_id = user_profile['id']
-        df_all = get_transactions(user_id)
-        current_cats = get_categories(user_id)
+        from database_groups import get_total_user_debt
+        
+        # --- PREFETCH: lecturas independientes en paralelo ---
+        user_email = _session_email() # En el hilo del script, antes de lanzar los hilos
+        tareas = {
+            'ledger': (load_ledger, user_id),
+            'cats': (get_categories, user_id),
+        }
+        if user_email:
+            from database_groups import get_invitations_count
+            tareas['invitaciones'] = (get_invitations_count, user_email)
+        # La deuda de grupos solo la pinta el Resumen: se pide solo si es la página que se va a mostrar
+        # (el menú aún no se ha pintado, pero con su key la selección ya está en session_state)
+        if (st.session_state.get(MENU_KEY) or "Resumen") == "Resumen":
+            tareas['deuda'] = (get_total_user_debt, user_id)
+        datos = prefetch(tareas, defaults={'ledger': Ledger.from_frame(pd.DataFrame()), 'cats': [], 'invitaciones': 0})
+        ledger = datos['ledger']
+        df_all = ledger.to_frame() # Vista DataFrame para las pantallas existentes
+        current_cats = datos['cats']
+        n_invites = datos.get('invitaciones', 0)
         
         # --- NUEVO POP-UP PARA CAMBIAR CONTRASEÑA DIRECTAMENTE ---
         if st.session_state.get("show_recovery_dialog"):
@@ -129,18 +250,6 @@ def main():
             recovery_dialog()
         
         # --- BARRA LATERAL ---
-        from database_groups import get_invitations_count
-                
-        # Obtenemos el email (usando la lógica segura)
-        session_user = st.session_state.supabase_client.auth.get_user()
-        try:
-            user_email = session_user.user.email
-        except AttributeError:
-            user_email = session_user.data.user.email if hasattr(session_user, 'data') else None
-        
-        # Contamos las invitaciones
-        n_invites = get_invitations_count(user_email) if user_email else 0
-                
         # Personalizamos la etiqueta del menú
         label_grupos = f"Grupos {'🔴' if n_invites > 0 else ''}"
         
@@ -173,7 +282,8 @@ def main():
                     "icon": {"color": i_color, "font-size": "18px"}, 
                     "nav-link": {"font-size": "16px", "text-align": "left", "margin": "0px", "--hover-color": "#eee"},
                     "nav-link-selected": {"background-color": p_color},
-                }
+                },
+                key=MENU_KEY,
             )
             
             st.divider()
@@ -186,17 +296,22 @@ def main():
                 st.rerun()
 
         # --- ENRUTAMIENTO ---
-        if selected == "Resumen": render_main_dashboard(df_all, user_profile)
-        elif selected == "Movimientos": render_dashboard(df_all, current_cats, user_id)
+        if selected == "Resumen": render_main_dashboard(df_all, user_profile, ledger.cube, ledger.balance,
+                                                          datos['deuda'] if datos.get('deuda') is not None else get_total_user_debt(user_id))
+        elif selected == "Movimientos": render_dashboard(df_all, current_cats, user_id, ledger.cube)
         elif selected == "Categorías": render_categories(current_cats)
         elif selected == label_grupos:  
             if user_email:
-                render_groups(user_id, user_email)
+                render_groups(user_id, user_email, current_cats)
             else:
                 st.error("No se pudo recuperar tu email de sesión. Intenta cerrar sesión y volver a entrar.")
-        elif selected == "Importar": render_import(current_cats, user_id)
+        elif selected == "Importar": render_import(current_cats, user_id, ledger)
         elif selected == "Perfil": render_profile(user_id, user_profile)
 
+        # --- PANEL DE RENDIMIENTO (oculto: solo administradores con ?perf=1 en la URL) ---
+        if show_metrics_panel(user_email):
+            render_metrics_panel()
+
     # --- FLUJO DE USUARIO NO LOGUEADO ---
     else:
         c1, c2, c3 = st.columns([1, 2, 1])
@@ -309,4 +424,6 @@ def main():
                                 reset_captcha()
 
 if __name__ == "__main__":
-    main()
+    metrics.start_exporter() # Solo si hay METRICS_PORT
+    with metrics.rerun():
+        main()
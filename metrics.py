@@ -0,0 +1,332 @@
+# metrics.py
+# Instrumentación de las funciones de datos (database, database_groups) y de las vistas render_*.
+# De cada llamada se apunta la latencia, las filas devueltas y las peticiones/bytes que ha hecho, y se agrega
+# en tres niveles: el rerun de la sesión (la cascada del panel de administración), la sesión y el proceso
+# entero (exportable en el formato de texto de Prometheus para ver qué pantallas son lentas en producción).
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Segundos (histograma de Prometheus)
+MAX_SESSIONS = 200 # Sesiones con traza guardada; al pasarnos se olvida la menos reciente (LRU)
+MAX_RERUN_EVENTS = 500 # Llamadas apuntadas por rerun (las demás solo cuentan en los agregados)
+METRICS_PREFIX = 'finanzas'
+
+
+class _Stat:
+    """Agregado de una función: llamadas, errores, tiempo total/máximo, filas, peticiones, bytes e histograma"""
+    __slots__ = ('calls', 'errors', 'seconds', 'max_seconds', 'rows', 'requests', 'bytes', 'buckets')
+
+    def __init__(self):
+        self.calls = self.errors = self.rows = self.requests = self.bytes = 0
+        self.seconds = self.max_seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def add(self, seconds, rows, requests, nbytes, error):
+        self.calls += 1
+        self.errors += error
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.rows += rows or 0
+        self.requests += requests
+        self.bytes += nbytes
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def as_dict(self):
+        return {'calls': self.calls, 'errors': self.errors, 'total_ms': self.seconds * 1000,
+                'avg_ms': (self.seconds / self.calls * 1000) if self.calls else 0.0, 'max_ms': self.max_seconds * 1000,
+                'rows': self.rows, 'requests': self.requests, 'bytes': self.bytes}
+
+
+class _SessionTrace:
+    """Llamadas del rerun en curso y del último terminado, y agregados de toda la sesión"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.events = []
+        self.last_events = []
+        self.last_ms = None
+        self.reruns = 0
+        self.stats = {}
+
+
+_lock = threading.Lock()
+_process_stats = {} # (tipo, nombre) -> _Stat
+_sessions = OrderedDict() # session_id -> _SessionTrace
+_local = threading.local() # Profundidad de anidamiento y contador de peticiones de cada hilo
+
+
+# --- CONTADORES POR HILO ---
+# Los transportes (http_pool, local_backend) apuntan aquí cada petición; la llamada instrumentada
+# resta el contador antes y después para saber cuántas peticiones y bytes ha costado.
+
+class RequestCounter:
+    __slots__ = ('requests', 'bytes')
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+
+def request_counter():
+    """Contador del hilo actual. Se recoge al empezar la petición: el cuerpo puede leerse más tarde."""
+    counter = getattr(_local, 'counter', None)
+    if counter is None:
+        counter = _local.counter = RequestCounter()
+    return counter
+
+def count_request(nbytes=0, counter=None):
+    counter = counter or request_counter()
+    counter.requests += 1
+    counter.bytes += nbytes
+
+
+# --- REGISTRO ---
+
+def _session_id():
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else None
+
+def _session(session_id):
+    """Traza de la sesión (con el lock tomado)"""
+    trace = _sessions.get(session_id)
+    if trace is None:
+        trace = _sessions[session_id] = _SessionTrace()
+        if len(_sessions) > MAX_SESSIONS:
+            _sessions.popitem(last=False)
+    else:
+        _sessions.move_to_end(session_id)
+    return trace
+
+def _rows(result):
+    """Filas de un resultado: listas y DataFrames por longitud, un registro (dict con id) cuenta como una"""
+    if result is None or isinstance(result, (bool, int, float, str, bytes, tuple)):
+        return None
+    if isinstance(result, dict):
+        return 1 if 'id' in result else len(result)
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+def record(kind, name, started, ended, rows=None, requests=0, nbytes=0, error=False, depth=0):
+    seconds = ended - started
+    session_id = _session_id()
+    with _lock:
+        key = (kind, name)
+        stat = _process_stats.get(key)
+        if stat is None:
+            stat = _process_stats[key] = _Stat()
+        stat.add(seconds, rows, requests, nbytes, error)
+        if session_id is None:
+            return
+        trace = _session(session_id)
+        per_session = trace.stats.get(key)
+        if per_session is None:
+            per_session = trace.stats[key] = _Stat()
+        per_session.add(seconds, rows, requests, nbytes, error)
+        if len(trace.events) < MAX_RERUN_EVENTS:
+            trace.events.append({
+                'kind': kind, 'name': name, 'depth': depth, 'thread': threading.current_thread().name,
+                'start_ms': (started - trace.started) * 1000, 'duration_ms': seconds * 1000,
+                'rows': rows, 'requests': requests, 'bytes': nbytes, 'error': error,
+            })
+
+class _Timing:
+    __slots__ = ('rows',)
+
+    def __init__(self):
+        self.rows = None
+
+@contextmanager
+def timer(kind, name):
+    """Mide un tramo de código como una llamada más (anidada en la función medida que lo contenga).
+    Las filas se apuntan en el objeto que devuelve: with timer('x', 'y') as t: ...; t.rows = n.
+    Las excepciones de control de Streamlit (st.rerun, st.stop) heredan de BaseException y no cuentan como error."""
+    depth = getattr(_local, 'depth', 0)
+    counter = request_counter()
+    requests, nbytes = counter.requests, counter.bytes
+    timing, error = _Timing(), False
+    _local.depth = depth + 1
+    started = time.perf_counter()
+    try:
+        yield timing
+    except Exception:
+        error = True
+        raise
+    finally:
+        ended = time.perf_counter()
+        _local.depth = depth
+        record(kind, name, started, ended, timing.rows, counter.requests - requests,
+               counter.bytes - nbytes, error, depth)
+
+def instrument(fn, kind, name=None):
+    """Envuelve fn para medir cada llamada (con timer)"""
+    name = name or fn.__name__
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with timer(kind, name) as timing:
+            result = fn(*args, **kwargs)
+            timing.rows = _rows(result)
+            return result
+    wrapper.instrumented = fn
+    return wrapper
+
+def instrument_module(namespace, kind, names=None, skip=()):
+    """Instrumenta en el sitio las funciones públicas definidas en el módulo (o solo las de names).
+    Se llama al final del módulo, antes de que otros hagan 'from modulo import ...'. Los generadores se saltan:
+    solo mediríamos su creación, y sus peticiones ya cuentan en la llamada que los recorre."""
+    module = namespace['__name__']
+    if names is None:
+        names = [n for n, obj in namespace.items()
+                 if inspect.isfunction(obj) and obj.__module__ == module and not n.startswith('_') and n not in skip
+                 and not inspect.isgeneratorfunction(obj)]
+    for n in names:
+        if not hasattr(namespace[n], 'instrumented'):
+            namespace[n] = instrument(namespace[n], kind)
+
+@contextmanager
+def rerun():
+    """Delimita un rerun de la sesión: al terminar (también con st.rerun) pasa a ser el último completo"""
+    session_id = _session_id()
+    if session_id is None:
+        yield
+        return
+    with _lock:
+        trace = _session(session_id)
+        trace.started = time.perf_counter()
+        trace.events = []
+    try:
+        yield
+    finally:
+        ended = time.perf_counter()
+        with _lock:
+            trace.last_events = trace.events
+            trace.last_ms = (ended - trace.started) * 1000
+            trace.reruns += 1
+            trace.events = []
+            trace.started = ended
+
+
+# --- CONSULTA ---
+
+def _stats_rows(stats):
+    rows = [{'kind': kind, 'name': name, **stat.as_dict()} for (kind, name), stat in stats.items()]
+    return sorted(rows, key=lambda r: r['total_ms'], reverse=True)
+
+def session_report():
+    """Cascada del último rerun completo, llamadas del rerun en curso y agregados de la sesión actual"""
+    session_id = _session_id()
+    with _lock:
+        trace = _sessions.get(session_id)
+        if trace is None:
+            return {'reruns': 0, 'last_rerun_ms': None, 'last_rerun': [], 'current_rerun': [], 'functions': []}
+        return {
+            'reruns': trace.reruns,
+            'last_rerun_ms': trace.last_ms,
+            'last_rerun': list(trace.last_events),
+            'current_rerun': list(trace.events),
+            'functions': _stats_rows(trace.stats),
+        }
+
+def process_report():
+    """Agregados de todas las sesiones del proceso, de la función más costosa (tiempo total) a la que menos"""
+    with _lock:
+        return {'sessions': len(_sessions), 'functions': _stats_rows(_process_stats)}
+
+def reset():
+    with _lock:
+        _process_stats.clear()
+        _sessions.clear()
+
+
+# --- EXPORTACIÓN (PROMETHEUS) ---
+
+def _labels(kind, name):
+    return f'kind="{kind}",name="{name}"'
+
+def prometheus_text():
+    """Agregados del proceso, el pool HTTP y la caché en el formato de texto de Prometheus (versión 0.0.4)"""
+    import cache
+    import http_pool
+
+    p = METRICS_PREFIX
+    with _lock:
+        stats = list(_process_stats.items())
+    lines = [f'# HELP {p}_call_duration_seconds Latencia de las funciones de datos y vistas',
+             f'# TYPE {p}_call_duration_seconds histogram']
+    for (kind, name), s in stats:
+        labels = _labels(kind, name)
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS, s.buckets):
+            cumulative += n
+            lines.append(f'{p}_call_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{p}_call_duration_seconds_bucket{{{labels},le="+Inf"}} {s.calls}')
+        lines.append(f'{p}_call_duration_seconds_sum{{{labels}}} {s.seconds:.6f}')
+        lines.append(f'{p}_call_duration_seconds_count{{{labels}}} {s.calls}')
+    for metric, attr, help_text in [('call_errors_total', 'errors', 'Llamadas terminadas con excepción'),
+                                    ('call_rows_total', 'rows', 'Filas devueltas'),
+                                    ('call_requests_total', 'requests', 'Peticiones a la base de datos'),
+                                    ('call_bytes_total', 'bytes', 'Bytes recibidos por HTTP')]:
+        lines += [f'# HELP {p}_{metric} {help_text}', f'# TYPE {p}_{metric} counter']
+        lines += [f'{p}_{metric}{{{_labels(kind, name)}}} {getattr(s, attr)}' for (kind, name), s in stats]
+
+    pool = http_pool.pool_stats()
+    for key in ['open_connections', 'idle_connections', 'in_use', 'waiting']:
+        lines += [f'# TYPE {p}_http_pool_{key} gauge', f'{p}_http_pool_{key} {pool[key]}']
+    lines += [f'# TYPE {p}_http_pool_requests_total counter', f'{p}_http_pool_requests_total {pool["requests"]}',
+              f'# TYPE {p}_http_pool_waited_requests_total counter', f'{p}_http_pool_waited_requests_total {pool["waited_requests"]}']
+
+    cache_stats = cache.stats()
+    lines += [f'# TYPE {p}_cache_entries gauge', f'{p}_cache_entries {cache_stats["size"]}']
+    for event in ['hits', 'misses', 'evictions', 'expirations', 'invalidations']:
+        lines.append(f'# TYPE {p}_cache_{event}_total counter')
+        lines += [f'{p}_cache_{event}_total{{kind="{kind}"}} {per_kind[event]}' for kind, per_kind in cache_stats['by_kind'].items()]
+    return '\n'.join(lines) + '\n'
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+def start_exporter(port=None):
+    """Sirve /metrics para que Prometheus lo recoja. Sin puerto se lee METRICS_PORT; si no está, no hace nada.
+    Se puede llamar en cada rerun: el servidor se arranca una sola vez por proceso."""
+    global _exporter
+    port = port or os.environ.get('METRICS_PORT')
+    if not port:
+        return None
+    with _exporter_lock:
+        if _exporter is None:
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?')[0] != '/metrics':
+                        self.send_error(404)
+                        return
+                    body = prometheus_text().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            try:
+                _exporter = ThreadingHTTPServer(('0.0.0.0', int(port)), Handler)
+            except OSError as e:
+                print(f"No se pudo abrir el puerto de métricas {port}: {e}")
+                _exporter = False # No lo reintentamos en cada rerun
+                return None
+            threading.Thread(target=_exporter.serve_forever, name='metrics-exporter', daemon=True).start()
+        return _exporter or None
@@ -0,0 +1,133 @@
+# settlements.py
+# Liquidación de un grupo con el mínimo de transferencias, en céntimos enteros (sin deriva de redondeo).
+# 1. Los saldos se pasan a céntimos repartiendo el resto del redondeo para que sumen exactamente cero.
+# 2. Deudor y acreedor con el mismo importe se liquidan con una transferencia directa.
+# 3. Con pocos miembros pendientes se busca la partición en el máximo de subconjuntos que suman cero
+#    (cada subconjunto de k miembros se liquida con k-1 transferencias: es el óptimo), con un tiempo máximo.
+# 4. Si son muchos o se agota el tiempo, emparejamos de mayor a mayor importe (nunca más de n-1 transferencias).
+import heapq
+import time
+from dataclasses import dataclass, field
+
+import metrics
+
+SUBSET_MAX_MEMBERS = 14 # Hasta cuántos miembros pendientes probamos la búsqueda óptima (2^n subconjuntos)
+SUBSET_TIME_BUDGET = 0.05 # Segundos como mucho para la búsqueda óptima antes de pasar al emparejamiento voraz
+_DEADLINE_CHECK = 1024 # Cada cuántos subconjuntos miramos el reloj
+
+
+@dataclass
+class SettlementPlan:
+    """Transferencias para dejar el grupo a cero, más cómo y en cuánto tiempo se han calculado"""
+    transfers: list = field(default_factory=list) # [{'from', 'to', 'amount'}] en euros con 2 decimales
+    optimal: bool = True # False si no hubo búsqueda óptima (muchos miembros o se agotó el tiempo)
+    method: str = 'exacta' # 'exacta' (solo parejas), 'subconjuntos' o 'voraz'
+    elapsed_ms: float = 0.0
+
+    def __len__(self):
+        return len(self.transfers)
+
+
+def to_cents(balances):
+    """{miembro: saldo en euros} -> {miembro: céntimos} que suman exactamente 0.
+    El descuadre del redondeo se reparte entre los que más se han redondeado (restos mayores)."""
+    exact = {m: float(a) * 100 for m, a in balances.items()}
+    cents = {m: round(v) for m, v in exact.items()}
+    residual = sum(cents.values())
+    if residual:
+        step = -1 if residual > 0 else 1
+        # Si sobra, quitamos a los que se redondearon más hacia arriba; si falta, sumamos a los de más hacia abajo
+        order = sorted(cents, key=lambda m: (exact[m] - cents[m]) * step, reverse=True)
+        for m in order[:abs(residual)]:
+            cents[m] += step
+    return {m: c for m, c in cents.items() if c}
+
+def _transfer(debtor, creditor, cents):
+    return {'from': debtor, 'to': creditor, 'amount': round(cents / 100, 2)}
+
+def _exact_pairs(cents, transfers):
+    """Liquida deudor-acreedor con el mismo importe; devuelve los miembros que quedan pendientes"""
+    creditors = {}
+    for m, c in sorted(cents.items(), key=lambda x: str(x[0])):
+        if c > 0:
+            creditors.setdefault(c, []).append(m)
+    paired = set()
+    for m, c in sorted(cents.items(), key=lambda x: (x[1], str(x[0]))):
+        if c < 0 and creditors.get(-c):
+            creditor = creditors[-c].pop()
+            transfers.append(_transfer(m, creditor, -c))
+            paired.update((m, creditor))
+    return {m: c for m, c in cents.items() if m not in paired}
+
+def _greedy(cents, transfers):
+    """Mayor deudor paga al mayor acreedor; quien queda con resto vuelve a la cola. Como mucho n-1 transferencias."""
+    debtors = [(c, str(m), m) for m, c in cents.items() if c < 0] # c negativo: el más endeudado sale primero
+    creditors = [(-c, str(m), m) for m, c in cents.items() if c > 0]
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+    while debtors and creditors:
+        d, dkey, debtor = heapq.heappop(debtors)
+        c, ckey, creditor = heapq.heappop(creditors)
+        pay = min(-d, -c)
+        transfers.append(_transfer(debtor, creditor, pay))
+        if -d > pay:
+            heapq.heappush(debtors, (d + pay, dkey, debtor))
+        if -c > pay:
+            heapq.heappush(creditors, (c + pay, ckey, creditor))
+
+def _zero_sum_partition(members, amounts, deadline):
+    """Partición de los miembros en el máximo de grupos que suman cero (programación dinámica sobre
+    subconjuntos: best[S] = max_i best[S sin i] + (suma(S) == 0)). None si se pasa del tiempo."""
+    n = len(members)
+    size = 1 << n
+    sums = [0] * size
+    best = [0] * size
+    removed = [0] * size # Bit quitado para llegar al mejor subconjunto anterior
+    for mask in range(1, size):
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + amounts[low.bit_length() - 1]
+        top, arg, rest = -1, 0, mask
+        while rest:
+            bit = rest & -rest
+            if best[mask ^ bit] > top:
+                top, arg = best[mask ^ bit], bit
+            rest ^= bit
+        best[mask] = top + (sums[mask] == 0)
+        removed[mask] = arg
+        if not mask % _DEADLINE_CHECK and time.perf_counter() > deadline:
+            return None
+
+    # Bajando por el camino óptimo, los subconjuntos que suman cero marcan dónde acaba cada grupo
+    groups, mask, boundary = [], size - 1, size - 1
+    while mask:
+        mask ^= removed[mask]
+        if sums[mask] == 0:
+            diff = boundary ^ mask
+            groups.append([members[i] for i in range(n) if diff >> i & 1])
+            boundary = mask
+    return groups
+
+def plan_settlements(balances, max_members=SUBSET_MAX_MEMBERS, time_budget=SUBSET_TIME_BUDGET):
+    """Transferencias mínimas para saldar {miembro: saldo} (+ le deben, - debe)"""
+    started = time.perf_counter()
+    transfers = []
+    pending = _exact_pairs(to_cents(balances), transfers)
+    plan = SettlementPlan(transfers)
+    if pending:
+        members = sorted(pending, key=lambda m: (pending[m], str(m)))
+        groups = None
+        if len(members) <= max_members:
+            groups = _zero_sum_partition(members, [pending[m] for m in members], started + time_budget)
+        if groups is None:
+            plan.method, plan.optimal = 'voraz', False
+            _greedy(pending, transfers)
+        else:
+            plan.method = 'subconjuntos'
+            for group in groups:
+                _greedy({m: pending[m] for m in group}, transfers)
+    plan.elapsed_ms = (time.perf_counter() - started) * 1000
+    return plan
+
+
+# Nº de transferencias (filas) y tiempo de cálculo en el panel de rendimiento
+metrics.instrument_module(globals(), 'compute', names=['plan_settlements'])
@@ -0,0 +1,26 @@
+-- Marca de última modificación de cada movimiento: la carga incremental de movimientos (main.py) pide solo las filas
+-- con updated_at posterior a su cursor, así ve también los cambios hechos desde otros dispositivos o procesos.
+-- La fija un trigger en cada UPDATE (el cliente no tiene que acordarse de enviarla).
+alter table public.user_imputs add column if not exists updated_at timestamptz;
+update public.user_imputs set updated_at = coalesce(created_at, now()) where updated_at is null;
+alter table public.user_imputs alter column updated_at set default now();
+alter table public.user_imputs alter column updated_at set not null;
+
+create or replace function public.touch_updated_at()
+returns trigger
+language plpgsql
+set search_path = public
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists user_imputs_touch_updated_at on public.user_imputs;
+create trigger user_imputs_touch_updated_at
+    before update on public.user_imputs
+    for each row execute function public.touch_updated_at();
+
+-- Índice para el filtro por usuario y cursor de la carga incremental
+create index if not exists user_imputs_user_id_updated_at_idx on public.user_imputs (user_id, updated_at);
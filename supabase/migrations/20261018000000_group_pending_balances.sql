@@ -0,0 +1,71 @@
+-- Saldo pendiente de cada miembro de un grupo (+ le deben, - debe), calculado en la base de datos.
+-- Sustituye a descargar todos los repartos sin saldar con su gasto y sumarlos en Python
+-- (database_groups.get_pending_balances). Devuelve una fila por miembro con repartos pendientes.
+-- security invoker: se aplican las políticas RLS del usuario que la llama, igual que en la consulta anterior.
+create or replace function public.group_pending_balances(p_group_id bigint)
+returns table (user_id text, balance double precision)
+language sql
+stable
+security invoker
+set search_path = public
+as $$
+    select member, sum(amount)::double precision
+    from (
+        -- Quien pagó: le deben la parte de cada participante
+        select e.paid_by::text as member, s.amount_owed as amount
+        from group_expense_splits s
+        join group_expenses e on e.id = s.expense_id
+        where e.group_id = p_group_id and not s.is_settled and s.user_id::text is distinct from e.paid_by::text
+        union all
+        -- Cada participante: debe su parte (lo que se debe a sí mismo no cuenta)
+        select s.user_id::text, -s.amount_owed
+        from group_expense_splits s
+        join group_expenses e on e.id = s.expense_id
+        where e.group_id = p_group_id and not s.is_settled and s.user_id::text is distinct from e.paid_by::text
+    ) movimientos
+    group by member;
+$$;
+
+grant execute on function public.group_pending_balances(bigint) to authenticated;
+
+-- Índice para el filtro por grupo de la función (y de las lecturas de gastos por grupo)
+create index if not exists group_expenses_group_id_idx on public.group_expenses (group_id);
+create index if not exists group_expense_splits_expense_id_idx on public.group_expense_splits (expense_id) where not is_settled;
+
+-- Foto completa de un grupo en una sola llamada (database_groups.load_group_snapshot): la fila del grupo con sus
+-- miembros (y perfil), sus gastos por fecha descendente con sus repartos, y los balances de group_pending_balances.
+-- Devuelve {"group": fila o null si no existe o no es visible, "balances": {user_id: saldo}}.
+create or replace function public.group_snapshot(p_group_id bigint)
+returns jsonb
+language sql
+stable
+security invoker
+set search_path = public
+as $$
+    select jsonb_build_object(
+        'group', (
+            select to_jsonb(g) || jsonb_build_object(
+                'group_members', coalesce((
+                    select jsonb_agg(jsonb_build_object(
+                        'id', m.id, 'user_id', m.user_id, 'leave_status', m.leave_status, 'is_external', m.is_external,
+                        'external_name', m.external_name, 'profiles', to_jsonb(p)) order by m.id)
+                    from group_members m
+                    left join profiles p on p.id = m.user_id
+                    where m.group_id = g.id), '[]'::jsonb),
+                'group_expenses', coalesce((
+                    select jsonb_agg(to_jsonb(e) || jsonb_build_object(
+                        'group_expense_splits', coalesce((
+                            select jsonb_agg(jsonb_build_object(
+                                'user_id', s.user_id, 'amount_owed', s.amount_owed, 'is_settled', s.is_settled,
+                                'settlement_requested', s.settlement_requested) order by s.id)
+                            from group_expense_splits s
+                            where s.expense_id = e.id), '[]'::jsonb)) order by e.date desc)
+                    from group_expenses e
+                    where e.group_id = g.id), '[]'::jsonb))
+            from groups g
+            where g.id = p_group_id),
+        'balances', coalesce((
+            select jsonb_object_agg(b.user_id, b.balance) from group_pending_balances(p_group_id) b), '{}'::jsonb));
+$$;
+
+grant execute on function public.group_snapshot(bigint) to authenticated;
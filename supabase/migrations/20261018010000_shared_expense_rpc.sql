@@ -0,0 +1,136 @@
+-- Alta y edición de un gasto compartido en una sola llamada y en una sola transacción.
+-- Antes database_groups.add_shared_expense hacía tres inserts seguidos (movimiento, ticket, repartos) y
+-- update_shared_expense hasta seis peticiones; si una fallaba a medias quedaban filas huérfanas.
+-- Las filas se construyen con jsonb_populate_record(set) para que cada valor tome el tipo de su columna.
+-- security invoker: se aplican las políticas RLS del usuario que la llama, igual que con las peticiones sueltas.
+
+-- p_movement: user_id, quantity, type, category_id, date, notes y opcionalmente paid_by_custom (miembro externo 'ext_...').
+-- Devuelve {"movement_id": id o null si pagó un externo, "expense_id": id,
+--          "splits": [{user_id, amount_owed}] (los repartos tal como se guardaron)}.
+create or replace function public.add_shared_expense(p_group_id bigint, p_movement jsonb, p_member_ids text[])
+returns jsonb
+language plpgsql
+security invoker
+set search_path = public
+as $$
+declare
+    v_paid_by text := coalesce(p_movement->>'paid_by_custom', p_movement->>'user_id');
+    v_quantity double precision := coalesce((p_movement->>'quantity')::double precision, 0);
+    v_movement_id bigint;
+    v_expense_id bigint;
+    v_splits jsonb;
+begin
+    if coalesce(cardinality(p_member_ids), 0) = 0 then
+        raise exception 'El reparto necesita al menos un participante' using errcode = '22023';
+    end if;
+
+    -- 1. Movimiento personal, solo si paga un usuario real
+    if not starts_with(v_paid_by, 'ext_') then
+        insert into user_imputs (user_id, quantity, type, category_id, date, notes, group_id)
+        select r.user_id, r.quantity, r.type, r.category_id, r.date, r.notes, r.group_id
+        from jsonb_populate_record(null::user_imputs,
+                                   p_movement || jsonb_build_object('user_id', v_paid_by, 'group_id', p_group_id)) r
+        returning id into v_movement_id;
+    end if;
+
+    -- 2. Ticket del grupo
+    insert into group_expenses (group_id, movement_id, paid_by, description, total_amount)
+    select r.group_id, r.movement_id, r.paid_by, r.description, r.total_amount
+    from jsonb_populate_record(null::group_expenses, jsonb_build_object(
+        'group_id', p_group_id, 'movement_id', v_movement_id, 'paid_by', v_paid_by,
+        'description', coalesce(p_movement->>'notes', 'Gasto compartido'), 'total_amount', v_quantity)) r
+    returning id into v_expense_id;
+
+    -- 3. Repartos a partes iguales
+    with inserted as (
+        insert into group_expense_splits (expense_id, user_id, amount_owed, is_settled)
+        select r.expense_id, r.user_id, r.amount_owed, r.is_settled
+        from jsonb_populate_recordset(null::group_expense_splits, (
+            select jsonb_agg(jsonb_build_object('expense_id', v_expense_id, 'user_id', m,
+                                                'amount_owed', v_quantity / cardinality(p_member_ids), 'is_settled', false))
+            from unnest(p_member_ids) m)) r
+        returning user_id, amount_owed
+    )
+    select coalesce(jsonb_agg(jsonb_build_object('user_id', user_id, 'amount_owed', amount_owed)), '[]'::jsonb)
+    into v_splits
+    from inserted;
+
+    return jsonb_build_object('movement_id', v_movement_id, 'expense_id', v_expense_id, 'splits', v_splits);
+end;
+$$;
+
+-- p_movement: user_id, quantity, type, category_id, date, notes. p_new_group_id null = pasa a ser un gasto personal.
+-- Devuelve lo que la app necesita para mantener sus posiciones netas en caché:
+-- {"old_expense": {id, group_id, paid_by} o null, "removed_splits": [{user_id, amount_owed, is_settled}], "expense_id": id o null}.
+create or replace function public.update_shared_expense(p_movement_id bigint, p_movement jsonb,
+                                                        p_new_group_id bigint, p_participant_ids text[])
+returns jsonb
+language plpgsql
+security invoker
+set search_path = public
+as $$
+declare
+    v_quantity double precision := coalesce((p_movement->>'quantity')::double precision, 0);
+    v_count int := coalesce(cardinality(p_participant_ids), 0);
+    v_old group_expenses%rowtype;
+    v_old_json jsonb;
+    v_removed jsonb := '[]'::jsonb;
+    v_expense_id bigint;
+begin
+    -- 1. Movimiento personal
+    update user_imputs u
+    set quantity = r.quantity, type = r.type, category_id = r.category_id, date = r.date, notes = r.notes,
+        group_id = p_new_group_id
+    from jsonb_populate_record(null::user_imputs, p_movement) r
+    where u.id = p_movement_id;
+
+    -- 2. Ticket de grupo que tuviera antes
+    select * into v_old from group_expenses where movement_id = p_movement_id limit 1 for update;
+    if found then
+        v_old_json := jsonb_build_object('id', v_old.id, 'group_id', v_old.group_id, 'paid_by', v_old.paid_by);
+    end if;
+
+    if v_old_json is not null and v_old.group_id = p_new_group_id then
+        -- Mismo grupo: nuevo importe y repartos rehechos
+        v_expense_id := v_old.id;
+        update group_expenses set description = p_movement->>'notes', total_amount = v_quantity where id = v_expense_id;
+
+        with removed as (
+            delete from group_expense_splits where expense_id = v_expense_id
+            returning user_id::text as user_id, amount_owed, is_settled
+        )
+        select coalesce(jsonb_agg(to_jsonb(removed)), '[]'::jsonb) into v_removed from removed;
+    else
+        -- Sin grupo, otro grupo o antes era personal: el ticket viejo se va (sus repartos en cascada)
+        if v_old_json is not null then
+            delete from group_expenses where id = v_old.id;
+        end if;
+        if p_new_group_id is not null then
+            insert into group_expenses (group_id, movement_id, paid_by, description, total_amount)
+            select r.group_id, r.movement_id, r.paid_by, r.description, r.total_amount
+            from jsonb_populate_record(null::group_expenses, jsonb_build_object(
+                'group_id', p_new_group_id, 'movement_id', p_movement_id, 'paid_by', p_movement->>'user_id',
+                'description', p_movement->>'notes', 'total_amount', v_quantity)) r
+            returning id into v_expense_id;
+        end if;
+    end if;
+
+    -- 3. Repartos a partes iguales
+    if v_expense_id is not null and v_count > 0 then
+        insert into group_expense_splits (expense_id, user_id, amount_owed, is_settled)
+        select r.expense_id, r.user_id, r.amount_owed, r.is_settled
+        from jsonb_populate_recordset(null::group_expense_splits, (
+            select jsonb_agg(jsonb_build_object('expense_id', v_expense_id, 'user_id', p,
+                                                'amount_owed', v_quantity / v_count, 'is_settled', false))
+            from unnest(p_participant_ids) p)) r;
+    end if;
+
+    return jsonb_build_object('old_expense', v_old_json, 'removed_splits', v_removed, 'expense_id', v_expense_id);
+end;
+$$;
+
+grant execute on function public.add_shared_expense(bigint, jsonb, text[]) to authenticated;
+grant execute on function public.update_shared_expense(bigint, jsonb, bigint, text[]) to authenticated;
+
+-- Índice para buscar el ticket de un movimiento (update_shared_expense, get_expense_participants)
+create index if not exists group_expenses_movement_id_idx on public.group_expenses (movement_id);
@@ -0,0 +1,114 @@
+-- update_shared_expense sin rehacer los repartos: al editar un gasto del mismo grupo ya no se borran todos los
+-- repartos para volver a insertarlos (se perdían is_settled y settlement_requested y la tabla se revolvía).
+-- Se calcula la diferencia con lo que hay: se borra a quien ya no participa, se inserta a quien entra y
+-- a quien sigue solo se le cambia el importe si es distinto (mismo criterio que database_groups.diff_splits).
+-- Si el importe de un reparto saldado cambia, vuelve a quedar pendiente: lo que se saldó era el importe viejo.
+-- Devuelve {"old_expense", "split_diff": {"insert": [user_id], "delete": [reparto], "update": [reparto con su
+-- importe anterior]} o null si el ticket es nuevo, "expense_id"}.
+create or replace function public.update_shared_expense(p_movement_id bigint, p_movement jsonb,
+                                                        p_new_group_id bigint, p_participant_ids text[])
+returns jsonb
+language plpgsql
+security invoker
+set search_path = public
+as $$
+declare
+    v_quantity double precision := coalesce((p_movement->>'quantity')::double precision, 0);
+    v_count int := coalesce(cardinality(p_participant_ids), 0);
+    v_cuota double precision;
+    v_old group_expenses%rowtype;
+    v_old_json jsonb;
+    v_diff jsonb;
+    v_deleted jsonb;
+    v_updated jsonb;
+    v_inserted text[] := '{}';
+    v_expense_id bigint;
+begin
+    v_cuota := case when v_count > 0 then v_quantity / v_count else 0 end;
+
+    -- 1. Movimiento personal
+    update user_imputs u
+    set quantity = r.quantity, type = r.type, category_id = r.category_id, date = r.date, notes = r.notes,
+        group_id = p_new_group_id
+    from jsonb_populate_record(null::user_imputs, p_movement) r
+    where u.id = p_movement_id;
+
+    -- 2. Ticket de grupo que tuviera antes
+    select * into v_old from group_expenses where movement_id = p_movement_id limit 1 for update;
+    if found then
+        v_old_json := jsonb_build_object('id', v_old.id, 'group_id', v_old.group_id, 'paid_by', v_old.paid_by);
+    end if;
+
+    if v_old_json is not null and v_old.group_id = p_new_group_id then
+        -- Mismo grupo: nuevo importe y solo los repartos que cambian
+        v_expense_id := v_old.id;
+        update group_expenses set description = p_movement->>'notes', total_amount = v_quantity where id = v_expense_id;
+
+        -- Quien ya no participa (y filas repetidas de un mismo miembro)
+        with doomed as (
+            select id from (
+                select s.id, s.user_id::text as user_id,
+                       row_number() over (partition by s.user_id order by s.id) as n
+                from group_expense_splits s
+                where s.expense_id = v_expense_id
+            ) x
+            where n > 1 or not (user_id = any(coalesce(p_participant_ids, '{}')))
+        ), deleted as (
+            delete from group_expense_splits s using doomed d where s.id = d.id
+            returning s.id, s.user_id::text as user_id, s.amount_owed, s.is_settled
+        )
+        select coalesce(jsonb_agg(to_jsonb(deleted)), '[]'::jsonb) into v_deleted from deleted;
+
+        -- Quien sigue con el mismo importe conserva is_settled y settlement_requested (medio céntimo de margen para no
+        -- reescribir por redondeo); si su importe cambia, el reparto vuelve a quedar pendiente
+        with changed as (
+            select s.id, s.user_id::text as user_id, s.amount_owed, s.is_settled
+            from group_expense_splits s
+            where s.expense_id = v_expense_id and abs(s.amount_owed - v_cuota) >= 0.005
+        ), updated as (
+            update group_expense_splits s set amount_owed = v_cuota, is_settled = false, settlement_requested = false
+            from changed c where s.id = c.id
+            returning c.id, c.user_id, c.amount_owed, c.is_settled
+        )
+        select coalesce(jsonb_agg(to_jsonb(updated)), '[]'::jsonb) into v_updated from updated;
+
+        -- Quien entra
+        select coalesce(array_agg(p), '{}') into v_inserted
+        from (select distinct p from unnest(p_participant_ids) p) wanted
+        where not exists (select 1 from group_expense_splits s where s.expense_id = v_expense_id and s.user_id::text = p);
+
+        v_diff := jsonb_build_object('insert', to_jsonb(v_inserted), 'delete', v_deleted, 'update', v_updated);
+    else
+        -- Sin grupo, otro grupo o antes era personal: el ticket viejo se va (sus repartos en cascada)
+        if v_old_json is not null then
+            delete from group_expenses where id = v_old.id;
+        end if;
+        if p_new_group_id is not null then
+            insert into group_expenses (group_id, movement_id, paid_by, description, total_amount)
+            select r.group_id, r.movement_id, r.paid_by, r.description, r.total_amount
+            from jsonb_populate_record(null::group_expenses, jsonb_build_object(
+                'group_id', p_new_group_id, 'movement_id', p_movement_id, 'paid_by', p_movement->>'user_id',
+                'description', p_movement->>'notes', 'total_amount', v_quantity)) r
+            returning id into v_expense_id;
+            v_inserted := coalesce(p_participant_ids, '{}');
+        end if;
+    end if;
+
+    -- 3. Repartos nuevos a partes iguales
+    if v_expense_id is not null and cardinality(v_inserted) > 0 then
+        insert into group_expense_splits (expense_id, user_id, amount_owed, is_settled)
+        select r.expense_id, r.user_id, r.amount_owed, r.is_settled
+        from jsonb_populate_recordset(null::group_expense_splits, (
+            select jsonb_agg(jsonb_build_object('expense_id', v_expense_id, 'user_id', p,
+                                                'amount_owed', v_cuota, 'is_settled', false))
+            from unnest(v_inserted) p)) r;
+    end if;
+
+    return jsonb_build_object('old_expense', v_old_json, 'split_diff', v_diff, 'expense_id', v_expense_id);
+end;
+$$;
+
+grant execute on function public.update_shared_expense(bigint, jsonb, bigint, text[]) to authenticated;
+
+-- Los repartos de un gasto se buscan por (expense_id, user_id) al calcular la diferencia
+create index if not exists group_expense_splits_expense_user_idx on public.group_expense_splits (expense_id, user_id);
@@ -0,0 +1,73 @@
+-- Liquidación de las deudas cruzadas entre dos miembros de un grupo en una sola llamada y en una sola transacción.
+-- Antes database_groups.settle_debt_between_users hacía hasta cinco peticiones seguidas (leer repartos, saldarlos,
+-- leer movimientos, dejarlos a 0 y el parcial); si una fallaba a medias quedaban repartos saldados sin que el
+-- gasto personal de quien cobra se redujera (o al revés).
+-- Mismo criterio que la app: se saldan los repartos pendientes en ambas direcciones y el gasto personal de quien
+-- cobra se reduce por el importe NETO, movimiento a movimiento en el orden de sus repartos.
+-- Devuelve lo que la app necesita para mantener sus cachés:
+-- {"settled_splits": [{id, user_id, paid_by, amount_owed, movement_id}], "changed_movements": [id]}.
+create or replace function public.settle_debt_between_users(p_group_id bigint, p_creditor_id text, p_debtor_id text)
+returns jsonb
+language plpgsql
+security invoker
+set search_path = public
+as $$
+declare
+    v_settled jsonb;
+    v_left double precision;
+    v_mov record;
+    v_changed bigint[] := '{}';
+begin
+    -- 1. Candado cruzado: todos los repartos pendientes entre los dos, en ambas direcciones
+    with pending as (
+        select s.id, s.user_id::text as user_id, e.paid_by::text as paid_by, s.amount_owed, e.movement_id
+        from group_expense_splits s
+        join group_expenses e on e.id = s.expense_id
+        where e.group_id = p_group_id and not s.is_settled
+          and ((s.user_id::text = p_debtor_id and e.paid_by::text = p_creditor_id)
+            or (s.user_id::text = p_creditor_id and e.paid_by::text = p_debtor_id))
+        for update of s
+    ), settled as (
+        update group_expense_splits s set is_settled = true, settlement_requested = false
+        from pending p where s.id = p.id
+        returning p.id, p.user_id, p.paid_by, p.amount_owed, p.movement_id
+    )
+    select coalesce(jsonb_agg(to_jsonb(settled) order by settled.id), '[]'::jsonb) into v_settled from settled;
+
+    -- 2. El dinero real (NETO) que se está transfiriendo
+    select coalesce(sum(case when x->>'user_id' = p_debtor_id then (x->>'amount_owed')::double precision
+                             else -(x->>'amount_owed')::double precision end), 0)
+    into v_left
+    from jsonb_array_elements(v_settled) x;
+
+    -- 3. Reducir el gasto personal de quien cobra por ese NETO (como mucho uno queda con un resto)
+    if v_left > 0 then
+        for v_mov in
+            select m.id, m.quantity
+            from user_imputs m
+            join (
+                select (x->>'movement_id')::bigint as id, min((x->>'id')::bigint) as first_split
+                from jsonb_array_elements(v_settled) x
+                where x->>'user_id' = p_debtor_id and x->>'movement_id' is not null
+                group by 1
+            ) o on o.id = m.id
+            order by o.first_split
+            for update of m
+        loop
+            exit when v_left <= 0.01;
+            if v_mov.quantity > v_left then
+                update user_imputs set quantity = v_mov.quantity - v_left where id = v_mov.id;
+                v_left := 0;
+            else
+                update user_imputs set quantity = 0 where id = v_mov.id;
+                v_left := v_left - v_mov.quantity;
+            end if;
+            v_changed := v_changed || v_mov.id;
+        end loop;
+    end if;
+
+    return jsonb_build_object('settled_splits', v_settled, 'changed_movements', to_jsonb(v_changed));
+end;
+$$;
+
+grant execute on function public.settle_debt_between_users(bigint, text, text) to authenticated;
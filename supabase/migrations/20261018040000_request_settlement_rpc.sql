@@ -0,0 +1,22 @@
+-- Aviso de pago de un deudor a un acreedor en un solo UPDATE (database_groups.request_settlement).
+-- PostgREST no deja filtrar un UPDATE por la tabla embebida (group_expenses), así que desde la app hacían falta
+-- dos peticiones: leer los ids de los repartos y luego marcarlos.
+-- Devuelve los ids de los repartos marcados.
+create or replace function public.request_settlement(p_group_id bigint, p_debtor_id text, p_creditor_id text)
+returns bigint[]
+language sql
+security invoker
+set search_path = public
+as $$
+    with marked as (
+        update group_expense_splits s
+        set settlement_requested = true
+        from group_expenses e
+        where e.id = s.expense_id and e.group_id = p_group_id and e.paid_by::text = p_creditor_id
+          and s.user_id::text = p_debtor_id and not s.is_settled
+        returning s.id
+    )
+    select coalesce(array_agg(id), '{}') from marked;
+$$;
+
+grant execute on function public.request_settlement(bigint, text, text) to authenticated;
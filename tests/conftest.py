@@ -0,0 +1,25 @@
+# conftest.py
+# Los tests corren contra el backend local en memoria (local_backend): sin Supabase ni red.
+# Las variables se fijan antes de importar database para que get_supabase_client elija ese backend.
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('DATA_BACKEND', 'local')
+os.environ.setdefault('LOCAL_DB_PATH', ':memory:')
+
+# Los módulos de la app están en la raíz del repositorio (no es un paquete)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db():
+    """Base de datos local vacía y caché limpia para cada test"""
+    import cache
+    from local_backend import get_database
+    database = get_database()
+    database.reset()
+    cache.clear()
+    yield database
+    cache.clear()
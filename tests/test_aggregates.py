@@ -0,0 +1,152 @@
+# Agregados sobre el Ledger (aggregates.py): actualización incremental frente a construcción completa
+import random
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import BalanceSeries, EPOCH, MonthlyCube
+from ledger import Ledger
+
+
+def frame(rows):
+    """rows: (id, cantidad, tipo, category_id, 'AAAA-MM-DD')"""
+    return pd.DataFrame([{
+        'id': i, 'user_id': 'u1', 'quantity': q, 'type': t, 'category_id': c, 'date': pd.Timestamp(d), 'notes': '',
+        'group_id': None, 'cat_name': None, 'cat_emoji': None, 'budget': 0.0, 'group_name': None, 'group_emoji': None,
+    } for i, q, t, c, d in rows])
+
+
+def random_rows(rnd, ids):
+    return [(i, rnd.randint(1, 400) / 4, rnd.choice(['Gasto', 'Ingreso']), rnd.choice([1, 2, 3, None]),
+             (pd.Timestamp('2025-01-01') + pd.Timedelta(days=rnd.randint(0, 500))).strftime('%Y-%m-%d'))
+            for i in ids]
+
+
+def assert_same_cube(cube, expected):
+    for tipo in ('Gasto', 'Ingreso'):
+        assert cube.total(tipo) == pytest.approx(expected.total(tipo))
+        assert cube.count(tipo) == expected.count(tipo)
+        assert cube.months_with_data(tipo) == expected.months_with_data(tipo)
+        for year in (2025, 2026):
+            assert cube.monthly_totals(tipo, year) == pytest.approx(expected.monthly_totals(tipo, year))
+            assert cube.by_category(tipo, year) == pytest.approx(expected.by_category(tipo, year))
+    assert cube.cells.keys() == expected.cells.keys()
+
+
+# --- CUBO MENSUAL ---
+
+def test_cube_queries():
+    led = Ledger.from_frame(frame([
+        (1, 10.0, 'Gasto', 1, '2026-01-05'), (2, 5.0, 'Gasto', 1, '2026-01-20'),
+        (3, 7.0, 'Gasto', 2, '2026-03-02'), (4, 1000.0, 'Ingreso', None, '2026-01-31'),
+    ]))
+    cube = MonthlyCube.from_ledger(led)
+    assert cube.total('Gasto') == 22.0
+    assert cube.total('Gasto', 2026, 1) == 15.0
+    assert cube.count('Gasto', 2026, 1) == 2
+    assert cube.months_with_data('Gasto') == 2
+    assert cube.by_category('Gasto', 2026) == {1: 15.0, 2: 7.0}
+    assert cube.monthly_totals('Ingreso', 2026)[0] == 1000.0
+    assert cube.category_frame('Ingreso').empty # Sin categoría no entra en el merge con categorías
+
+
+def test_cube_removing_last_movement_of_a_month_drops_it():
+    cube = MonthlyCube()
+    cube.add_movement(date(2026, 4, 1), 1, 'Gasto', 12)
+    cube.add_movement(date(2026, 5, 1), 1, 'Gasto', 3)
+    assert cube.months_with_data('Gasto') == 2
+    cube.remove_movement(date(2026, 4, 1), 1, 'Gasto', 12)
+    assert cube.months_with_data('Gasto') == 1
+    assert cube.total('Gasto', 2026, 4) == 0
+    assert (2026, 4, 1, 'Gasto') not in cube.cells
+    assert cube.by_category('Gasto', 2026, 4) == {}
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_cube_apply_rows_matches_full_build(seed):
+    rnd = random.Random(seed)
+    old = Ledger.from_frame(frame(random_rows(rnd, range(1, 41))))
+    cube = MonthlyCube.from_ledger(old)
+
+    gone = np.array(sorted(rnd.sample(range(len(old)), 10)))
+    delta = Ledger.from_frame(frame(random_rows(rnd, range(41, 51))))
+    updated = cube.copy()
+    updated.apply_rows(old, gone, -1)
+    updated.apply_rows(delta, np.arange(len(delta)), 1)
+
+    kept = old.to_frame().drop(index=gone)
+    expected = MonthlyCube.from_frame(pd.concat([kept, delta.to_frame()], ignore_index=True))
+    assert_same_cube(updated, expected)
+    assert_same_cube(cube, MonthlyCube.from_ledger(old)) # La copia no toca el original
+
+
+# --- SERIE DE SALDO DIARIO ---
+
+def day(text):
+    return int((np.datetime64(text, 'D') - EPOCH).astype(int))
+
+
+def daily_balances(series, initial_balance=0.0):
+    dates, values = series.points(initial_balance, max_points=None)
+    return dict(zip(dates.strftime('%Y-%m-%d'), values))
+
+
+def test_balance_series_from_ledger():
+    led = Ledger.from_frame(frame([
+        (1, 1000.0, 'Ingreso', None, '2026-01-01'), (2, 200.0, 'Gasto', 1, '2026-01-03'),
+        (3, 50.0, 'Gasto', 1, '2026-01-03'),
+    ]))
+    series = BalanceSeries.from_ledger(led)
+    assert series.balance() == 750.0
+    assert series.balance(initial_balance=100.0) == 850.0
+    assert daily_balances(series) == {'2025-12-31': 0.0, '2026-01-01': 1000.0, '2026-01-02': 1000.0, '2026-01-03': 750.0}
+
+
+def test_balance_series_add_extends_and_shifts_origin():
+    series = BalanceSeries()
+    series.add(day('2026-01-10'), 100.0)
+    series.add(day('2026-01-15'), -30.0) # Día nuevo al final
+    series.add(day('2026-01-05'), 10.0) # Anterior al primer movimiento: se mueve el origen
+    balances = daily_balances(series)
+    assert min(balances) == '2026-01-04' and balances['2026-01-04'] == 0.0
+    assert balances['2026-01-09'] == 10.0
+    assert balances['2026-01-12'] == 110.0
+    assert balances['2026-01-15'] == 80.0
+    assert len(series) == 12
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_balance_series_apply_rows_matches_full_build(seed):
+    rnd = random.Random(seed)
+    old = Ledger.from_frame(frame(random_rows(rnd, range(1, 41))))
+    series = BalanceSeries.from_ledger(old)
+
+    gone = np.array(sorted(rnd.sample(range(len(old)), 10)))
+    delta = Ledger.from_frame(frame(random_rows(rnd, range(41, 51))))
+    updated = series.copy()
+    updated.apply_rows(old, gone, -1)
+    updated.apply_rows(delta, np.arange(len(delta)), 1)
+
+    kept = old.to_frame().drop(index=gone)
+    expected = BalanceSeries.from_frame(pd.concat([kept, delta.to_frame()], ignore_index=True))
+    assert updated.balance() == pytest.approx(expected.balance())
+    got, want = daily_balances(updated), daily_balances(expected)
+    # La serie actualizada puede empezar antes o acabar después (días que se quedaron sin movimientos):
+    # antes el saldo es 0 y después se repite el último
+    first, last = min(want), max(want)
+    assert all(v == pytest.approx(0.0) for d, v in got.items() if d < first)
+    assert all(v == pytest.approx(want[last]) for d, v in got.items() if d > last)
+    assert {d: v for d, v in got.items() if first <= d <= last} == pytest.approx(want)
+    assert series.balance() == pytest.approx(BalanceSeries.from_ledger(old).balance())
+
+
+def test_balance_points_are_downsampled_keeping_both_ends():
+    led = Ledger.from_frame(frame([(i, 1.0, 'Ingreso', None, (pd.Timestamp('2020-01-01') + pd.Timedelta(days=i)).strftime('%Y-%m-%d'))
+                                   for i in range(1000)]))
+    series = BalanceSeries.from_ledger(led)
+    dates, values = series.points(max_points=50)
+    assert len(dates) <= 50
+    assert dates[0] == pd.Timestamp('2019-12-31') and values[0] == 0.0
+    assert dates[-1] == pd.Timestamp('2022-09-26') and values[-1] == 1000.0
@@ -0,0 +1,134 @@
+# Caché compartida (cache.py): caducidad, expulsión LRU y copias en el decorador cached
+import pytest
+
+import cache
+from cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(cache.time, 'monotonic', fake)
+    return fake
+
+
+@pytest.fixture(autouse=True)
+def empty_store():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def test_entry_expires_after_its_ttl(clock):
+    store = TTLCache(default_ttl=10)
+    store.set(('k', '1'), 'a')
+    store.set(('k', '2'), 'b', ttl=30)
+    clock.now += 10
+    assert store.get(('k', '1')) == 'a' # Justo en el límite sigue vigente
+    clock.now += 1
+    assert store.get(('k', '1')) is None
+    assert store.get(('k', '2')) == 'b'
+    stats = store.stats()['by_kind']['k']
+    assert stats['expirations'] == 1
+    assert stats['hits'] == 2 and stats['misses'] == 1
+
+
+def test_keys_skip_expired_entries(clock):
+    store = TTLCache(default_ttl=5)
+    store.set(('k', '1'), 'a')
+    clock.now += 3
+    store.set(('k', '2'), 'b')
+    clock.now += 3
+    assert store.keys('k') == ['2']
+
+
+def test_lru_evicts_least_recently_used(clock):
+    store = TTLCache(max_entries=2)
+    store.set(('k', '1'), 'a')
+    store.set(('k', '2'), 'b')
+    assert store.get(('k', '1')) == 'a' # '1' pasa a ser la más reciente
+    store.set(('k', '3'), 'c')
+    assert store.get(('k', '2')) is None
+    assert store.get(('k', '1')) == 'a'
+    assert store.get(('k', '3')) == 'c'
+    assert store.stats()['evictions'] == 1
+
+
+def test_set_refreshes_position_and_ttl(clock):
+    store = TTLCache(max_entries=2, default_ttl=10)
+    store.set(('k', '1'), 'a')
+    store.set(('k', '2'), 'b')
+    clock.now += 8
+    store.set(('k', '1'), 'a2')
+    store.set(('k', '3'), 'c')
+    assert store.get(('k', '2')) is None
+    clock.now += 8
+    assert store.get(('k', '1')) == 'a2'
+
+
+def test_invalidate_kind_only_touches_that_kind(clock):
+    cache.put('transactions', 1, 'x')
+    cache.put('transactions', 2, 'y')
+    cache.put('categories', 1, 'z')
+    cache.invalidate_kind('transactions')
+    assert cache.get('transactions', 1) is None and cache.get('transactions', 2) is None
+    assert cache.get('categories', 1) == 'z'
+
+
+def test_update_mutates_in_place_only_if_present(clock):
+    cache.put('state', 1, {'n': 1})
+    assert cache.update('state', 1, lambda v: v.update(n=2))
+    assert cache.get('state', 1) == {'n': 2}
+    assert not cache.update('state', 2, lambda v: v.update(n=2))
+
+
+def test_cached_returns_deep_copies(clock):
+    calls = []
+
+    @cache.cached('rows')
+    def load(user_id):
+        calls.append(user_id)
+        return [{'id': 1, 'tags': ['a']}]
+
+    first = load('u1')
+    first[0]['tags'].append('b') # Una vista que modifica lo que recibe
+    first.append({'id': 2})
+    second = load('u1')
+    assert second == [{'id': 1, 'tags': ['a']}]
+    assert second is not first
+    assert calls == ['u1']
+
+
+def test_cached_does_not_store_empty_results(clock):
+    calls = []
+
+    @cache.cached('rows')
+    def load(user_id):
+        calls.append(user_id)
+        return []
+
+    assert load('u1') == []
+    assert load('u1') == []
+    assert calls == ['u1', 'u1']
+
+
+def test_cached_entry_expires(clock):
+    calls = []
+
+    @cache.cached('rows', ttl=5)
+    def load(user_id):
+        calls.append(user_id)
+        return ['x']
+
+    load('u1')
+    clock.now += 6
+    load('u1')
+    assert calls == ['u1', 'u1']
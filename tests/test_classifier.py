@@ -0,0 +1,82 @@
+# Oráculo de la importación (classifier.py): orden de coincidencia del trie y reglas aprendidas
+import random
+import re
+
+import pandas as pd
+import pytest
+
+from classifier import Classifier, _trie_pattern, learn_rules
+
+CATEGORIES = [
+    {'id': 1, 'name': 'Alimentación'}, {'id': 2, 'name': 'Compras'}, {'id': 3, 'name': 'Ocio'},
+    {'id': 4, 'name': 'Suscripciones'}, {'id': 5, 'name': 'ocio'}, # Repetida sin mayúsculas: gana la primera
+]
+
+
+def test_earliest_word_in_the_concept_wins():
+    clf = Classifier(CATEGORIES, {'netflix': 'Suscripciones', 'amazon': 'Compras'})
+    assert clf.classify_one('AMAZON PRIME pago NETFLIX') == 'Compras'
+    assert clf.classify_one('netflix vía amazon') == 'Suscripciones'
+
+
+def test_longest_word_wins_at_the_same_position():
+    clf = Classifier(CATEGORIES, {'bar': 'Ocio', 'barcelo': 'Alimentación', 'barcelona': 'Compras'})
+    assert clf.classify_one('BARCELONA TIENDA') == 'Compras'
+    assert clf.classify_one('barcelo hoteles') == 'Alimentación'
+    assert clf.classify_one('el bar de abajo') == 'Ocio'
+    assert clf.classify_one('sin reglas') is None
+
+
+def test_classify_column_matches_classify_one():
+    clf = Classifier(CATEGORIES, {'bar': 'Ocio', 'barcelona': 'Compras', 'mercadona': 'Alimentación'})
+    texts = ['Mercadona bar', 'BARCELONA', None, 'nada', 'cena en bar']
+    col = pd.Series(texts, dtype=object)
+    assert clf.classify(col).tolist()[:2] == ['Alimentación', 'Compras']
+    assert clf.classify(col).isna().tolist() == [False, False, True, True, False]
+    assert [clf.classify_one(t) for t in texts] == [None if pd.isna(v) else v for v in clf.classify(col)]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_trie_pattern_behaves_like_longest_first_alternation(seed):
+    rnd = random.Random(seed)
+    words = {''.join(rnd.choice('abc') for _ in range(rnd.randint(1, 5))) for _ in range(15)}
+    trie = re.compile(f'({_trie_pattern(words)})')
+    plain = re.compile('(' + '|'.join(sorted(words, key=len, reverse=True)) + ')')
+    for _ in range(50):
+        text = ''.join(rnd.choice('abcx') for _ in range(12))
+        assert [m.span() for m in trie.finditer(text)] == [m.span() for m in plain.finditer(text)]
+
+
+def test_rules_for_missing_categories_are_ignored():
+    clf = Classifier(CATEGORIES, {'repsol': 'Gasolina', 'zara': 'compras'})
+    assert clf.rules == {'zara': 'Compras'}
+    assert clf.by_name['ocio'] == 'Ocio'
+    assert clf.match_names(pd.Series([' OCIO ', 'otra', None])).tolist()[:1] == ['Ocio']
+
+
+def test_learned_rules_override_defaults():
+    notes = ['Compra MERCADONA 123', 'mercadona centro', 'Mercadona', 'cine yelmo', 'cine yelmo']
+    cats = [2, 2, 2, 3, 3]
+    learned = learn_rules(notes, cats)
+    assert learned == {'mercadona': 2, 'cine': 3, 'yelmo': 3}
+
+    clf = Classifier(CATEGORIES, {'mercadona': 'Alimentación'})
+    clf.add_learned(learned, CATEGORIES)
+    assert clf.classify_one('MERCADONA SA') == 'Compras'
+
+
+def test_learn_rules_thresholds():
+    # 'super' sale 3 veces en Alimentación y 1 en Compras: 75% < 80%, no se aprende
+    notes = ['super', 'super', 'super', 'super', 'única', 'pago tarjeta']
+    cats = [1, 1, 1, 2, 3, 3]
+    assert learn_rules(notes, cats) == {}
+    assert learn_rules(notes, cats, min_precision=0.7) == {'super': 1}
+
+
+def test_learned_rules_match_whole_words_only():
+    clf = Classifier(CATEGORIES, {'mercadona': 'Alimentación'})
+    clf.add_learned({'cine': 3, 'yelmo': 3}, CATEGORIES)
+    assert clf.classify_one('CINE yelmo') == 'Ocio'
+    assert clf.classify_one('cinesa centro') is None # 'cine' dentro de otra palabra
+    assert clf.classify_one('MERCADONA123') == 'Alimentación' # Las de por defecto siguen como subcadena
+    assert clf.classify(pd.Series(['cinesa', 'el cine'], dtype=object)).tolist()[1] == 'Ocio'
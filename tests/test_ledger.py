@@ -0,0 +1,105 @@
+# Ledger (ledger.py): carga incremental con Ledger.merge (altas, modificaciones y borrados)
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import BalanceSeries, MonthlyCube
+from ledger import Ledger
+
+CATS = {1: ('Comida', '🍔', 100.0), 2: ('Casa', '🏠', 500.0), None: (None, None, None)}
+NEW_CAT = ('Nueva', '🆕', 0.0)
+
+
+def frame(*rows):
+    """Filas con las columnas de database.get_transactions: (id, cantidad, tipo, categoría, fecha, nota)"""
+    out = []
+    for i, q, t, c, d, n in rows:
+        name, emoji, budget = CATS.get(c, NEW_CAT)
+        out.append({'id': i, 'user_id': 'u1', 'quantity': q, 'type': t, 'category_id': c, 'date': pd.Timestamp(d),
+                    'notes': n, 'group_id': None, 'cat_name': name, 'cat_emoji': emoji, 'budget': budget,
+                    'group_name': None, 'group_emoji': None})
+    return pd.DataFrame(out)
+
+
+BASE = frame(
+    (1, 10.0, 'Gasto', 1, '2026-01-05', 'pan'),
+    (2, 20.0, 'Gasto', 2, '2026-01-10', 'luz'),
+    (3, 1000.0, 'Ingreso', None, '2026-02-01', 'nómina'),
+    (4, 5.0, 'Gasto', 1, '2026-02-03', None),
+)
+
+
+def rows_by_id(led):
+    df = led.to_frame()
+    return {int(r['id']): (r['quantity'], r['type'], r['category_id'], r['date'].strftime('%Y-%m-%d'), r['notes'], r['cat_name'])
+            for r in df.astype(object).where(df.notna(), None).to_dict('records')}
+
+
+@pytest.fixture
+def ledger():
+    led = Ledger.from_frame(BASE, version=3)
+    led.cube, led.balance # Ya construidos: el merge debe actualizarlos
+    return led
+
+
+def test_merge_applies_adds_changes_and_deletes(ledger):
+    delta = frame((2, 25.0, 'Gasto', 1, '2026-01-11', 'luz y gas'),
+                  (5, 7.5, 'Gasto', 7, '2026-03-01', 'nuevo'))
+    merged = ledger.merge(delta, {'2', '4'})
+    assert merged.version == 4
+    assert rows_by_id(merged) == {
+        1: (10.0, 'Gasto', 1, '2026-01-05', 'pan', 'Comida'),
+        2: (25.0, 'Gasto', 1, '2026-01-11', 'luz y gas', 'Comida'),
+        3: (1000.0, 'Ingreso', None, '2026-02-01', 'nómina', 'General'),
+        5: (7.5, 'Gasto', 7, '2026-03-01', 'nuevo', 'Nueva'),
+    }
+
+
+def test_merge_only_deletes(ledger):
+    merged = ledger.merge(pd.DataFrame(), {'1', '3', '99'}) # 99 no está: se ignora
+    assert sorted(rows_by_id(merged)) == [2, 4]
+    assert merged.ids.dtype == np.int64
+
+
+def test_merge_leaves_previous_version_untouched(ledger):
+    before = rows_by_id(ledger)
+    cube_total = ledger.cube.total('Gasto')
+    ledger.merge(frame((1, 99.0, 'Gasto', 2, '2026-01-05', 'otro')), {'1', '2'})
+    assert rows_by_id(ledger) == before
+    assert ledger.cube.total('Gasto') == cube_total
+
+
+def test_merge_updates_cube_and_balance_incrementally(ledger):
+    delta = frame((1, 12.0, 'Gasto', 2, '2026-01-06', 'pan'),
+                  (6, 300.0, 'Ingreso', 1, '2026-02-15', 'extra'))
+    merged = ledger.merge(delta, {'1', '3'})
+    rebuilt = Ledger.from_frame(merged.to_frame())
+    cube, fresh_cube = merged.cube, MonthlyCube.from_ledger(rebuilt)
+    for tipo in ('Gasto', 'Ingreso'):
+        assert cube.total(tipo) == pytest.approx(fresh_cube.total(tipo))
+        assert cube.count(tipo) == fresh_cube.count(tipo)
+        assert cube.total(tipo, 2026, 1) == pytest.approx(fresh_cube.total(tipo, 2026, 1))
+        nonzero = {k: v for k, v in cube.by_category(tipo).items() if v}
+        assert nonzero == pytest.approx(fresh_cube.by_category(tipo))
+    assert merged.balance.balance() == pytest.approx(BalanceSeries.from_ledger(rebuilt).balance())
+
+
+def test_merge_into_empty_ledger():
+    empty = Ledger.from_frame(pd.DataFrame(), version=0)
+    merged = empty.merge(BASE)
+    assert merged.version == 1
+    assert sorted(rows_by_id(merged)) == [1, 2, 3, 4]
+
+
+def test_to_frame_keeps_extra_columns_and_object_notes(ledger):
+    base = BASE.assign(created_at=[f'2026-01-0{i}T10:00:00+00:00' for i in range(1, 5)])
+    delta = frame((2, 25.0, 'Gasto', 1, '2026-01-11', 'luz y gas'), (5, 7.5, 'Gasto', 1, '2026-03-01', None))
+    delta['created_at'] = ['2026-01-02T10:00:00+00:00', '2026-03-01T10:00:00+00:00']
+    delta['updated_at'] = ['2026-03-02T10:00:00+00:00', '2026-03-01T10:00:00+00:00'] # Solo viene en el delta
+    df = Ledger.from_frame(base).merge(delta, {'4'}).to_frame()
+    assert df['notes'].dtype == object
+    assert df['notes'].tolist() == ['pan', 'luz y gas', 'nómina', '']
+    by_id = df.set_index('id')
+    assert by_id['created_at'].to_dict() == {1: '2026-01-01T10:00:00+00:00', 2: '2026-01-02T10:00:00+00:00',
+                                             3: '2026-01-03T10:00:00+00:00', 5: '2026-03-01T10:00:00+00:00'}
+    assert by_id['updated_at'].dropna().to_dict() == {2: '2026-03-02T10:00:00+00:00', 5: '2026-03-01T10:00:00+00:00'}
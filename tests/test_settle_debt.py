@@ -0,0 +1,52 @@
+# Liquidación de deudas entre dos miembros (database_groups.settle_debt_between_users)
+import pytest
+
+import database_groups as dg
+from database import get_supabase_client
+from database_groups import _reduce_movements
+
+
+def test_reduce_movements_in_order_and_once_per_movement():
+    quantities = {1: 10.0, 2: 30.0, 3: 5.0}
+    # El 1 viene repetido (dos repartos del mismo gasto): no se vuelve a restar
+    assert _reduce_movements(quantities, [1, 1, 2, 3], 25.0) == {1: 0, 2: 15.0}
+    assert _reduce_movements(quantities, [9, 3], 2.0) == {3: 3.0} # Los que no están se saltan
+    assert quantities == {1: 10.0, 2: 30.0, 3: 5.0}
+
+
+@pytest.fixture(params=['rpc', 'steps'])
+def group(request, db, monkeypatch):
+    monkeypatch.setattr(dg, '_missing_rpcs', set() if request.param == 'rpc' else {dg.SETTLE_DEBT_RPC, dg.REQUEST_SETTLEMENT_RPC})
+    client = get_supabase_client()
+    client.table('profiles').insert([{'id': m, 'name': m} for m in ('u1', 'u2')]).execute()
+    group_id = client.table('groups').insert({'name': 'Piso', 'created_by': 'u1'}).execute().data[0]['id']
+    client.table('group_members').insert([{'group_id': group_id, 'user_id': m} for m in ('u1', 'u2')]).execute()
+    return group_id
+
+
+def test_settle_reduces_creditor_movements_by_the_net_amount(group):
+    client = get_supabase_client()
+    for payer, quantity in (('u1', 40.0), ('u1', 20.0), ('u2', 10.0)):
+        ok, msg = dg.add_shared_expense(group, {'user_id': payer, 'quantity': quantity, 'type': 'Gasto',
+                                                'category_id': None, 'date': '2026-10-01', 'notes': 'Compra'}, ['u1', 'u2'])
+        assert ok, msg
+
+    dg.settle_debt_between_users(group, 'u1', 'u2')
+    # u2 debía 20 + 10 y u1 le debía 5: el neto (25) sale del primer gasto de u1
+    mine = client.table('user_imputs').select('quantity').eq('user_id', 'u1').order('id').execute().data
+    assert [m['quantity'] for m in mine] == [pytest.approx(15.0), pytest.approx(20.0)]
+    assert dg.get_pending_balances(group) == {}
+
+
+def test_request_settlement_marks_only_debtor_splits_with_that_creditor(group):
+    client = get_supabase_client()
+    client.table('profiles').insert({'id': 'u3', 'name': 'u3'}).execute()
+    client.table('group_members').insert({'group_id': group, 'user_id': 'u3'}).execute()
+    for payer in ('u1', 'u3', 'u1'):
+        dg.add_shared_expense(group, {'user_id': payer, 'quantity': 30.0, 'type': 'Gasto', 'category_id': None,
+                                      'date': '2026-10-01', 'notes': 'Compra'}, ['u1', 'u2', 'u3'])
+
+    assert dg.request_settlement(group, 'u2', 'u1')
+    rows = client.table('group_expense_splits').select('user_id, settlement_requested, group_expenses(paid_by)').execute().data
+    marked = [(r['user_id'], r['group_expenses']['paid_by']) for r in rows if r['settlement_requested']]
+    assert marked == [('u2', 'u1'), ('u2', 'u1')]
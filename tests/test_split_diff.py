@@ -0,0 +1,130 @@
+# Edición de gastos compartidos sin rehacer los repartos (database_groups.diff_splits / update_shared_expense)
+import pytest
+
+import database_groups as dg
+from database import get_supabase_client
+from database_groups import SPLIT_AMOUNT_TOLERANCE, diff_splits
+
+MEMBERS = ['u1', 'u2', 'u3', 'u4']
+
+
+def split(id, user_id, amount, is_settled=False):
+    return {'id': id, 'user_id': user_id, 'amount_owed': amount, 'is_settled': is_settled}
+
+
+# --- DIFERENCIA EN MEMORIA ---
+
+def test_unchanged_participants_and_amount_touch_nothing():
+    existing = [split(1, 'u1', 10.0), split(2, 'u2', 10.0, True)]
+    assert diff_splits(existing, ['u1', 'u2'], 10.0) == {'insert': [], 'delete': [], 'update': []}
+
+
+def test_amount_changes_below_tolerance_are_ignored():
+    existing = [split(1, 'u1', 10.0), split(2, 'u2', 10.004)]
+    diff = diff_splits(existing, ['u1', 'u2'], 10.0 + SPLIT_AMOUNT_TOLERANCE / 2)
+    assert diff['update'] == []
+    diff = diff_splits(existing, ['u1', 'u2'], 10.0 + SPLIT_AMOUNT_TOLERANCE)
+    assert [s['id'] for s in diff['update']] == [1]
+
+
+def test_update_keeps_previous_amount_and_settled_flag():
+    existing = [split(1, 'u1', 10.0), split(2, 'u2', 10.0, True)]
+    diff = diff_splits(existing, ['u1', 'u2'], 15.0)
+    assert diff['update'] == existing # Con su importe y su is_settled anteriores (para restar la posición neta)
+
+
+def test_participants_in_and_out_and_duplicate_rows():
+    existing = [split(3, 'u2', 10.0), split(1, 'u1', 10.0), split(2, 'u2', 10.0, True), split(4, 'u3', 10.0)]
+    diff = diff_splits(existing, ['u4', 'u1', 'u2', 'u4'], 10.0)
+    assert diff['insert'] == ['u4'] # Sin repetir y en el orden pedido
+    assert sorted(s['id'] for s in diff['delete']) == [3, 4] # Sale u3 y la fila repetida de u2 más nueva
+    assert diff['update'] == []
+
+
+# --- EDICIÓN CONTRA EL BACKEND LOCAL (función SQL y petición a petición) ---
+
+@pytest.fixture(params=['rpc', 'steps'])
+def group(request, db, monkeypatch):
+    monkeypatch.setattr(dg, '_missing_rpcs', set() if request.param == 'rpc' else {dg.UPDATE_EXPENSE_RPC})
+    client = get_supabase_client()
+    client.table('profiles').insert([{'id': m, 'name': m} for m in MEMBERS]).execute()
+    group_id = client.table('groups').insert({'name': 'Piso', 'created_by': 'u1'}).execute().data[0]['id']
+    client.table('group_members').insert([{'group_id': group_id, 'user_id': m} for m in MEMBERS]).execute()
+    return group_id
+
+
+def add_expense(group_id, quantity, participants):
+    ok, msg = dg.add_shared_expense(group_id, movement(quantity), participants)
+    assert ok, msg
+    return get_supabase_client().table('user_imputs').select('id').order('id', desc=True).limit(1).execute().data[0]['id']
+
+
+def movement(quantity):
+    return {'user_id': 'u1', 'quantity': quantity, 'type': 'Gasto', 'category_id': None, 'date': '2026-10-01', 'notes': 'Compra'}
+
+
+def splits():
+    rows = get_supabase_client().table('group_expense_splits').select('id, user_id, amount_owed, is_settled').execute().data
+    return {r['user_id']: r for r in rows}
+
+
+def test_edit_keeps_splits_and_only_touches_changes(group, db):
+    mov_id = add_expense(group, 30.0, ['u1', 'u2', 'u3'])
+    before = splits()
+    get_supabase_client().table('group_expense_splits').update({'is_settled': True}).eq('id', before['u2']['id']).execute()
+
+    ok, msg = dg.update_shared_expense(mov_id, movement(45.0), group, ['u1', 'u2', 'u4'])
+    assert ok, msg
+    after = splits()
+    assert sorted(after) == ['u1', 'u2', 'u4']
+    assert after['u2']['id'] == before['u2']['id']
+    assert after['u1']['id'] == before['u1']['id']
+    assert all(s['amount_owed'] == pytest.approx(15.0) for s in after.values())
+    assert not any(s['is_settled'] for s in after.values()) # Lo saldado eran 10, no 15: vuelve a pendiente
+
+
+def test_edit_keeps_settled_split_when_its_amount_does_not_change(group, db):
+    mov_id = add_expense(group, 30.0, ['u1', 'u2', 'u3'])
+    settled = splits()['u2']['id']
+    get_supabase_client().table('group_expense_splits').update({'is_settled': True}).eq('id', settled).execute()
+
+    ok, msg = dg.update_shared_expense(mov_id, movement(30.0), group, ['u1', 'u2', 'u4'])
+    assert ok, msg
+    after = splits()
+    assert after['u2']['id'] == settled and after['u2']['is_settled']
+    assert not after['u4']['is_settled']
+
+
+def test_edit_within_tolerance_writes_no_splits(group, db):
+    mov_id = add_expense(group, 30.0, ['u1', 'u2', 'u3'])
+    before = splits()
+    db.row_writes.clear()
+    ok, msg = dg.update_shared_expense(mov_id, movement(30.01), group, ['u1', 'u2', 'u3'])
+    assert ok, msg
+    assert not any(table == 'group_expense_splits' for table, _ in db.row_writes)
+    assert splits() == before
+
+
+def test_edit_keeps_net_positions_in_sync(group, db):
+    mov_id = add_expense(group, 30.0, ['u1', 'u2', 'u3'])
+    for member in MEMBERS:
+        dg.get_net_positions(member) # En caché: la edición las actualiza con deltas
+    get_supabase_client().table('group_expense_splits').update({'is_settled': True}).eq('user_id', 'u3').execute()
+    dg.invalidate_net_positions(group)
+    for member in MEMBERS:
+        dg.get_net_positions(member)
+
+    ok, msg = dg.update_shared_expense(mov_id, movement(60.0), group, ['u1', 'u2', 'u3', 'u4'])
+    assert ok, msg
+    cached = {m: dg.get_net_positions(m) for m in MEMBERS}
+    dg.invalidate_net_positions(group)
+    fresh = {m: dg.get_net_positions(m) for m in MEMBERS}
+    for m in MEMBERS:
+        assert cached[m].get(str(group), 0) == pytest.approx(fresh[m].get(str(group), 0))
+
+
+def test_add_without_participants_writes_nothing(group, db):
+    db.row_writes.clear()
+    ok, _ = dg.add_shared_expense(group, movement(30.0), [])
+    assert not ok
+    assert not db.row_writes
@@ -17,6 +17,10 @@ from database import (save_input, delete_input, get_categories, delete_category,
 from database_groups import (get_user_groups, get_group_members, add_shared_expense, get_locked_movements)
 
 from components import editar_movimiento_dialog, editar_categoria_dialog, crear_categoria_dialog
+from aggregates import BalanceSeries, MonthlyCube, BALANCE_CHART_POINTS
+from classifier import Classifier
+from importer import read_columns, parse_file, build_rows, failed_chunk_rows, AUTO_TIPO, AUTO_CATEGORIA, SIN_CLASIFICAR
+import metrics
 
 # --- ESTILOS CSS GLOBALES Y LIBRERÍA DE ICONOS ---
 BOOTSTRAP_ICONS_LINK = '<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.5/font/bootstrap-icons.css">'
@@ -72,7 +76,7 @@ def confirmar_borrar_categoria(id_cat):
             st.rerun()
 
 # --- 1. RESUMEN GLOBAL ---
-def render_main_dashboard(df_all, user_profile):
+def render_main_dashboard(df_all, user_profile, cube=None, balance=None, deuda_neta=None):
     p_color = (user_profile.get('profile_color') or '#636EFA') if user_profile else '#636EFA'
     
     render_header("house", "Resumen Global")
@@ -83,22 +87,19 @@ def render_main_dashboard(df_all, user_profile):
     user_id = user_profile.get('id') 
     
     if not df_all.empty:
-        total_ingresos = df_all[df_all['type'] == 'Ingreso']['quantity'].sum()
-        total_gastos = df_all[df_all['type'] == 'Gasto']['quantity'].sum()
-        saldo_total = saldo_inicial + total_ingresos - total_gastos
+        if cube is None: cube = MonthlyCube.from_frame(df_all)
+        saldo_total = saldo_inicial + cube.total('Ingreso') - cube.total('Gasto')
 
         hoy = datetime.now()
-        df_mes = df_all[(df_all['date'].dt.month == hoy.month) & (df_all['date'].dt.year == hoy.year)]
-        ingresos_mes = df_mes[df_mes['type'] == 'Ingreso']['quantity'].sum()
-        gastos_mes = df_mes[df_mes['type'] == 'Gasto']['quantity'].sum()
-        ahorro_mes = ingresos_mes - gastos_mes
+        ahorro_mes = cube.total('Ingreso', hoy.year, hoy.month) - cube.total('Gasto', hoy.year, hoy.month)
     else:
         saldo_total = saldo_inicial
         ahorro_mes = 0
 
     # --- LÓGICA DE LA DEUDA GLOBAL ---
-    from database_groups import get_total_user_debt
-    deuda_neta = get_total_user_debt(user_id)
+    if deuda_neta is None: # main ya la trae en el prefetch del rerun
+        from database_groups import get_total_user_debt
+        deuda_neta = get_total_user_debt(user_id)
     
     if deuda_neta > 0:
         deuda_str = f"+{deuda_neta:,.2f}€"
@@ -129,19 +130,14 @@ def render_main_dashboard(df_all, user_profile):
 
     render_subheader("graph-up", "Evolución de tu Patrimonio")
     if not df_all.empty or saldo_inicial > 0:
-        df_chart = df_all.copy().sort_values('date') if not df_all.empty else pd.DataFrame(columns=['date', 'quantity', 'type'])
-        if not df_chart.empty:
-            df_chart['real_qty'] = df_chart.apply(lambda x: x['quantity'] if x['type'] == 'Ingreso' else -x['quantity'], axis=1)
-            df_chart['saldo_acumulado'] = df_chart['real_qty'].cumsum() + saldo_inicial
-            
-            df_daily = df_chart.groupby('date')['saldo_acumulado'].last().reset_index()
-            fecha_inicio = df_daily['date'].min() - timedelta(days=1)
-            row_inicio = pd.DataFrame({'date': [fecha_inicio], 'saldo_acumulado': [saldo_inicial]})
-            df_daily = pd.concat([row_inicio, df_daily]).sort_values('date')
+        if not df_all.empty:
+            # Serie de saldo diario mantenida con el ledger (sumas prefijas), reducida a un máximo de puntos
+            if balance is None: balance = BalanceSeries.from_frame(df_all)
+            fechas, saldos = balance.points(saldo_inicial, BALANCE_CHART_POINTS)
 
             fig = go.Figure()
             # APLICAMOS EL COLOR DEL USUARIO DE FORMA SEGURA
-            fig.add_trace(go.Scatter(x=df_daily['date'], y=df_daily['saldo_acumulado'], fill='tozeroy', mode='lines', line=dict(color=p_color, width=3), name='Saldo'))
+            fig.add_trace(go.Scatter(x=fechas, y=saldos, fill='tozeroy', mode='lines', line=dict(color=p_color, width=3), name='Saldo'))
             fig.update_layout(margin=dict(l=0, r=0, t=10, b=0), yaxis_title="Euros (€)", hovermode="x unified", height=350)
             st.plotly_chart(fig, use_container_width=True)
         else:
@@ -150,7 +146,7 @@ def render_main_dashboard(df_all, user_profile):
         st.info("Configura tu saldo inicial en el Perfil o añade movimientos para ver tu evolución.")
 
 # --- 2. GESTIÓN DE MOVIMIENTOS ---
-def render_dashboard(df_all, current_cats, user_id):
+def render_dashboard(df_all, current_cats, user_id, cube=None):
     p_color = (st.session_state.user.get('profile_color') or '#636EFA') if 'user' in st.session_state and st.session_state.user else '#636EFA'
     # NUEVA LÍNEA PARA EL COLOR DEL ICONO
     i_color = (st.session_state.user.get('icon_color') or '#FFA500') if 'user' in st.session_state and st.session_state.user else '#FFA500'
@@ -188,7 +184,9 @@ def render_dashboard(df_all, current_cats, user_id):
 
     cat_g = [c for c in current_cats if c.get('type') == 'Gasto']
     ml = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
-    locked_movs = get_locked_movements()
+    locked_movs = get_locked_movements(user_id=user_id)
+    # Previsión, Mensual y Anual leen del cubo de agregados (se construye una vez por versión del ledger)
+    if cube is None: cube = MonthlyCube.from_frame(df_all)
 
     # --- A. NUEVA ENTRADA ---
     if selected == "Nueva":
@@ -425,9 +423,7 @@ def render_dashboard(df_all, current_cats, user_id):
             
             saldo_inicial = float(p_data.get('initial_balance', 0) or 0)
             if not df_all.empty:
-                ti = df_all[df_all['type'] == 'Ingreso']['quantity'].sum()
-                tg = df_all[df_all['type'] == 'Gasto']['quantity'].sum()
-                saldo_actual = saldo_inicial + ti - tg
+                saldo_actual = saldo_inicial + cube.total('Ingreso') - cube.total('Gasto')
             else:
                 saldo_actual = saldo_inicial
             
@@ -447,18 +443,14 @@ def render_dashboard(df_all, current_cats, user_id):
         st.write("Compara tus presupuestos con tu media histórica de gastos reales.")
         
         if not df_all.empty:
-            df_gastos = df_all[df_all['type'] == 'Gasto']
-            
-            if not df_gastos.empty:
-                unique_months = df_gastos['date'].dt.to_period('M').nunique()
-                meses_hist = max(1, unique_months)
+            if cube.count('Gasto') > 0:
+                meses_hist = max(1, cube.months_with_data('Gasto'))
                 
-                hist_cat = df_gastos.groupby('category_id')['quantity'].sum().reset_index()
+                hist_cat = cube.category_frame('Gasto')
                 hist_cat['Media_Histórica'] = hist_cat['quantity'] / meses_hist
                 
                 hoy = datetime.now()
-                df_mes_actual = df_gastos[(df_gastos['date'].dt.month == hoy.month) & (df_gastos['date'].dt.year == hoy.year)]
-                act_cat = df_mes_actual.groupby('category_id')['quantity'].sum().reset_index()
+                act_cat = cube.category_frame('Gasto', hoy.year, hoy.month)
                 act_cat.rename(columns={'quantity': 'Gastado_Mes'}, inplace=True)
                 
                 df_prev = pd.DataFrame(cat_g)
@@ -506,9 +498,8 @@ def render_dashboard(df_all, current_cats, user_id):
         h_total_previsto = h_sueldo + (h_extras / h_freq if h_freq > 0 else 0)
 
         if not df_all.empty:
-            df_m = df_all[(df_all['date'].dt.month == month_idx) & (df_all['date'].dt.year == sa)]
-            im_real = df_m[df_m['type'] == 'Ingreso']['quantity'].sum()
-            gm_real = df_m[df_m['type'] == 'Gasto']['quantity'].sum()
+            im_real = cube.total('Ingreso', sa, month_idx)
+            gm_real = cube.total('Gasto', sa, month_idx)
             ahorro_real = im_real - gm_real
             
             c_i, c_g, c_b = st.columns(3)
@@ -526,7 +517,7 @@ def render_dashboard(df_all, current_cats, user_id):
             
             st.divider()
             st.subheader("Progreso por Categoría")
-            gcm = df_m[df_m['type'] == 'Gasto'].groupby('category_id')['quantity'].sum().reset_index()
+            gcm = cube.category_frame('Gasto', sa, month_idx)
             
             for _, r in pd.merge(pd.DataFrame(cat_g), gcm, left_on='id', right_on='category_id', how='left').fillna(0).iterrows():
                 gastado = r['quantity']
@@ -554,9 +545,8 @@ def render_dashboard(df_all, current_cats, user_id):
         san = st.selectbox("Seleccionar Año", range(2024, 2031), index=datetime.now().year-2024, key="año_anual")
         
         if not df_all.empty:
-            df_an = df_all[df_all['date'].dt.year == san]
-            ia = df_an[df_an['type'] == 'Ingreso']['quantity'].sum()
-            ga = df_an[df_an['type'] == 'Gasto']['quantity'].sum()
+            ia = cube.total('Ingreso', san)
+            ga = cube.total('Gasto', san)
             ba = ia - ga
             
             a_i, a_g, a_b = st.columns(3)
@@ -564,11 +554,7 @@ def render_dashboard(df_all, current_cats, user_id):
             a_g.metric(f"Gastos {san}", f"{ga:.2f}€")
             a_b.metric(f"Balance", f"{ba:.2f}€", delta=f"{ba:.2f}€", delta_color="normal" if ba >= 0 else "inverse")
             
-            dfe = df_an.copy()
-            dfe['mes_num'] = dfe['date'].dt.month
-            rm = dfe.pivot_table(index='mes_num', columns='type', values='quantity', aggfunc='sum').fillna(0).reindex(range(1,13), fill_value=0)
-            for t in ['Ingreso', 'Gasto']: 
-                if t not in rm.columns: rm[t] = 0
+            rm = pd.DataFrame({t: cube.monthly_totals(t, san) for t in ['Ingreso', 'Gasto']}, index=range(1, 13))
             rm['Ahorro'] = rm['Ingreso'] - rm['Gasto']
             
             fig = go.Figure()
@@ -581,7 +567,7 @@ def render_dashboard(df_all, current_cats, user_id):
 
             st.divider()
             st.subheader("Progreso Anual por Categoría")
-            gcm_anual = df_an[df_an['type'] == 'Gasto'].groupby('category_id')['quantity'].sum().reset_index()
+            gcm_anual = cube.category_frame('Gasto', san)
             for _, r in pd.merge(pd.DataFrame(cat_g), gcm_anual, left_on='id', right_on='category_id', how='left').fillna(0).iterrows():
                 gastado = r['quantity']
                 presupuesto_anual = r['budget'] * 12
@@ -736,7 +722,7 @@ def render_profile(user_id, p_data):
                 else: st.error("Las contraseñas no coinciden o son muy cortas.")
 
 # --- 5. IMPORTAR INTELIGENTE ---
-def render_import(current_cats, user_id):
+def render_import(current_cats, user_id, ledger=None):
     render_header("cloud-upload", "Importación Inteligente")
     st.caption("Sube el Excel de tu banco. La app adivinará las categorías, y tú solo tendrás que revisar y guardar.")
     
@@ -749,9 +735,8 @@ def render_import(current_cats, user_id):
     
     if up:
         try:
-            # 1. Leer el archivo
-            df_raw = pd.read_csv(up, sep=None, engine='python') if up.name.endswith('.csv') else pd.read_excel(up)
-            cols = df_raw.columns.tolist()
+            # 1. Leer solo la cabecera (el archivo entero se lee por bloques al analizar)
+            cols = read_columns(up)
             
             # 2. Mapeo de columnas (Intento de autodetectar)
             def find_col(keywords): 
@@ -766,74 +751,26 @@ def render_import(current_cats, user_id):
             c3, c4 = st.columns(2)
             sel_note = c3.selectbox("Columna Concepto", cols, index=find_col(['concepto', 'descrip', 'detalles']))
             
-            opciones_tipo = ["-- Autodetectar por signo (-/+) --"] + cols
+            opciones_tipo = [AUTO_TIPO] + cols
             sel_tipo = c4.selectbox("Columna Tipo (Opcional)", opciones_tipo)
             
             # RECUPERADO: Selector de Categoría (Opcional)
-            opciones_cat = ["-- Autodetectar por concepto (Oráculo) --"] + cols
+            opciones_cat = [AUTO_CATEGORIA] + cols
             sel_cat = st.selectbox("Columna Categoría (Opcional)", opciones_cat)
             
             if st.button("🪄 Analizar y Clasificar", type="primary"):
-                df_to_edit = pd.DataFrame()
                 nombres_categorias = [c['name'] for c in current_cats]
-                nombres_categorias.insert(0, "⚠️ Sin clasificar")
+                nombres_categorias.insert(0, SIN_CLASIFICAR)
                 
-                # REGLAS INTELIGENTES (El "Oráculo")
-                # ⚠️ ATENCIÓN: Cambia "Alimentación" o "Gasolina" por los nombres EXACTOS de tus categorías
-                oraculo = {
-                    "mercadona": "Alimentación", "carrefour": "Alimentación", "lidl": "Alimentación",
-                    "repsol": "Gasolina", "cepsa": "Gasolina", "netflix": "Suscripciones",
-                    "spotify": "Suscripciones", "amazon": "Compras", "zara": "Ropa",
-                    "restaurante": "Ocio", "bizum": "Varios"
-                }
-
-                filas_procesadas = []
-                for _, r in df_raw.iterrows():
-                    try:
-                        # 1. Limpiar cantidad
-                        raw_qty = str(r[sel_qty]).replace('€','').replace(',','.').strip()
-                        qty_float = float(raw_qty)
-                        
-                        # 2. Lógica Híbrida de Tipo
-                        if sel_tipo != "-- Autodetectar por signo (-/+) --":
-                            val_tipo = str(r[sel_tipo]).upper()
-                            tipo = "Ingreso" if "ING" in val_tipo else "Gasto"
-                        else:
-                            tipo = "Gasto" if qty_float < 0 else "Ingreso"
-                            
-                        cantidad_final = abs(qty_float)
-                        concepto_str = str(r[sel_note]) if pd.notna(r[sel_note]) else ""
-                        
-                        # 3. LÓGICA HÍBRIDA DE CATEGORÍA
-                        categoria_asignada = "⚠️ Sin clasificar"
-                        
-                        # A) Si has seleccionado una columna del Excel que trae la categoría
-                        if sel_cat != "-- Autodetectar por concepto (Oráculo) --":
-                            cat_excel = str(r[sel_cat]).strip().lower()
-                            # Buscar coincidencia exacta (ignorando mayúsculas) con tus categorías de la app
-                            for nc in nombres_categorias:
-                                if nc.lower() == cat_excel:
-                                    categoria_asignada = nc
-                                    break
-                                    
-                        # B) Si no hay match con el Excel o elegiste autodetectar, actúa el Oráculo
-                        if categoria_asignada == "⚠️ Sin clasificar":
-                            concepto_lower = concepto_str.lower()
-                            for palabra, cat_name in oraculo.items():
-                                if palabra in concepto_lower and cat_name in nombres_categorias:
-                                    categoria_asignada = cat_name
-                                    break
-                                    
-                        filas_procesadas.append({
-                            "Fecha": pd.to_datetime(r[sel_date]).date(),
-                            "Concepto": concepto_str,
-                            "Tipo": tipo,
-                            "Cantidad": cantidad_final,
-                            "Categoría": categoria_asignada
-                        })
-                    except: continue 
+                with st.status("Analizando archivo...", expanded=False) as status:
+                    def progreso(leidas, validas):
+                        status.update(label=f"Analizando archivo... {leidas} filas leídas ({validas} válidas)")
+                    # Reglas por defecto + las aprendidas de tus movimientos ya categorizados
+                    oraculo = Classifier.for_user(current_cats, ledger)
+                    df_parsed = parse_file(up, oraculo, sel_qty, sel_date, sel_note, sel_tipo, sel_cat,
+                                           on_progress=progreso)
                 
-                st.session_state['df_import'] = pd.DataFrame(filas_procesadas)
+                st.session_state['df_import'] = df_parsed
                 st.session_state['cat_options'] = nombres_categorias
                 st.rerun()
                 
@@ -862,7 +799,7 @@ def render_import(current_cats, user_id):
             use_container_width=True
         )
         
-        pendientes = len(edited_df[edited_df['Categoría'] == "⚠️ Sin clasificar"])
+        pendientes = len(edited_df[edited_df['Categoría'] == SIN_CLASIFICAR])
         if pendientes > 0:
             st.warning(f"Tienes {pendientes} movimientos sin clasificar. Asígnales una categoría.")
             
@@ -870,54 +807,56 @@ def render_import(current_cats, user_id):
       
         with c_guardar:
             if st.button("💾 Guardar en Base de Datos", type="primary", disabled=(pendientes > 0), use_container_width=True):
-                from database import save_bulk_inputs # Importamos la nueva función súper rápida
+                from database import insert_inputs_in_chunks # Subida por bloques en paralelo
                 
                 cat_lookup = {c['name']: c['id'] for c in current_cats}
-                valid_rows = []
-                log_details = []
                 
                 # Barra de estado visual de Streamlit
                 with st.status("Procesando importación masiva...", expanded=True) as status:
                     st.write("Preparando datos...")
                     
-                    # 1. Preparamos el paquete
-                    for idx, r in edited_df.iterrows():
-                        try:
-                            # Nos aseguramos de que la fecha esté en formato YYYY-MM-DD
-                            fecha_str = str(r["Fecha"])[:10] 
-                            
-                            valid_rows.append({
-                                "user_id": user_id, 
-                                "quantity": float(r["Cantidad"]),
-                                "type": str(r["Tipo"]),
-                                "category_id": cat_lookup[r["Categoría"]],
-                                "date": fecha_str,
-                                "notes": str(r["Concepto"])
-                            })
-                            log_details.append(f"✅ Fila {idx+1}: {r['Concepto'][:20]}... ({r['Cantidad']}€) - OK")
-                        except Exception as e:
-                            log_details.append(f"❌ Fila {idx+1}: Error al preparar - {str(e)}")
+                    # 1. Preparamos el paquete (vectorizado)
+                    valid_rows, errores = build_rows(edited_df, user_id, cat_lookup)
+                    log_details = [f"❌ Fila {n}: Error al preparar - {motivo}" for n, motivo in errores]
                     
-                    st.write(f"Enviando {len(valid_rows)} registros a Supabase en bloque...")
+                    st.write(f"Enviando {len(valid_rows)} registros a Supabase en bloques paralelos...")
+                    barra = st.progress(0.0)
                     
-                    # 2. Enviamos el paquete gigante de golpe
+                    # 2. Enviamos los bloques en paralelo (pool acotado, con reintentos)
                     if valid_rows:
+                        def bloque_terminado(res, hechos, total):
+                            barra.progress(hechos / total, text=f"Bloque {hechos}/{total}")
+                            if res['ok']:
+                                log_details.append(f"✅ Bloque {res['chunk'] + 1}: {res['rows']} filas en {res['seconds']:.2f}s ({res['attempts']} intento/s)")
+                            else:
+                                log_details.append(f"❌ Bloque {res['chunk'] + 1}: {res['rows']} filas rechazadas tras {res['attempts']} intentos - {res['error']}")
+                        
                         try:
-                            total_saved = save_bulk_inputs(valid_rows)
-                            status.update(label=f"¡Importación completada! ({total_saved} registros)", state="complete", expanded=False)
-                            st.success(f"🚀 ¡BRUTAL! Se han guardado {total_saved} movimientos en un instante.")
+                            resultados = insert_inputs_in_chunks(valid_rows, on_chunk=bloque_terminado)
+                            total_saved = sum(r['rows'] for r in resultados if r['ok'])
+                            fallidos = [r for r in resultados if not r['ok']]
+                            if fallidos:
+                                status.update(label=f"Importación parcial ({total_saved} de {len(valid_rows)} registros)", state="error", expanded=True)
+                                st.error(f"🛑 Supabase rechazó {len(fallidos)} bloque(s). Revisa el registro para ver cuáles.")
+                            else:
+                                status.update(label=f"¡Importación completada! ({total_saved} registros)", state="complete", expanded=False)
+                                st.success(f"🚀 ¡BRUTAL! Se han guardado {total_saved} movimientos en un instante.")
                             
                             # 3. Mostramos el LOG en un desplegable
                             with st.expander("📋 Ver registro detallado (Log de procesamiento)"):
                                 # Mostramos solo los primeros 100 y los últimos para no saturar la pantalla si son miles
                                 if len(log_details) > 100:
                                     st.text("\n".join(log_details[:50]))
-                                    st.text(f"\n... [{len(log_details) - 100} filas omitidas para rendimiento] ...\n")
+                                    st.text(f"\n... [{len(log_details) - 100} líneas omitidas para rendimiento] ...\n")
                                     st.text("\n".join(log_details[-50:]))
                                 else:
                                     st.text("\n".join(log_details))
                                     
-                            del st.session_state['df_import'] # Limpiamos la tabla
+                            if fallidos:
+                                # Dejamos en la tabla solo lo que no entró, para poder reintentarlo sin duplicar
+                                st.session_state['df_import'] = failed_chunk_rows(edited_df, cat_lookup, resultados)
+                            else:
+                                del st.session_state['df_import'] # Limpiamos la tabla
                             # Quitamos el rerun automático para que te dé tiempo a leer el Log.
                             if st.button("🔄 Refrescar y ver en Historial", type="primary"):
                                 st.rerun()
@@ -932,3 +871,8 @@ def render_import(current_cats, user_id):
             if st.button("Cancelar Importación", use_container_width=True):
                 del st.session_state['df_import']
                 st.rerun()
+
+
+# Tiempo de cada pantalla en el panel de rendimiento (metrics)
+metrics.instrument_module(globals(), 'view', names=['render_main_dashboard', 'render_dashboard', 'render_categories',
+                                                    'render_profile', 'render_import'])
@@ -0,0 +1,92 @@
+# views_admin.py
+# Panel de rendimiento oculto: solo se muestra a los administradores (ADMIN_EMAILS o [admin] emails en
+# secrets.toml) y cuando la URL lleva ?perf=1. Enseña la cascada del último rerun, los agregados por
+# función de la sesión y del proceso, el pool HTTP y la caché, y permite descargar las métricas para Prometheus.
+import os
+import streamlit as st
+import pandas as pd
+import plotly.graph_objects as go
+import cache
+import http_pool
+import metrics
+from database_groups import reconcile_net_positions
+
+KIND_COLORS = {'db': '#636EFA', 'view': '#FFA500', 'settlement': '#00CC96'}
+
+def admin_emails():
+    emails = os.environ.get('ADMIN_EMAILS')
+    if emails is None:
+        try:
+            emails = st.secrets.get('admin', {}).get('emails', '')
+        except Exception: # Sin secrets.toml
+            emails = ''
+    if isinstance(emails, str):
+        emails = emails.split(',')
+    return {e.strip().lower() for e in emails if e.strip()}
+
+def show_metrics_panel(user_email):
+    """True si hay que pintar el panel en este rerun"""
+    return "perf" in st.query_params and bool(user_email) and user_email.lower() in admin_emails()
+
+def _waterfall(events):
+    """Barras horizontales: cada llamada empieza donde empezó dentro del rerun y dura lo que tardó"""
+    labels = [f"{i + 1:>3}. {'· ' * e['depth']}{e['name']}" for i, e in enumerate(events)]
+    fig = go.Figure(go.Bar(
+        y=labels, x=[e['duration_ms'] for e in events], base=[e['start_ms'] for e in events], orientation='h',
+        marker_color=[KIND_COLORS.get(e['kind'], '#888') for e in events],
+        customdata=[[e['rows'] if e['rows'] is not None else '—', e['requests'], e['bytes'] / 1024, e['thread']] for e in events],
+        hovertemplate="%{y}<br>%{x:.1f} ms · %{customdata[0]} filas · %{customdata[1]} peticiones · "
+                      "%{customdata[2]:.1f} KB<br>hilo %{customdata[3]}<extra></extra>",
+    ))
+    fig.update_layout(height=max(200, 22 * len(events) + 60), margin=dict(l=0, r=0, t=10, b=0), xaxis_title="ms",
+                      yaxis=dict(autorange='reversed'), paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+    return fig
+
+def _functions_table(rows):
+    if not rows:
+        st.caption("Sin llamadas registradas todavía.")
+        return
+    df = pd.DataFrame(rows)
+    df['KB'] = df.pop('bytes') / 1024
+    st.dataframe(df, hide_index=True, use_container_width=True,
+                 column_config={c: st.column_config.NumberColumn(format="%.1f") for c in ['total_ms', 'avg_ms', 'max_ms', 'KB']})
+
+def render_metrics_panel():
+    st.divider()
+    st.subheader("🛠️ Rendimiento")
+    report = metrics.session_report()
+    events = report['last_rerun']
+
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Último rerun", f"{report['last_rerun_ms']:.0f} ms" if report['last_rerun_ms'] is not None else "—")
+    c2.metric("Llamadas", len(events))
+    c3.metric("Peticiones", sum(e['requests'] for e in events if e['depth'] == 0))
+    c4.metric("Recibido", f"{sum(e['bytes'] for e in events if e['depth'] == 0) / 1024:.1f} KB")
+
+    tab_rerun, tab_sesion, tab_proceso, tab_infra = st.tabs(["Cascada", "Sesión", "Proceso", "Pool y caché"])
+    with tab_rerun:
+        if events:
+            st.plotly_chart(_waterfall(events), use_container_width=True, config={'displayModeBar': False})
+            st.caption(f"Rerun nº {report['reruns']} de la sesión. Los puntos marcan llamadas anidadas (ya incluidas en la de arriba).")
+        else:
+            st.caption("La cascada aparece a partir del segundo rerun (el primero aún no ha terminado).")
+    with tab_sesion:
+        _functions_table(report['functions'])
+    with tab_proceso:
+        process = metrics.process_report()
+        st.caption(f"{process['sessions']} sesiones con traza en este proceso")
+        _functions_table(process['functions'])
+        st.download_button("Descargar métricas (Prometheus)", metrics.prometheus_text(), file_name="metrics.txt",
+                           mime="text/plain", use_container_width=True)
+    with tab_infra:
+        st.write("**Pool HTTP**")
+        st.json(http_pool.pool_stats(), expanded=False)
+        st.write("**Caché**")
+        st.json(cache.stats(), expanded=False)
+        if st.button("Conciliar posiciones netas de grupos", use_container_width=True):
+            descuadres = reconcile_net_positions()
+            if descuadres:
+                st.warning(f"{len(descuadres)} posiciones no cuadraban con el recálculo (ya corregidas)")
+                st.dataframe(pd.DataFrame(descuadres), hide_index=True, use_container_width=True)
+            else:
+                st.success("Todas las posiciones en caché cuadran con el recálculo completo")
@@ -1,5 +1,6 @@
 # views_groups.py
 import streamlit as st
+import math
 import time
 import plotly.graph_objects as go
 from streamlit_option_menu import option_menu
@@ -8,10 +9,12 @@ from database_groups import (
     get_my_invitations, send_invitation, respond_invitation,
     get_group_members, get_group_info, get_group_expenses, remove_group_member, 
     update_group_setting, update_group_details,
-    request_leave_group, resolve_leave_request,
+    request_leave_group, resolve_leave_request, resolve_leave_requests,
     check_pending_confirmations, get_settlement_requests, request_settlement,
-    add_external_member, settle_external_debt_admin, settle_debt_to_external, add_shared_expense 
+    add_external_member, settle_external_debt_admin, settle_debt_to_external, add_shared_expense,
+    load_group_snapshot
 )
+import metrics
 
 BOOTSTRAP_ICONS_LINK = '<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.5/font/bootstrap-icons.css">'
 
@@ -146,13 +149,15 @@ def avisar_pago_dialog(group_id, debtor_id, creditor_id, creditor_name, amount):
             else:
                 st.error("Error al enviar el aviso al grupo.")
 
-def render_single_group(group_id, group_name, user_id):
+def render_single_group(group_id, group_name, user_id, current_cats=None):
     st.button(":material/arrow_back: Volver a mis grupos", on_click=cerrar_grupo_callback)
 
-    group_info = get_group_info(group_id)
-    if not group_info:
+    # Una sola consulta para todas las pestañas (en caché mientras nadie toque el grupo)
+    snap = load_group_snapshot(group_id, user_id)
+    if not snap:
         st.error("Error al cargar la información del grupo.")
         return
+    group_info = snap.info
 
     admin_id = group_info['created_by']
     es_admin = admin_id == user_id
@@ -166,12 +171,11 @@ def render_single_group(group_id, group_name, user_id):
         st.caption("👑 Eres el administrador de este grupo")
     st.divider()
 
-    miembros = get_group_members(group_id)
-    pendientes = [m for m in miembros if m.get('leave_status') == 'pending']
-    notificaciones_cobro = check_pending_confirmations(user_id)
+    miembros = snap.members
+    pendientes = snap.pending_leave
     
     label_ajustes = "Ajustes 🔴" if (es_admin and pendientes) else "Ajustes"
-    label_resumen = "Resumen 🔴" if group_id in notificaciones_cobro else "Resumen"
+    label_resumen = "Resumen 🔴" if snap.has_pending_confirmation(user_id) else "Resumen"
 
     p_color = (st.session_state.user.get('profile_color') or '#636EFA') if 'user' in st.session_state and st.session_state.user else '#636EFA'
     i_color = (st.session_state.user.get('icon_color') or '#FFA500') if 'user' in st.session_state and st.session_state.user else '#FFA500'
@@ -215,11 +219,11 @@ def render_single_group(group_id, group_name, user_id):
 
     if selected_tab == label_resumen:
         render_subheader("analytics", "Resumen y Liquidación")
-        from database_groups import get_pending_balances, calculate_settlements, get_group_expenses
+        from database_groups import calculate_settlements
         
-        balances = get_pending_balances(group_id)
-        gastos_totales = get_group_expenses(group_id)
-        peticiones_activas = get_settlement_requests(group_id)
+        balances = snap.balances
+        gastos_totales = snap.expenses
+        peticiones_activas = snap.settlement_requests
         
         if not gastos_totales:
             st.info("Añade gastos para ver las estadísticas del grupo.")
@@ -335,7 +339,7 @@ def render_single_group(group_id, group_name, user_id):
 
     elif selected_tab == "Gastos":
         render_subheader("receipt", "Historial de Gastos")
-        from database_groups import get_group_expenses, delete_group_expense, get_locked_movements
+        from database_groups import delete_group_expense
         from components import editar_movimiento_dialog
         
         with st.expander("➕ Añadir Gasto", expanded=False):
@@ -398,13 +402,33 @@ def render_single_group(group_id, group_name, user_id):
                              
         st.divider()
 
-        gastos = get_group_expenses(group_id)
-        locked_movs = get_locked_movements()
+        gastos = snap.expenses
+        locked_movs = snap.locked_movements
         
         if not gastos:
             st.info("Aún no hay gastos registrados en este grupo.")
         else:
-            for g in gastos:
+            # Categorías para el diálogo de edición: una vez por render, no una por gasto
+            if current_cats is None:
+                from database import get_categories
+                current_cats = get_categories(user_id)
+
+            # Paginación como en el Historial: solo se pintan los gastos de la página actual
+            total_items = len(gastos)
+            col_pag1, col_pag2, col_pag3 = st.columns([1, 1, 2])
+            rows_per_page = col_pag1.selectbox("Registros:", [10, 25, 50, 100], index=0, key="g_rows")
+            total_pages = math.ceil(total_items / rows_per_page)
+            # Una página por grupo y tamaño (al cambiar vuelve a la 1); si ahora hay menos páginas, a la última
+            page_key = f"g_page_{group_id}_{rows_per_page}"
+            if st.session_state.get(page_key, 1) > total_pages:
+                st.session_state[page_key] = total_pages
+            current_page = col_pag2.number_input(f"Pág (de {total_pages})", 1, total_pages, key=page_key)
+            
+            start_idx = (current_page - 1) * rows_per_page
+            end_idx = min(start_idx + rows_per_page, total_items)
+            col_pag3.markdown(f"<br>Viendo **{start_idx + 1}-{end_idx}** de **{total_items}**", unsafe_allow_html=True)
+            
+            for g in gastos[start_idx:end_idx]:
                 is_locked = g['movement_id'] in locked_movs
                 
                 with st.container(border=True):
@@ -425,14 +449,12 @@ def render_single_group(group_id, group_name, user_id):
                         if es_admin or g['paid_by'] == user_id:
                             btn_edit, btn_del = st.columns(2)
                             with btn_edit:
-                                from database import get_categories
-                                cats_para_editar = get_categories(user_id)
                                 mov_compatible = {
                                     "id": g['movement_id'], "user_id": g['paid_by'], "quantity": g['total_amount'], "type": "Gasto",
                                     "category_id": g.get('category_id'), "date": g['date'], "notes": g['description'], "group_id": g['group_id']
                                 }
                                 if st.button(":material/edit:", key=f"ed_g_{g['id']}", disabled=is_locked, help="No se puede editar si hay pagos saldados"):
-                                    editar_movimiento_dialog(mov_compatible, cats_para_editar)
+                                    editar_movimiento_dialog(mov_compatible, current_cats)
                             with btn_del:
                                 if st.button(":material/delete:", key=f"dl_g_{g['id']}", type="primary"):
                                     if delete_group_expense(g['id'], g.get('movement_id')): 
@@ -544,6 +566,14 @@ def render_single_group(group_id, group_name, user_id):
                 if pendientes:
                     st.divider()
                     st.error("**⚠️ Solicitudes pendientes para abandonar el grupo**")
+                    if len(pendientes) > 1:
+                        c_all_yes, c_all_no = st.columns(2)
+                        if c_all_yes.button(f"Aprobar todas ({len(pendientes)})", key="app_all", use_container_width=True):
+                            resolve_leave_requests(group_id, [p['user_id'] for p in pendientes], True)
+                            st.rerun()
+                        if c_all_no.button("Rechazar todas", key="rej_all", use_container_width=True):
+                            resolve_leave_requests(group_id, [p['user_id'] for p in pendientes], False)
+                            st.rerun()
                     for p in pendientes:
                         p_prof = p.get('profiles', {})
                         if isinstance(p_prof, list) and len(p_prof) > 0: p_prof = p_prof[0]
@@ -577,12 +607,12 @@ def render_single_group(group_id, group_name, user_id):
                             st.rerun()
 
 # --- FUNCIÓN PRINCIPAL ENRUTADORA ---
-def render_groups(user_id, user_email):
+def render_groups(user_id, user_email, current_cats=None):
     current_group_id = st.session_state.get('current_group_id')
     current_group_name = st.session_state.get('current_group_name', 'Grupo')
 
     if current_group_id:
-        render_single_group(current_group_id, current_group_name, user_id)
+        render_single_group(current_group_id, current_group_name, user_id, current_cats)
         return
 
     render_header("people", "Grupos Compartidos")
@@ -683,3 +713,7 @@ def render_groups(user_id, user_email):
                     if cr.button(":material/close: Rechazar", key=f"rej_{inv['id']}", use_container_width=True):
                         if respond_invitation(inv['id'], inv['group_id'], user_id, False):
                             st.rerun()
+
+
+# Tiempo de cada pantalla en el panel de rendimiento (metrics)
+metrics.instrument_module(globals(), 'view', names=['render_groups', 'render_single_group'])